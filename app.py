@@ -23,14 +23,21 @@ except ImportError as e:
     print(f"Error importing VideoGenerator: {e}")
     # Fallback to a simpler implementation if needed
     class VideoGenerator:
-        def __init__(self, input_video_path):
+        def __init__(self, input_video_path, **kwargs):
             self.input_video_path = input_video_path
             
         def generate_scrambled_videos(self, **kwargs):
             # Simplified implementation for testing
             return []
 
-from src.utils import get_video_duration
+from src.utils import get_video_durations
+try:
+    from src.video_analysis import VideoContentAnalyzer
+    from src.probe import get_probe_cache
+except ImportError as e:
+    print(f"Error importing VideoContentAnalyzer: {e}")
+    VideoContentAnalyzer = None
+from src.profiles import RENDER_PROFILES, DEFAULT_PROFILE
 
 # Set page config with updated theme
 st.set_page_config(
@@ -223,6 +230,46 @@ class ErrorLogger:
 # Create a global error logger
 error_logger = ErrorLogger()
 
+
+def skip_duplicate_uploads(video_paths):
+    """
+    Drop uploads that are copies (re-uploads, re-encodes) of an earlier upload.
+    
+    Detection decodes every upload, so it only runs when generation starts,
+    and its result is kept in the session for as long as the uploads' content
+    stays the same. Uploads are saved to a new temporary folder on every
+    rerun, so the result is stored by upload position rather than path.
+    """
+    if VideoContentAnalyzer is None:
+        return video_paths
+    fingerprints = tuple(get_probe_cache().fingerprint(path) for path in video_paths)
+    cached = st.session_state.get("duplicate_uploads")
+    if cached is None or cached[0] != fingerprints:
+        duplicates = VideoContentAnalyzer().find_duplicate_sources(video_paths)
+        positions = {video_paths.index(duplicate): video_paths.index(original)
+                     for duplicate, original in duplicates.items()}
+        cached = (fingerprints, positions)
+        st.session_state["duplicate_uploads"] = cached
+    for duplicate, original in cached[1].items():
+        st.info(f"Skipping {os.path.basename(video_paths[duplicate])}: "
+                f"same footage as {os.path.basename(video_paths[original])}")
+    return [path for i, path in enumerate(video_paths) if i not in cached[1]]
+
+# Render quality profile
+with st.sidebar:
+    render_profile = st.selectbox(
+        "Render Quality",
+        list(RENDER_PROFILES),
+        index=list(RENDER_PROFILES).index(DEFAULT_PROFILE),
+        help="Draft renders small, low-quality previews quickly; final is slower but sharper"
+    )
+    use_proxies = st.checkbox(
+        "Use proxies",
+        value=False,
+        help="Convert each upload once to a normalized proxy and generate from it; "
+             "the first run is slower, repeat runs on the same videos are faster"
+    )
+
 # File uploader for multiple videos
 uploaded_files = st.file_uploader(
     "Choose video files", 
@@ -256,7 +303,7 @@ if uploaded_files:
                 f.write(uploaded_audio.getbuffer())
         
         # Get the shortest video duration for the slider
-        durations = [get_video_duration(path) for path in video_paths]
+        durations = get_video_durations(video_paths)
         min_duration = min(durations)
         
         # Create two columns for controls
@@ -363,8 +410,11 @@ if uploaded_files:
                     output_dir = os.path.join(temp_dir, "output")
                     os.makedirs(output_dir, exist_ok=True)
                     
+                    # Skip uploads that are copies of another upload
+                    video_paths = skip_duplicate_uploads(video_paths)
+                    
                     # Generate scrambled videos using all uploaded videos
-                    generator = VideoGenerator(video_paths[0])  # Use first video as base
+                    generator = VideoGenerator(video_paths[0], use_mezzanine=use_proxies)  # Use first video as base
                     
                     # Prepare text overlay parameters if enabled
                     text_params = None
@@ -385,9 +435,13 @@ if uploaded_files:
                         output_dir=output_dir,
                         additional_videos=video_paths[1:],  # Pass all other videos as additional
                         audio_path=audio_path,  # Pass the audio file path
-                        text_overlay=text_params  # Pass text overlay parameters
+                        text_overlay=text_params,  # Pass text overlay parameters
+                        profile=render_profile
                     )
                     
+                    for warning in getattr(generator, "last_warnings", []):
+                        st.warning(warning)
+                    
                     if output_paths:
                         st.success(f"Successfully generated {len(output_paths)} videos!")
                         
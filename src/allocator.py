@@ -0,0 +1,270 @@
+"""
+Free-space segment allocator for picking non-overlapping clips from a source.
+
+Each SegmentAllocator tracks the unused time ranges ("slots") of one source
+video. For a requested segment length d, a slot of length L can host a start
+anywhere in the first L - d seconds, so sampling a start uniformly from all
+remaining free time is a weighted pick over slots followed by a uniform
+offset inside the chosen slot. Slot weights live in a Fenwick tree, which
+makes each pick and each update O(log n) in the number of slots.
+"""
+
+import random
+
+# Slots shorter than this are treated as fully used
+EPSILON = 1e-6
+
+# Draws that may land in slots without a keyframe before keyframes_only gives up
+MAX_KEYFRAME_MISSES = 16
+
+
+class SegmentAllocator:
+    """
+    Tracks free time in a single source and hands out non-overlapping segments.
+    """
+
+    def __init__(self, source_duration, used_segments=None):
+        """
+        Initialize the allocator.
+
+        Args:
+            source_duration: Duration of the source video in seconds
+            used_segments: Optional list of (start_time, end_time) tuples that
+                are already taken
+        """
+        self.source_duration = float(source_duration)
+        self._slots = [[0.0, self.source_duration]]
+        self._tree = None
+        self._tree_duration = None
+        for start, end in used_segments or []:
+            self.reserve(start, end)
+
+    @classmethod
+    def from_used_segments(cls, video_path, source_duration, used_segments):
+        """
+        Build an allocator from a (video_path, start_time, end_time) usage list.
+
+        Args:
+            video_path: Source the allocator is for
+            source_duration: Duration of the source in seconds
+            used_segments: List of (video_path, start_time, end_time) tuples,
+                possibly covering several sources
+
+        Returns:
+            SegmentAllocator with this source's segments reserved
+        """
+        used = [(s[1], s[2]) for s in used_segments or [] if s[0] == video_path]
+        return cls(source_duration, used)
+
+    # Fenwick tree over slot weights -------------------------------------------------
+
+    def _weight(self, index, duration):
+        start, end = self._slots[index]
+        return max(0.0, end - start - duration)
+
+    def _rebuild(self, duration):
+        """Drop dead slots and rebuild the tree for a new segment length."""
+        self._slots = [slot for slot in self._slots if slot[1] - slot[0] > EPSILON]
+        n = len(self._slots)
+        tree = [0.0] * (n + 1)
+        for i in range(n):
+            tree[i + 1] += self._weight(i, duration)
+            parent = (i + 1) + ((i + 1) & -(i + 1))
+            if parent <= n:
+                tree[parent] += tree[i + 1]
+        self._tree = tree
+        self._tree_duration = duration
+
+    def _ensure_tree(self, duration):
+        if self._tree is None or self._tree_duration != duration:
+            self._rebuild(duration)
+
+    def _prefix(self, count):
+        """Sum of the first `count` slot weights."""
+        total = 0.0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    def _add(self, index, delta):
+        position = index + 1
+        n = len(self._tree) - 1
+        while position <= n:
+            self._tree[position] += delta
+            position += position & -position
+
+    def _append_slot(self, start, end):
+        """Append a slot and extend the tree in O(log n)."""
+        self._slots.append([start, end])
+        position = len(self._slots)
+        # A Fenwick node covers (position - lowbit, position]; the new node
+        # holds its own weight plus the already-known part of that range.
+        covered = self._prefix(position - 1) - self._prefix(position - (position & -position))
+        self._tree.append(self._weight(position - 1, self._tree_duration) + covered)
+
+    def _find(self, target):
+        """Return the slot index whose cumulative weight range contains target."""
+        n = len(self._tree) - 1
+        position = 0
+        step = 1 << n.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= n and self._tree[nxt] <= target:
+                position = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return min(position, n - 1), target
+
+    # Public API ---------------------------------------------------------------------
+
+    @property
+    def remaining(self):
+        """Total free time left in the source, in seconds."""
+        return sum(end - start for start, end in self._slots if end > start)
+
+    def used_ranges(self):
+        """Return the (start_time, end_time) ranges no longer free, in order."""
+        used = []
+        cursor = 0.0
+        for start, end in sorted(slot for slot in self._slots if slot[1] - slot[0] > EPSILON):
+            if start - cursor > EPSILON:
+                used.append((cursor, start))
+            cursor = end
+        if self.source_duration - cursor > EPSILON:
+            used.append((cursor, self.source_duration))
+        return used
+
+    def free_ranges(self, duration=0.0):
+        """Return the free (start_time, end_time) ranges a segment of the given length fits in."""
+        return sorted((start, end) for start, end in self._slots
+                      if end - start - duration > -EPSILON)
+
+    def free_start_time(self, duration):
+        """
+        Measure of valid start times for a segment of the given length.
+
+        Zero means no segment of that length fits anywhere without overlap.
+        """
+        self._ensure_tree(duration)
+        return self._prefix(len(self._slots))
+
+    def is_exhausted(self, duration):
+        """Return True if no segment of the given length fits any more."""
+        return self.free_start_time(duration) <= EPSILON
+
+    def reserve(self, start, end):
+        """
+        Mark a time range as used.
+
+        Args:
+            start: Start time of the used range
+            end: End time of the used range
+        """
+        start, end = max(0.0, start), min(self.source_duration, end)
+        if end <= start:
+            return
+        updated = []
+        for slot_start, slot_end in self._slots:
+            if end <= slot_start or start >= slot_end:
+                updated.append([slot_start, slot_end])
+                continue
+            if start > slot_start:
+                updated.append([slot_start, start])
+            if end < slot_end:
+                updated.append([end, slot_end])
+        self._slots = updated
+        self._tree = None
+
+    def split_at(self, boundaries):
+        """
+        Split free ranges at the given times without using any time.
+
+        Segments never span a split, so splitting at shot boundaries keeps
+        every allocated segment inside a single shot.
+
+        Args:
+            boundaries: Iterable of times in seconds
+        """
+        boundaries = sorted(boundaries)
+        if not boundaries:
+            return
+        updated = []
+        for slot_start, slot_end in self._slots:
+            for boundary in boundaries:
+                if slot_start + EPSILON < boundary < slot_end - EPSILON:
+                    updated.append([slot_start, boundary])
+                    slot_start = boundary
+            updated.append([slot_start, slot_end])
+        self._slots = updated
+        self._tree = None
+
+    def allocate(self, duration, count=1, rng=None, keyframes=None, keyframes_only=False):
+        """
+        Allocate up to `count` non-overlapping segments of the given length.
+
+        Starts are drawn uniformly from all remaining valid start times, and
+        every allocated segment is reserved before the next one is drawn.
+
+        Args:
+            duration: Length of each segment in seconds
+            count: Number of segments wanted
+            rng: Optional random.Random instance (defaults to the global one)
+            keyframes: Optional KeyframeIndex; when given, each drawn start is
+                snapped onto a keyframe inside the same free range, so the
+                segment can be reached without decoding from an earlier GOP
+            keyframes_only: Only hand out segments that start on a keyframe
+                (as stream copy needs); draws landing in a free range
+                without one are retried, and the source counts as exhausted
+                after MAX_KEYFRAME_MISSES such draws
+
+        Returns:
+            List of (start_time, end_time) tuples. Fewer than `count` entries
+            are returned when the source is exhausted.
+        """
+        rng = rng or random
+        self._ensure_tree(duration)
+        segments = []
+        misses = 0
+        while len(segments) < count:
+            total = self._prefix(len(self._slots))
+            if total <= EPSILON:
+                break
+            index, offset = self._find(rng.random() * total)
+            weight = self._weight(index, duration)
+            if weight <= 0.0:
+                # Accumulated float error pointed at a full slot; rebuild and retry once
+                self._rebuild(duration)
+                total = self._prefix(len(self._slots))
+                if total <= EPSILON:
+                    break
+                index, offset = self._find(rng.random() * total)
+                weight = self._weight(index, duration)
+            slot_start, slot_end = self._slots[index]
+            start = slot_start + min(max(offset, 0.0), weight)
+            if keyframes is not None:
+                start = keyframes.snap_start(start, slot_start, slot_start + weight)
+                if keyframes_only and abs(keyframes.previous_keyframe(start) - start) > EPSILON:
+                    misses += 1
+                    if misses >= MAX_KEYFRAME_MISSES:
+                        break
+                    continue
+            end = start + duration
+
+            # Split the slot: keep the left remainder in place, append the right one
+            self._slots[index] = [slot_start, start]
+            self._add(index, self._weight(index, duration) - weight)
+            if slot_end - end > EPSILON:
+                self._append_slot(end, slot_end)
+            segments.append((start, end))
+        return segments
+
+    def allocate_one(self, duration, rng=None, keyframes=None, keyframes_only=False):
+        """
+        Allocate a single segment.
+
+        Returns:
+            (start_time, end_time) tuple, or None if the source is exhausted
+        """
+        segments = self.allocate(duration, 1, rng, keyframes, keyframes_only)
+        return segments[0] if segments else None
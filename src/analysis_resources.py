@@ -0,0 +1,172 @@
+"""
+Resource budget for content analysis.
+
+A long-running server process keeps one analyzer alive across many requests,
+so anything the analyzer holds on to - ffmpeg decoder processes, decoded
+frames, per-source features and timelines - has to be bounded explicitly
+rather than left to the garbage collector. AnalysisResources caps the number
+of decoder processes open at once and the bytes of frame data kept in memory,
+and counts what was opened, closed and evicted.
+"""
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MAX_READERS = 4
+DEFAULT_MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+def _nbytes(value):
+    """Approximate bytes held by a cached value."""
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if hasattr(value, "to_arrays"):
+        return _nbytes(value.to_arrays())
+    return 0
+
+
+class BoundedCache:
+    """
+    Dict-like LRU cache that evicts entries once their total size exceeds
+    its share of the frame byte budget.
+    """
+
+    def __init__(self, name, resources):
+        self.name = name
+        self._resources = resources
+        self._entries = OrderedDict()
+        self._sizes = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        with self._resources.lock:
+            value = self._entries[key]
+            self._entries.move_to_end(key)
+            return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        size = _nbytes(value)
+        with self._resources.lock:
+            self.pop(key, None)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._resources.frame_bytes += size
+            self._resources.trim()
+
+    def pop(self, key, default=None):
+        with self._resources.lock:
+            if key not in self._entries:
+                return default
+            self._resources.frame_bytes -= self._sizes.pop(key)
+            return self._entries.pop(key)
+
+    def evict_oldest(self):
+        """Drop the least recently used entry; return False if empty."""
+        with self._resources.lock:
+            if not self._entries:
+                return False
+            key = next(iter(self._entries))
+            self.pop(key)
+            self._resources.stats["evicted"] += 1
+            return True
+
+    def clear(self):
+        with self._resources.lock:
+            for key in list(self._entries):
+                self.pop(key)
+
+    @property
+    def nbytes(self):
+        return sum(self._sizes.values())
+
+
+class AnalysisResources:
+    """
+    Caps decoder processes and resident frame bytes for one analyzer.
+    """
+
+    def __init__(self, max_readers=DEFAULT_MAX_READERS, max_frame_bytes=DEFAULT_MAX_FRAME_BYTES):
+        """
+        Initialize the budget.
+
+        Args:
+            max_readers: Maximum number of decoder processes open at once;
+                further readers wait for one to close
+            max_frame_bytes: Maximum bytes of frames, features and timelines
+                kept in the analyzer's in-memory caches
+        """
+        self.max_readers = max(1, int(max_readers))
+        self.max_frame_bytes = max_frame_bytes
+        self.lock = threading.RLock()
+        self._reader_slots = threading.BoundedSemaphore(self.max_readers)
+        self._caches = []
+        self.open_readers = 0
+        self.frame_bytes = 0
+        self.stats = {"readers_opened": 0, "readers_closed": 0, "peak_readers": 0,
+                      "peak_frame_bytes": 0, "evicted": 0}
+
+    def cache(self, name):
+        """Create a cache whose contents count against max_frame_bytes."""
+        cache = BoundedCache(name, self)
+        self._caches.append(cache)
+        return cache
+
+    def acquire_reader(self):
+        """Wait for a free decoder slot and take it."""
+        self._reader_slots.acquire()
+        with self.lock:
+            self.open_readers += 1
+            self.stats["readers_opened"] += 1
+            self.stats["peak_readers"] = max(self.stats["peak_readers"], self.open_readers)
+
+    def release_reader(self):
+        """Give back a decoder slot."""
+        with self.lock:
+            self.open_readers -= 1
+            self.stats["readers_closed"] += 1
+        self._reader_slots.release()
+
+    def trim(self):
+        """Evict least recently used cache entries until the byte budget is met."""
+        with self.lock:
+            self.stats["peak_frame_bytes"] = max(self.stats["peak_frame_bytes"], self.frame_bytes)
+            while self.frame_bytes > self.max_frame_bytes:
+                largest = max(self._caches, key=lambda cache: cache.nbytes, default=None)
+                if largest is None or not largest.evict_oldest():
+                    break
+
+    def clear(self):
+        """Drop every cached entry."""
+        for cache in self._caches:
+            cache.clear()
+
+    def snapshot(self):
+        """Current usage and counters as a dict."""
+        with self.lock:
+            usage = {
+                "open_readers": self.open_readers,
+                "max_readers": self.max_readers,
+                "frame_bytes": self.frame_bytes,
+                "max_frame_bytes": self.max_frame_bytes,
+                "cached_entries": {cache.name: len(cache) for cache in self._caches},
+            }
+            usage.update(self.stats)
+            return usage
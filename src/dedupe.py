@@ -0,0 +1,121 @@
+"""
+Perceptual-hash near-duplicate detection.
+
+Re-encoded, rescaled or re-uploaded copies of a clip decode to nearly the same
+frames, so their 64-bit difference hashes (dHash) differ in only a few bits.
+PerceptualHashIndex finds every stored hash within a Hamming radius with
+multi-index hashing: each hash is split into chunks with one lookup table per
+chunk, and any two hashes within radius r agree to within r // chunks bits on
+at least one chunk. Only the entries found through the chunk tables are
+compared in full, so lookups stay fast for very large libraries.
+"""
+
+import itertools
+import numpy as np
+import cv2
+
+HASH_BITS = 64
+
+# Hashes within this many differing bits are treated as the same frame
+DEFAULT_MAX_DISTANCE = 6
+
+
+def dhash(gray):
+    """
+    64-bit difference hash of a grayscale frame.
+
+    Args:
+        gray: 2D uint8 (or 0..1 float) frame of any size
+
+    Returns:
+        Hash as a Python int
+    """
+    gray = np.asarray(gray)
+    if gray.dtype != np.uint8:
+        gray = np.clip(gray * 255.0, 0, 255).astype(np.uint8)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming_distances(hashes, value):
+    """Hamming distance of every hash in a uint64 array to one hash."""
+    xor = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class PerceptualHashIndex:
+    """
+    Multi-index hash table of 64-bit perceptual hashes with Hamming lookup.
+    """
+
+    def __init__(self, chunks=4):
+        """
+        Initialize an empty index.
+
+        Args:
+            chunks: Number of chunks each hash is split into; radius r is
+                searched by probing chunk values within r // chunks bits
+        """
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._tables = [{} for _ in range(chunks)]
+        self._hashes = []
+        self._keys = []
+        self._array = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _chunk_values(self, value):
+        mask = (1 << self.chunk_bits) - 1
+        return [(value >> (i * self.chunk_bits)) & mask for i in range(self.chunks)]
+
+    def _neighbors(self, chunk, radius):
+        """Every chunk value within radius bits of chunk."""
+        yield chunk
+        for distance in range(1, radius + 1):
+            for bits in itertools.combinations(range(self.chunk_bits), distance):
+                flipped = chunk
+                for bit in bits:
+                    flipped ^= 1 << bit
+                yield flipped
+
+    def add(self, value, key):
+        """
+        Add a hash.
+
+        Args:
+            value: 64-bit hash
+            key: Anything identifying where the hash came from
+        """
+        entry = len(self._keys)
+        self._keys.append(key)
+        self._hashes.append(int(value))
+        self._array = None
+        for table, chunk in zip(self._tables, self._chunk_values(int(value))):
+            table.setdefault(chunk, []).append(entry)
+
+    def query(self, value, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        Find every stored hash within max_distance bits of value.
+
+        Returns:
+            List of (key, distance) tuples, nearest first
+        """
+        if not self._keys:
+            return []
+        if self._array is None:
+            self._array = np.array(self._hashes, dtype=np.uint64)
+        radius = max_distance // self.chunks
+        found = set()
+        for table, chunk in zip(self._tables, self._chunk_values(int(value))):
+            for neighbor in self._neighbors(chunk, radius):
+                found.update(table.get(neighbor, ()))
+        if not found:
+            return []
+        entries = np.fromiter(found, dtype=np.int64, count=len(found))
+        distances = hamming_distances(self._array[entries], value)
+        close = distances <= max_distance
+        order = np.argsort(distances[close], kind="stable")
+        return [(self._keys[entries[close][i]], int(distances[close][i])) for i in order]
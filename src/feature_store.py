@@ -0,0 +1,208 @@
+"""
+Persistent, memory-mapped store for per-source analysis results.
+
+Frame features, window scores and timelines are saved as .npy arrays in one
+directory per (source content fingerprint, kind, parameters) entry, and loaded
+back with mmap_mode="r" so repeated lookups neither re-read nor copy them. The
+store is versioned (a format change simply starts a new version directory,
+and older versions are only deleted by an explicit remove_other_versions()
+so app versions sharing a cache never destroy each other's data) and bounded
+in size: the least recently used entries are evicted once it grows past
+max_bytes. The store size is tracked across saves, so the directory is only
+walked when the tracked size crosses max_bytes or the tracked value is older
+than SIZE_RECHECK_SECONDS (other processes may write to the same store).
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+
+# Bump when the layout or meaning of stored arrays changes
+FEATURE_STORE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Seconds after which the tracked store size is re-measured from disk
+SIZE_RECHECK_SECONDS = 300.0
+
+# Eviction trims the store to this fraction of max_bytes, so it does not run
+# again on the very next save
+EVICT_TO_FRACTION = 0.8
+
+
+class FeatureStore:
+    """
+    Content-hash keyed store of numpy arrays with LRU size bounding.
+    """
+
+    def __init__(self, cache_dir=".clip_cache", max_bytes=DEFAULT_MAX_BYTES,
+                 version=FEATURE_STORE_VERSION):
+        """
+        Initialize the store.
+
+        Args:
+            cache_dir: Directory holding the caches
+            max_bytes: Size the store is trimmed back to after writes
+            version: Store format version; directories of other versions are
+                left alone (see remove_other_versions())
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = version
+        self.base_dir = os.path.join(cache_dir, "features")
+        self.root = os.path.join(self.base_dir, f"v{version}")
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        # Tracked store size in bytes and when it was last measured from disk
+        self._size = None
+        self._measured = 0.0
+
+    def remove_other_versions(self):
+        """
+        Delete the directories of every other store version.
+
+        Only call this when no other app version uses the same cache_dir.
+        """
+        for name in os.listdir(self.base_dir):
+            if name != f"v{self.version}":
+                shutil.rmtree(os.path.join(self.base_dir, name), ignore_errors=True)
+
+    @staticmethod
+    def entry_name(fingerprint, kind, params=None):
+        """Return the directory name of an entry."""
+        params_hash = hashlib.sha1(json.dumps(params or {}, sort_keys=True).encode()).hexdigest()[:10]
+        return f"{fingerprint}_{kind}_{params_hash}"
+
+    def _entry_dir(self, fingerprint, kind, params):
+        return os.path.join(self.root, self.entry_name(fingerprint, kind, params))
+
+    def load(self, fingerprint, kind, params=None, mmap=True):
+        """
+        Load an entry.
+
+        Args:
+            fingerprint: Content fingerprint of the source
+            kind: Kind of data, e.g. "frame_features"
+            params: Dict of parameters the data was computed with
+            mmap: Memory-map the arrays instead of reading them
+
+        Returns:
+            (dict of name -> array, meta dict), or None if missing
+        """
+        entry_dir = self._entry_dir(fingerprint, kind, params)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            arrays = {
+                name: np.load(os.path.join(entry_dir, f"{name}.npy"),
+                              mmap_mode="r" if mmap else None)
+                for name in meta.get("arrays", [])
+            }
+        except (OSError, ValueError):
+            return None
+        try:
+            # Record the access for LRU eviction
+            os.utime(meta_path, None)
+        except OSError:
+            pass
+        return arrays, meta.get("meta", {})
+
+    def save(self, fingerprint, kind, arrays, params=None, meta=None):
+        """
+        Save (or replace) an entry atomically.
+
+        Args:
+            fingerprint: Content fingerprint of the source
+            kind: Kind of data
+            arrays: Dict of name -> numpy array
+            params: Dict of parameters the data was computed with
+            meta: Optional JSON-serializable metadata
+        """
+        entry_dir = self._entry_dir(fingerprint, kind, params)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"arrays": list(arrays), "params": params or {},
+                           "meta": meta or {}, "created": time.time()}, f)
+            added = self._dir_size(tmp_dir)
+            with self._lock:
+                if os.path.exists(entry_dir):
+                    added -= self._dir_size(entry_dir)
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(tmp_dir, entry_dir)
+                if self._size is not None:
+                    self._size += added
+        except OSError as e:
+            print(f"Error saving {kind} for {fingerprint}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        if self._over_budget():
+            self.evict()
+
+    @staticmethod
+    def _dir_size(directory):
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _over_budget(self):
+        """Whether the tracked size says eviction is due, re-measuring it when stale."""
+        with self._lock:
+            if self._size is None or time.time() - self._measured > SIZE_RECHECK_SECONDS:
+                self._size = sum(size for _, size, _ in self._entries())
+                self._measured = time.time()
+            return self._size > self.max_bytes
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if name.endswith(".tmp") or not os.path.isfile(meta_path):
+                continue
+            try:
+                size = self._dir_size(entry_dir)
+                mtime = os.stat(meta_path).st_mtime
+            except OSError:
+                # Removed by another process while listing
+                continue
+            entries.append((mtime, size, entry_dir))
+        return entries
+
+    def size(self):
+        """Total bytes used by the store."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target_bytes=None):
+        """
+        Delete least recently used entries until the store fits.
+
+        Args:
+            target_bytes: Size to trim to; EVICT_TO_FRACTION of max_bytes when None
+        """
+        if target_bytes is None:
+            target_bytes = self.max_bytes * EVICT_TO_FRACTION
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in entries:
+                if total <= target_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+            self._size = total
+            self._measured = time.time()
+
+    def clear(self):
+        """Delete every entry."""
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+            self._size = 0
+            self._measured = time.time()
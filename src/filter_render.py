@@ -0,0 +1,331 @@
+"""
+Single-pass ffmpeg renderer for ScramblePlans.
+
+Rendering through MoviePy pulls every frame of every segment through a chain
+of Python wrappers (subclip, padding, fades, speed change, concatenation,
+compositing). compile_plan() instead expresses the whole plan as one ffmpeg
+filtergraph: each source is opened once, padded and split into its segments,
+which are trimmed, faded and retimed, the segments are joined with the
+concat filter, the text patch (see src.text_overlay) is overlaid and the
+audio track is muxed in. One ffmpeg process then decodes, filters and
+encodes the output, and Python never touches a pixel.
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+from functools import lru_cache
+
+from src.probe import get_ffmpeg_binary
+from src.padding import padded_size, ffmpeg_pad_filter, FILL_BLUR
+from src.text_overlay import text_patch_for
+from src.profiles import get_profile
+
+
+@lru_cache(maxsize=None)
+def has_filter(name):
+    """Return True if the ffmpeg build provides a filter."""
+    try:
+        result = subprocess.run([get_ffmpeg_binary(), "-hide_banner", "-filters"],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[1] == name:
+            return True
+    return False
+
+
+def can_render_with_ffmpeg(plan):
+    """
+    Return True if compile_plan() can express a plan.
+
+    Sources are fanned out into their segments with select and split, and
+    text overlays and blurred padding need overlay and boxblur; minimal
+    ffmpeg builds may lack any of them.
+    """
+    needed = ["select", "split"]
+    if plan.text and plan.text.get("text"):
+        needed.append("overlay")
+    if plan.settings.get("target_ratio") and plan.settings.get("pad_fill") == FILL_BLUR:
+        needed += ["boxblur", "overlay"]
+    return all(has_filter(name) for name in needed)
+
+
+def _even(value):
+    return int(value) + int(value) % 2
+
+
+def _segment_size(plan, source):
+    """Frame size of one source's segments after padding."""
+    width, height = source["width"], source["height"]
+    target_ratio = plan.settings.get("target_ratio")
+    # Same rule as pad_clip_to_ratio: only landscape sources are padded
+    if target_ratio and width > height:
+        width, height = padded_size(width, height, tuple(target_ratio))[:2]
+    return width, height
+
+
+def output_size(plan):
+    """
+    Size of a plan's rendered frames.
+
+    Segments of different sizes are centered on a canvas as large as the
+    largest of them, as concatenate_videoclips(method="compose") does.
+    """
+    sizes = [_segment_size(plan, plan.sources[seg["source"]]) for seg in plan.segments]
+    return _even(max(w for w, _ in sizes)), _even(max(h for _, h in sizes))
+
+
+def _span_select(spans):
+    """
+    select expression keeping the frames inside any of the (start, end)
+    spans, with overlapping spans merged.
+    """
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return "+".join(f"between(t,{start - 1e-3:.6f},{end + 1e-3:.6f})" for start, end in merged)
+
+
+def compile_plan(plan, output_path, text_path=None, codec="libx264", audio_codec="aac",
+                 threads=None, audio_pipe=None, profile=None):
+    """
+    Compile a plan into one ffmpeg command.
+
+    Args:
+        plan: ScramblePlan to render
+        output_path: Path of the video to write
+        text_path: PNG of the plan's text patch (see write_text_image);
+            required when the plan has text
+        codec: Video encoder
+        audio_codec: Audio encoder
+        threads: Number of encoder threads, or None for ffmpeg's default
+        audio_pipe: Optional (sample_rate, channels) of s16le PCM written to
+            ffmpeg's stdin, used instead of decoding plan.audio from its file
+        profile: Optional RenderProfile or profile name; its encoder
+            settings, frame rate and size caps replace codec and the plan's fps
+
+    Returns:
+        Argument list for subprocess, starting with the ffmpeg binary
+    """
+    if not plan.segments:
+        raise ValueError("Plan has no segments")
+    profile = get_profile(profile) if profile is not None else None
+    fps = plan.settings.get("fps", 30)
+    if profile is not None:
+        fps = profile.output_fps(fps)
+    target_ratio = plan.settings.get("target_ratio")
+    pad_fill = plan.settings.get("pad_fill", (0, 0, 0))
+    if isinstance(pad_fill, list):
+        pad_fill = tuple(pad_fill)
+    canvas_w, canvas_h = output_size(plan)
+    # Frames are brought to the profile's size before they are split, so the
+    # frames waiting for their segment's turn are no larger than the output
+    scaled_w, scaled_h = canvas_w, canvas_h
+    if profile is not None:
+        scaled_w, scaled_h = profile.output_size(canvas_w, canvas_h)
+    scale = f",scale={scaled_w}:{scaled_h}" if (scaled_w, scaled_h) != (canvas_w, canvas_h) else ""
+
+    # (start, length, read) of every segment. Two output frames more than the
+    # segment are read, so the fps filter has source frames past the
+    # segment's last output frame to pick from
+    spans = []
+    for segment in plan.segments:
+        source = plan.sources[segment["source"]]
+        start = segment["start"]
+        end = min(segment["end"], source["duration"]) if source.get("duration") else segment["end"]
+        length = max(end - start, 1.0 / fps)
+        spans.append((start, length, length + 2.0 * max(segment.get("speed", 1.0), 1.0) / fps))
+
+    # Each source is one input, seeked to its earliest segment. Frames between
+    # its segments are dropped, the rest padded once (as the MoviePy renderer
+    # does, padding comes before the fades) and split into one branch per
+    # segment. Input seeking decodes from the preceding keyframe and drops
+    # the frames before the in point, so the trims below count from there.
+    inputs = []
+    graph = []
+    offsets = {}
+    for source_index in dict.fromkeys(seg["source"] for seg in plan.segments):
+        source = plan.sources[source_index]
+        members = [i for i, seg in enumerate(plan.segments) if seg["source"] == source_index]
+        first = min(spans[i][0] for i in members)
+        last = max(spans[i][0] + spans[i][2] for i in members)
+        input_index = len(offsets)
+        inputs += ["-ss", f"{first:.6f}", "-t", f"{last - first:.6f}", "-i", source["path"]]
+        offsets[source_index] = first
+
+        select = _span_select([(spans[i][0] - first, spans[i][0] - first + spans[i][2])
+                               for i in members])
+        graph.append(f"[{input_index}:v]select='{select}'[k{input_index}]")
+        label = f"k{input_index}"
+        width, height = source["width"], source["height"]
+        if target_ratio and width > height:
+            graph.append(ffmpeg_pad_filter(width, height, tuple(target_ratio), pad_fill,
+                                           input_label=label, output_label=f"p{input_index}"))
+            label = f"p{input_index}"
+        branches = "".join(f"[b{i}]" for i in members)
+        split = f",split={len(members)}" if len(members) > 1 else ""
+        graph.append(f"[{label}]pad={canvas_w}:{canvas_h}:(ow-iw)/2:(oh-ih)/2:color=black"
+                     f"{scale},format=yuv420p,setsar=1{split}{branches}")
+
+    # Output time at the end of the segments so far; each segment is cut to
+    # the frames between its cumulative start and end on the output frame
+    # grid, so rounding to whole source frames never adds up over a plan
+    elapsed = 0.0
+    for i, segment in enumerate(plan.segments):
+        start, length, read = spans[i]
+        speed = segment.get("speed", 1.0)
+
+        filters = [f"trim=start={start - offsets[segment['source']]:.6f}:duration={read:.6f}",
+                   "setpts=PTS-STARTPTS"]
+        # Fades are measured in source time, before the speed change
+        if segment.get("fade_in"):
+            filters.append(f"fade=t=in:st=0:d={segment['fade_in']:.6f}")
+        if segment.get("fade_out"):
+            fade_out = min(segment["fade_out"], length)
+            filters.append(f"fade=t=out:st={length - fade_out:.6f}:d={fade_out:.6f}")
+        if speed != 1.0:
+            filters.append(f"setpts=PTS/{speed:.6f}")
+        first_frame = int(round(elapsed * fps))
+        elapsed += length / speed
+        frames = max(1, int(round(elapsed * fps)) - first_frame)
+        filters += [f"fps={fps}", f"trim=end_frame={frames}"]
+        graph.append(f"[b{i}]{','.join(filters)}[s{i}]")
+
+    count = len(plan.segments)
+    graph.append("".join(f"[s{i}]" for i in range(count)) + f"concat=n={count}:v=1:a=0[joined]")
+    video_label = "joined"
+
+    next_input = len(offsets)
+    if plan.text and plan.text.get("text"):
+        if text_path is None:
+            raise ValueError("text_path is required for plans with a text overlay")
+        # A single-image input; overlay repeats its last frame to the end. The
+        # patch is drawn for the full canvas, so it is scaled with the frames
+        # to keep its size relative to them
+        inputs += ["-i", text_path]
+        text_label = f"{next_input}:v"
+        if scale:
+            graph.append(f"[{text_label}]scale=iw*{scaled_w}/{canvas_w}:ih*{scaled_h}/{canvas_h}[text]")
+            text_label = "text"
+        graph.append(f"[{video_label}][{text_label}]overlay=(W-w)/2:(H-h)/2:format=auto,"
+                     f"format=yuv420p[titled]")
+        video_label = "titled"
+        next_input += 1
+
+    maps = ["-map", f"[{video_label}]"]
+    if plan.audio and audio_pipe:
+        inputs += ["-f", "s16le", "-ar", str(audio_pipe[0]), "-ac", str(audio_pipe[1]),
+                   "-i", "pipe:0"]
+        maps += ["-map", f"{next_input}:a:0", "-c:a", audio_codec]
+    elif plan.audio:
+        inputs += ["-ss", f"{plan.audio.get('offset', 0.0):.6f}", "-t", f"{plan.duration:.6f}",
+                   "-i", plan.audio["path"]]
+        maps += ["-map", f"{next_input}:a:0", "-c:a", audio_codec]
+
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + inputs
+    cmd += ["-filter_complex", ";".join(graph)] + maps
+    if profile is not None:
+        cmd += profile.video_args() + profile.audio_args()
+        threads = profile.threads or threads
+    else:
+        cmd += ["-c:v", codec]
+    cmd += ["-pix_fmt", "yuv420p", "-r", str(fps)]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd += [output_path]
+    return cmd
+
+
+def write_text_image(plan, path):
+    """Rasterize a plan's text overlay for its output size and save it as a PNG."""
+    text_patch_for(plan.text, output_size(plan)).image().save(path)
+    return path
+
+
+def _run(cmd, duration, on_progress=None, stdin_data=None):
+    """
+    Run ffmpeg, optionally feeding stdin and reporting progress.
+
+    Args:
+        cmd: ffmpeg argument list
+        duration: Length of the output, to turn output time into a fraction
+        on_progress: Optional callable(fraction) called as the output is written
+        stdin_data: Optional bytes-like object written to ffmpeg's stdin
+
+    Returns:
+        (returncode, stderr bytes)
+    """
+    if on_progress is not None:
+        cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(
+            cmd, stderr=errors,
+            stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE if on_progress is not None else subprocess.DEVNULL)
+        writer = None
+        if stdin_data is not None:
+            def feed():
+                try:
+                    process.stdin.write(stdin_data)
+                except (BrokenPipeError, OSError):
+                    pass
+                finally:
+                    process.stdin.close()
+            # A thread, since ffmpeg reads its inputs interleaved with writing progress
+            writer = threading.Thread(target=feed, daemon=True)
+            writer.start()
+        if on_progress is not None:
+            for line in process.stdout:
+                key, _, value = line.decode("ascii", "replace").strip().partition("=")
+                if key == "out_time_us" and value.isdigit() and duration > 0:
+                    on_progress(min(1.0, int(value) / 1e6 / duration))
+        process.wait()
+        if writer is not None:
+            writer.join()
+        errors.seek(0)
+        return process.returncode, errors.read()
+
+
+def render_plan_ffmpeg(plan, output_path, codec="libx264", audio_codec="aac", threads=None,
+                       on_progress=None, audio_track=None, profile=None):
+    """
+    Render a plan with a single ffmpeg process.
+
+    Args:
+        plan: ScramblePlan to render
+        output_path: Path of the video to write
+        codec: Video encoder
+        audio_codec: Audio encoder
+        threads: Number of encoder threads, or None for ffmpeg's default
+        on_progress: Optional callable(fraction) called as the output is written
+        audio_track: Optional PCMAudio of plan.audio's track (see
+            src.shared_audio); its slice is piped to ffmpeg instead of
+            decoding the file again
+        profile: Optional RenderProfile or profile name (see compile_plan)
+
+    Returns:
+        output_path
+    """
+    audio_pipe = pcm = None
+    if plan.audio and audio_track is not None:
+        pcm = audio_track.segment(plan.audio.get("offset", 0.0), plan.duration)
+        pcm = memoryview(pcm).cast("B") if pcm.flags["C_CONTIGUOUS"] else pcm.tobytes()
+        audio_pipe = (audio_track.fps, audio_track.channels)
+    with tempfile.TemporaryDirectory() as work_dir:
+        text_path = None
+        if plan.text and plan.text.get("text"):
+            text_path = write_text_image(plan, os.path.join(work_dir, "text.png"))
+        cmd = compile_plan(plan, output_path, text_path, codec, audio_codec, threads, audio_pipe,
+                           profile)
+        returncode, stderr = _run(cmd, plan.duration, on_progress, pcm)
+    if returncode != 0:
+        message = stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg render failed: {message[-500:]}")
+    return output_path
@@ -0,0 +1,216 @@
+"""
+Small-frame reader for content analysis.
+
+Analysis only ever looks at tiny grayscale frames (32x32 features, ~72px
+timelines), yet VideoFileClip decodes, converts and copies every frame at full
+resolution in RGB first. AnalysisFrameReader lets ffmpeg do the frame-rate
+reduction, scaling and pixel-format conversion, and reads the small raw frames
+from its pipe straight into a reusable numpy buffer.
+"""
+
+import subprocess
+import numpy as np
+
+from src.probe import get_ffmpeg_binary
+
+PIX_FMT_GRAY = "gray"
+PIX_FMT_RGB = "rgb24"
+
+
+def scaled_size(width, height, target_height):
+    """Even (width, height) of a frame scaled to target_height, keeping aspect."""
+    if not width or not height:
+        return target_height, target_height
+    target_width = max(2, int(round(width * target_height / height / 2.0)) * 2)
+    return target_width, target_height
+
+
+class AnalysisFrameReader:
+    """
+    Iterates small frames of a video decoded and scaled by ffmpeg.
+
+    Each iteration yields the same preallocated array, overwritten with the
+    next frame; copy it if it has to outlive the iteration step.
+    """
+
+    def __init__(self, video_path, width, height, fps=None, gray=True, start=0.0,
+                 duration=None, scale_flags="area", select=None, resources=None):
+        """
+        Initialize the reader.
+
+        Args:
+            video_path: Path to the video file
+            width: Output frame width in pixels
+            height: Output frame height in pixels
+            fps: Output frame rate, or None for every source frame
+            gray: Deliver single-channel gray8 frames instead of RGB
+            start: Time in seconds to start reading at
+            duration: Seconds to read, or None to read to the end
+            scale_flags: ffmpeg scaler algorithm
+            select: Optional ffmpeg select expression; only the frames it
+                picks are scaled and delivered, at their own timestamps
+            resources: Optional AnalysisResources; the ffmpeg process then
+                takes one of its reader slots while it runs
+        """
+        self.video_path = video_path
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = fps
+        self.gray = gray
+        self.start = start
+        self.duration = duration
+        self.scale_flags = scale_flags
+        self.select = select
+        self.resources = resources
+        shape = (self.height, self.width) if gray else (self.height, self.width, 3)
+        self.buffer = np.empty(shape, dtype=np.uint8)
+        self._view = memoryview(self.buffer.reshape(-1))
+        self._process = None
+
+    def _command(self):
+        cmd = [get_ffmpeg_binary(), "-v", "error", "-nostdin"]
+        if self.start:
+            cmd += ["-ss", f"{self.start:.6f}"]
+        cmd += ["-i", self.video_path]
+        if self.duration is not None:
+            cmd += ["-t", f"{self.duration:.6f}"]
+        filters = []
+        if self.fps:
+            filters.append(f"fps={self.fps}")
+        if self.select:
+            filters.append(f"select='{self.select}'")
+        filters.append(f"scale={self.width}:{self.height}:flags={self.scale_flags}")
+        cmd += ["-an", "-sn", "-vf", ",".join(filters)]
+        if self.select:
+            # Don't duplicate frames to fill the gaps between selected ones
+            cmd += ["-vsync", "passthrough"]
+        cmd += ["-pix_fmt", PIX_FMT_GRAY if self.gray else PIX_FMT_RGB, "-f", "rawvideo", "-"]
+        return cmd
+
+    def _read_frame(self):
+        """Fill the buffer with the next frame; return False at end of stream."""
+        filled = 0
+        size = len(self._view)
+        while filled < size:
+            count = self._process.stdout.readinto(self._view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def __iter__(self):
+        self.close()
+        if self.resources is not None:
+            self.resources.acquire_reader()
+        try:
+            self._process = subprocess.Popen(self._command(), stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL, bufsize=len(self._view) * 4)
+        except Exception:
+            if self.resources is not None:
+                self.resources.release_reader()
+            raise
+        try:
+            while self._read_frame():
+                yield self.buffer
+        finally:
+            self.close()
+
+    def read_all(self, max_frames=None):
+        """
+        Read every frame into one array.
+
+        Args:
+            max_frames: Stop after this many frames
+
+        Returns:
+            uint8 array of shape (frames, height, width[, 3])
+        """
+        frames = []
+        with self:
+            for frame in self:
+                frames.append(frame.copy())
+                if max_frames is not None and len(frames) >= max_frames:
+                    break
+        return np.array(frames, dtype=np.uint8).reshape((-1,) + self.buffer.shape)
+
+    def close(self):
+        """Stop the ffmpeg process if it is still running."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdout.close()
+        except OSError:
+            pass
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        if self.resources is not None:
+            self.resources.release_reader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+def _select_instants(times, frame_interval):
+    """
+    ffmpeg select expression picking, for each time in turn, the frame on
+    screen at that time, i.e. the first frame that has not ended by then.
+    With frame_interval 0 (unknown frame rate) that is the first frame at or
+    after the time.
+    """
+    margin = max(frame_interval - 1e-6, 1e-6)
+    expression = "0"
+    for index in reversed(range(len(times))):
+        threshold = times[index] - margin
+        expression = f"if(eq(selected_n,{index}),gt(t,{threshold:.6f}),{expression})"
+    return expression
+
+
+def sample_frames(video_path, num_frames, width, height, start=0.0, duration=None, gray=True,
+                  frame_rate=None, resources=None):
+    """
+    Read num_frames small frames spread evenly over a time range.
+
+    Frames are taken at np.linspace(0, duration, num_frames) into the range,
+    the instants VideoFileClip.get_frame used to be called at, and scaled
+    with nearest-neighbour sampling, which approximates cv2.resize's bilinear
+    interpolation at these reduction factors. The result is an approximation
+    of features computed from full-size frames: single pixels can differ by
+    up to half the gray range at sharp edges, while per-frame cosine
+    similarities stay above 0.99 and clip similarities within 0.01.
+    Uses one sequential decode instead of one seek per frame. Short reads
+    (a range ending at the last frame) are padded by repeating the last frame.
+
+    Args:
+        video_path: Path to the video file
+        num_frames: Number of frames to return
+        width: Frame width in pixels
+        height: Frame height in pixels
+        start: Start of the range in seconds
+        duration: Length of the range in seconds (required)
+        gray: Return gray8 frames instead of RGB
+        frame_rate: Source frame rate, used to find the frame showing at each
+            instant; without it the first frame at or after it is taken
+        resources: Optional AnalysisResources limiting open decoders
+
+    Returns:
+        uint8 array of shape (num_frames, height, width[, 3])
+    """
+    frame_interval = 1.0 / frame_rate if frame_rate else 0.0
+    select = _select_instants(np.linspace(0, duration, num_frames), frame_interval)
+    # Read one frame past the range so its closing instant has a frame too
+    reader = AnalysisFrameReader(video_path, width, height, gray=gray, start=start,
+                                 duration=duration + frame_interval, scale_flags="neighbor", select=select,
+                                 resources=resources)
+    frames = reader.read_all(max_frames=num_frames)
+    if len(frames) == 0:
+        raise RuntimeError(f"No frames decoded from {video_path}")
+    if len(frames) < num_frames:
+        padding = np.repeat(frames[-1:], num_frames - len(frames), axis=0)
+        frames = np.concatenate([frames, padding])
+    return frames
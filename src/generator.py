@@ -1,12 +1,202 @@
-import os, random
-import warnings
-import hashlib
-import numpy as np
-from collections import defaultdict
-from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips, CompositeVideoClip, TextClip, ColorClip
-# Import specific effects
-from moviepy.video.fx.loop import loop
-from moviepy.video.fx.fadein import fadein
-from moviepy.video.fx.fadeout import fadeout
-import traceback
-import threading
+"""
+Batch generation of scrambled videos.
+
+Outputs are planned one after another in this process, so they share the
+per-source segment allocators and stay reproducible from one seed, and are
+then rendered side by side by src.renderer.render_plans_parallel.
+"""
+
+import os
+import re
+import random
+
+from src.plan import ScramblePlanner, derive_seed
+from src.renderer import render_plans_parallel
+from src.profiles import DEFAULT_PROFILE
+from src.utils import get_video_files
+
+OUTPUT_PATTERN = re.compile(r"^output_(\d+)\.mp4$")
+
+
+def _next_output_index(output_dir):
+    """Number after the highest existing output_<n>.mp4, so batches never overwrite."""
+    if not os.path.isdir(output_dir):
+        return 1
+    numbers = [int(match.group(1)) for match in map(OUTPUT_PATTERN.match, os.listdir(output_dir))
+               if match]
+    return max(numbers, default=0) + 1
+
+
+def _make_planner(seed=None, use_ai=False, cache_dir=".clip_cache", use_mezzanine=False,
+                  analysis_budget=None):
+    analyzer = None
+    if use_ai:
+        from src.video_analysis import VideoContentAnalyzer
+        analyzer = VideoContentAnalyzer(cache_dir)
+    return ScramblePlanner(seed=seed, analyzer=analyzer, cache_dir=cache_dir,
+                           analysis_budget=analysis_budget, use_mezzanine=use_mezzanine)
+
+
+def _report_warnings(plans, progress_callback=None):
+    """Pass the plans' warnings to the progress callback, prefixed by output number."""
+    warnings = [f"Video {i + 1}: {warning}" for i, plan in enumerate(plans)
+                for warning in plan.warnings]
+    if progress_callback:
+        for warning in warnings:
+            progress_callback(0, warning)
+    return warnings
+
+
+class VideoGenerator:
+    """
+    Generates scrambled videos from a base video and optional extra sources.
+    """
+
+    def __init__(self, input_video_path, seed=None, use_ai=False, cache_dir=".clip_cache",
+                 use_mezzanine=False, analysis_budget=None):
+        """
+        Initialize the generator.
+
+        Args:
+            input_video_path: Path to the base video
+            seed: Seed for all random choices; a random one is used when None
+            use_ai: Select segments with the content analyzer
+            cache_dir: Directory holding the probe, keyframe and feature caches
+            use_mezzanine: Transcode sources once to normalized proxies and
+                generate from those (see src.mezzanine)
+            analysis_budget: Optional time limit in seconds for choosing each
+                output's segments with the analyzer (only with use_ai); a
+                warning says when it ran out
+        """
+        self.input_video_path = input_video_path
+        self.planner = _make_planner(seed, use_ai, cache_dir, use_mezzanine, analysis_budget)
+        self.use_ai = use_ai
+        # Warnings from the last generate_scrambled_videos() call
+        self.last_warnings = []
+
+    def generate_scrambled_videos(self, num_videos=1, segment_duration=0.5, output_dir="output",
+                                  additional_videos=None, audio_path=None, text_overlay=None,
+                                  progress_callback=None, workers=None, cpu_budget=None,
+                                  profile=DEFAULT_PROFILE):
+        """
+        Generate several scrambled videos.
+
+        Args:
+            num_videos: Number of outputs
+            segment_duration: Length of each segment in seconds
+            output_dir: Directory the videos are written to
+            additional_videos: Other source videos mixed in with the base one
+            audio_path: Optional audio track; also sets the output length
+            text_overlay: Text overlay parameters, or None
+            progress_callback: Optional callable(progress_percent, status_message)
+            workers: Number of render processes; derived from cpu_budget when None
+            cpu_budget: Total number of cores to use; all of them when None
+            profile: Render profile name ("draft", "standard", "final")
+
+        Returns:
+            List of paths of the videos that were written; planning warnings
+            (such as reused footage) are kept in last_warnings
+        """
+        video_paths = [self.input_video_path] + list(additional_videos or [])
+        if self.planner.use_mezzanine:
+            if progress_callback:
+                progress_callback(0, "Preparing proxies...")
+            self.planner.ingest(video_paths)
+        if progress_callback:
+            progress_callback(0, "Planning videos...")
+        plans = self.planner.plan_batch(
+            num_videos, video_paths, segment_duration=segment_duration,
+            text_overlay=text_overlay, audio_path=audio_path, use_ai=self.use_ai,
+            batch_id=derive_seed(self.planner.seed, "batch"))
+        self.last_warnings = _report_warnings(plans, progress_callback)
+        outputs = render_plans_parallel(plans, output_dir, progress_callback, workers=workers,
+                                        cpu_budget=cpu_budget,
+                                        first_index=_next_output_index(output_dir),
+                                        profile=profile)
+        return [path for path in outputs if path]
+
+
+def generate_batch(num_videos=1, input_videos=None, audio_files=None, output_dir=None,
+                   min_clips=10, max_clips=30, min_clip_duration=1.5, max_clip_duration=3.5,
+                   use_effects=False, use_text=False, custom_text=None, progress_callback=None,
+                   input_video_path=None, input_audio_path=None, output_path=None,
+                   use_ai=False, seed=None, workers=None, cpu_budget=None, profile=DEFAULT_PROFILE,
+                   use_mezzanine=False, analysis_budget=None):
+    """
+    Generate a batch of scrambled videos named output_<n>.mp4.
+
+    Each output gets its own clip count, clip length and audio track, drawn
+    from the given ranges. Sources can be given as a list (input_videos,
+    audio_files, output_dir) or as a folder, a single audio file and an
+    output folder (input_video_path, input_audio_path, output_path).
+
+    Args:
+        num_videos: Number of outputs
+        input_videos: List of source video paths
+        audio_files: List of audio tracks to choose from per output
+        output_dir: Directory the videos are written to
+        min_clips: Fewest segments per output
+        max_clips: Most segments per output
+        min_clip_duration: Shortest segment length in seconds
+        max_clip_duration: Longest segment length in seconds
+        use_effects: Apply fades and speed jitter to segments
+        use_text: Overlay custom_text on the outputs
+        custom_text: Text to overlay
+        progress_callback: Optional callable(progress_percent, status_message)
+        input_video_path: Folder of source videos, instead of input_videos
+        input_audio_path: Single audio track, instead of audio_files
+        output_path: Output folder, instead of output_dir
+        use_ai: Select segments with the content analyzer
+        seed: Seed for all random choices; a random one is used when None
+        workers: Number of render processes; derived from cpu_budget when None
+        cpu_budget: Total number of cores to use; all of them when None
+        profile: Render profile name ("draft", "standard", "final")
+        use_mezzanine: Transcode sources once to normalized proxies and
+            generate from those (see src.mezzanine)
+        analysis_budget: Optional time limit in seconds for choosing each
+            output's segments with the analyzer (only with use_ai); a warning
+            is reported through progress_callback when it ran out
+
+    Returns:
+        List of paths of the videos that were written
+    """
+    if input_videos is None:
+        input_videos = get_video_files(input_video_path) if input_video_path else []
+    if audio_files is None:
+        audio_files = [input_audio_path] if input_audio_path else []
+    audio_files = [path for path in audio_files if path and os.path.exists(path)]
+    output_dir = output_dir or output_path or "output"
+    if not input_videos:
+        raise ValueError("No input videos to generate from")
+
+    planner = _make_planner(seed, use_ai, use_mezzanine=use_mezzanine,
+                            analysis_budget=analysis_budget)
+    if use_mezzanine:
+        if progress_callback:
+            progress_callback(0, "Preparing proxies...")
+        planner.ingest(input_videos)
+    text_overlay = {"text": custom_text} if use_text and custom_text else None
+    batch_id = derive_seed(planner.seed, "batch")
+
+    plans = []
+    for i in range(num_videos):
+        if progress_callback:
+            progress_callback(0, f"Planning video {i + 1} of {num_videos}...")
+        rng = random.Random(derive_seed(planner.seed, "output", i))
+        plans.append(planner.plan(
+            input_videos,
+            segment_duration=rng.uniform(min_clip_duration, max_clip_duration),
+            num_segments=rng.randint(min_clips, max_clips),
+            add_transitions=use_effects,
+            text_overlay=text_overlay,
+            audio_path=rng.choice(audio_files) if audio_files else None,
+            use_ai=use_ai,
+            batch_id=batch_id,
+        ))
+    _report_warnings(plans, progress_callback)
+
+    outputs = render_plans_parallel(plans, output_dir, progress_callback, workers=workers,
+                                    cpu_budget=cpu_budget,
+                                    first_index=_next_output_index(output_dir),
+                                    profile=profile)
+    return [path for path in outputs if path]
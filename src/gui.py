@@ -2,6 +2,7 @@ import os
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import threading
+import queue
 from pathlib import Path
 import sys
 import subprocess
@@ -10,7 +11,10 @@ import platform
 # Add parent directory to path to import modules correctly
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.generator import generate_batch
-from src.utils import get_video_files
+from src.library import watch_library
+
+# How often the Tk main loop checks for folder changes, in milliseconds
+LIBRARY_POLL_MS = 250
 
 class ScrambleClipGUI:
     def __init__(self, root):
@@ -25,8 +29,15 @@ class ScrambleClipGUI:
         self.output_path = tk.StringVar(value=os.path.abspath("../outputs"))
         self.num_videos = tk.IntVar(value=5)
         
+        # Watched folder libraries behind the two lists
+        self.input_library = None
+        self.output_library = None
+        # Change notices from library threads, drained on the Tk main loop
+        self.library_events = queue.Queue()
+        
         self.create_widgets()
         self.refresh_video_lists()
+        self.poll_library_events()
         
     def create_widgets(self):
         print("Creating widgets...")
@@ -142,22 +153,52 @@ class ScrambleClipGUI:
         self.input_video_list.delete(0, tk.END)
         self.output_video_list.delete(0, tk.END)
         
-        # Fill input videos list
+        # Fill input videos list (folders are scanned in the background and
+        # the lists refilled when the scan finishes)
+        scanning = False
         if os.path.exists(self.input_video_path.get()):
-            input_videos = get_video_files(self.input_video_path.get())
-            for video in input_videos:
-                self.input_video_list.insert(tk.END, os.path.basename(video))
+            self.input_library = watch_library(self.input_video_path.get(), self.input_library,
+                                               self.on_library_change)
+            scanning = not self.input_library.scanned
+            if not scanning:
+                for video in self.input_library.files():
+                    self.input_video_list.insert(tk.END, os.path.basename(video))
         
         # Fill output videos list
         if os.path.exists(self.output_path.get()):
-            output_videos = get_video_files(self.output_path.get())
-            for video in output_videos:
-                self.output_video_list.insert(tk.END, os.path.basename(video))
+            self.output_library = watch_library(self.output_path.get(), self.output_library,
+                                                self.on_library_change)
+            if self.output_library.scanned:
+                for video in self.output_library.files():
+                    self.output_video_list.insert(tk.END, os.path.basename(video))
+            else:
+                scanning = True
                 
         # Update status
         input_count = self.input_video_list.size()
         output_count = self.output_video_list.size()
-        self.status_var.set(f"Found {input_count} input videos, {output_count} output videos")
+        if scanning:
+            self.status_var.set("Scanning video folders...")
+        else:
+            self.status_var.set(f"Found {input_count} input videos, {output_count} output videos")
+    
+    def on_library_change(self):
+        """Called from a library thread when a folder's file list changes."""
+        # Tk is not thread-safe, so only queue the notice here
+        self.library_events.put(True)
+    
+    def poll_library_events(self):
+        """Refresh the lists once for any queued library changes, then poll again."""
+        changed = False
+        while True:
+            try:
+                self.library_events.get_nowait()
+            except queue.Empty:
+                break
+            changed = True
+        if changed:
+            self.refresh_video_lists()
+        self.root.after(LIBRARY_POLL_MS, self.poll_library_events)
     
     def play_video(self, listbox):
         selected_idx = listbox.curselection()
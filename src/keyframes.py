@@ -0,0 +1,266 @@
+"""
+Per-source keyframe (GOP) index.
+
+Seeking into a long-GOP video means decoding every frame from the previous
+keyframe up to the requested time. The index records each source's keyframe
+times once, read from packet flags without decoding, and persists them next to
+the probe cache. Samplers can then snap segment starts onto keyframes, and a
+planner can compare the seek cost of candidate starts.
+"""
+
+import os
+import re
+import json
+import bisect
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.probe import get_ffmpeg_binary, get_ffprobe_binary, get_probe_cache
+
+# Bump when the index format changes so stale files are rebuilt
+KEYFRAME_INDEX_VERSION = 2
+
+
+def _keyframes_with_ffprobe(ffprobe, video_path):
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    times = []
+    latest = None
+    reordered = False
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        pts_time, _, flags = line.partition(",")
+        if pts_time in ("", "N/A"):
+            continue
+        pts = float(pts_time)
+        # Packets come in decode order; a smaller pts than one before means B-frames
+        reordered = reordered or (latest is not None and pts < latest)
+        latest = pts if latest is None else max(latest, pts)
+        if "K" in flags:
+            times.append(pts)
+    return times, reordered
+
+
+def _keyframes_with_ffmpeg(ffmpeg, video_path):
+    """List keyframe packets from ffmpeg's framecrc muxer (stream copy, no decode)."""
+    cmd = [ffmpeg, "-v", "error", "-i", video_path, "-map", "0:v:0",
+           "-c", "copy", "-f", "framecrc", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    time_base = 1.0
+    times = []
+    latest = None
+    reordered = False
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        if line.startswith("#tb 0:"):
+            num, _, den = line.split(":", 1)[1].strip().partition("/")
+            time_base = float(num) / float(den)
+            continue
+        if line.startswith("#"):
+            continue
+        fields = [field.strip() for field in line.split(",")]
+        # Packets without the keyframe flag carry an explicit F=0x.. column
+        flags = [field for field in fields if field.startswith("F=")]
+        is_key = not flags or int(flags[0][2:], 16) & 1
+        if len(fields) < 3 or not re.match(r"^-?\d+$", fields[2]):
+            continue
+        pts = int(fields[2])
+        reordered = reordered or (latest is not None and pts < latest)
+        latest = pts if latest is None else max(latest, pts)
+        if is_key:
+            times.append(pts * time_base)
+    return times, reordered
+
+
+class KeyframeIndex:
+    """
+    Sorted keyframe times of one source, with snapping and seek-cost helpers.
+    """
+
+    def __init__(self, keyframes, duration=None, reordered=False):
+        """
+        Initialize the index.
+
+        Args:
+            keyframes: Iterable of keyframe times in seconds
+            duration: Duration of the source in seconds, if known
+            reordered: Whether frames are stored out of presentation order
+                (B-frames), so a stream-copy cut can only end on a keyframe
+        """
+        self.keyframes = sorted(set(round(t, 6) for t in keyframes))
+        if self.keyframes and self.keyframes[0] != 0.0:
+            # Align to the clip timeline, which starts at the first frame
+            offset = self.keyframes[0]
+            self.keyframes = [t - offset for t in self.keyframes]
+        self.duration = duration
+        self.reordered = reordered
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    @classmethod
+    def build(cls, video_path, duration=None):
+        """
+        Read a source's keyframe times from its packet flags.
+
+        Args:
+            video_path: Path to the video file
+            duration: Duration of the source in seconds, if known
+
+        Returns:
+            KeyframeIndex
+        """
+        ffprobe = get_ffprobe_binary()
+        scan = None
+        if ffprobe:
+            try:
+                scan = _keyframes_with_ffprobe(ffprobe, video_path)
+            except Exception as e:
+                print(f"ffprobe keyframe scan failed for {video_path}, falling back to ffmpeg: {e}")
+        if scan is None:
+            scan = _keyframes_with_ffmpeg(get_ffmpeg_binary(), video_path)
+        times, reordered = scan
+        return cls(times, duration, reordered)
+
+    def to_dict(self):
+        return {"version": KEYFRAME_INDEX_VERSION, "duration": self.duration,
+                "keyframes": self.keyframes, "reordered": self.reordered}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["keyframes"], data.get("duration"), data.get("reordered", False))
+
+    def previous_keyframe(self, time):
+        """Return the last keyframe at or before `time` (0.0 if none)."""
+        index = bisect.bisect_right(self.keyframes, time + 1e-6) - 1
+        return self.keyframes[index] if index >= 0 else 0.0
+
+    def next_keyframe(self, time):
+        """Return the first keyframe at or after `time`, or None."""
+        index = bisect.bisect_left(self.keyframes, time - 1e-6)
+        return self.keyframes[index] if index < len(self.keyframes) else None
+
+    def seek_cost(self, time):
+        """
+        Estimate the cost of seeking to `time`.
+
+        Returns:
+            Seconds of footage decoded and thrown away before `time` is
+            reached, i.e. the distance back to the previous keyframe.
+            Sources without an index are assumed to seek for free.
+        """
+        if not self.keyframes:
+            return 0.0
+        return max(0.0, time - self.previous_keyframe(time))
+
+    def snap_start(self, time, low=0.0, high=None):
+        """
+        Snap a start time onto a keyframe inside [low, high].
+
+        The keyframe at or before `time` is preferred; if it falls below `low`
+        the next keyframe is used instead, as long as it does not pass `high`.
+
+        Returns:
+            Snapped time, or `time` unchanged if no keyframe fits the range
+        """
+        if high is None:
+            high = time
+        previous = self.previous_keyframe(time)
+        if self.keyframes and low - 1e-6 <= previous <= high + 1e-6:
+            return max(previous, low)
+        following = self.next_keyframe(max(time, low))
+        if following is not None and following <= high + 1e-6:
+            return following
+        return time
+
+    def rank_by_seek_cost(self, starts):
+        """Return candidate start times ordered from cheapest to most expensive seek."""
+        return sorted(starts, key=self.seek_cost)
+
+
+class KeyframeIndexCache:
+    """
+    On-disk store of keyframe indexes keyed by source content fingerprint.
+    """
+
+    def __init__(self, cache_dir=".clip_cache"):
+        self.cache_dir = cache_dir
+        self.index_dir = os.path.join(cache_dir, "keyframes")
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _index_path(self, fingerprint):
+        return os.path.join(self.index_dir, f"{fingerprint}.json")
+
+    def get(self, video_path):
+        """
+        Return the keyframe index for a source, building and saving it on a miss.
+        """
+        probe_cache = get_probe_cache(self.cache_dir)
+        fingerprint = probe_cache.fingerprint(video_path)
+        with self._lock:
+            index = self._memory.get(fingerprint)
+        if index is not None:
+            return index
+
+        index_path = self._index_path(fingerprint)
+        try:
+            with open(index_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == KEYFRAME_INDEX_VERSION:
+                index = KeyframeIndex.from_dict(data)
+        except (OSError, ValueError):
+            pass
+
+        if index is None:
+            duration = probe_cache.probe(video_path).get("duration")
+            index = KeyframeIndex.build(video_path, duration)
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(index.to_dict(), f)
+                os.replace(tmp_path, index_path)
+            except OSError as e:
+                print(f"Error saving keyframe index for {video_path}: {e}")
+
+        with self._lock:
+            self._memory[fingerprint] = index
+        return index
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_keyframe_index(video_path, cache_dir=".clip_cache"):
+    """
+    Return the persisted keyframe index for a source, building it if needed.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.cache_dir != cache_dir:
+            _default_cache = KeyframeIndexCache(cache_dir)
+        cache = _default_cache
+    return cache.get(video_path)
+
+
+def build_keyframe_indexes(video_paths, cache_dir=".clip_cache", max_workers=4):
+    """
+    Build keyframe indexes for several sources at ingest time.
+
+    Returns:
+        List of KeyframeIndex (None for sources that failed) in input order
+    """
+    def build_one(video_path):
+        try:
+            return get_keyframe_index(video_path, cache_dir)
+        except Exception as e:
+            print(f"Error indexing keyframes of {video_path}: {e}")
+            return None
+
+    video_paths = list(video_paths)
+    if len(video_paths) <= 1 or max_workers <= 1:
+        return [build_one(path) for path in video_paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(video_paths))) as pool:
+        return list(pool.map(build_one, video_paths))
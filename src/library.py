@@ -0,0 +1,407 @@
+"""
+Incremental index of the video files in an input folder.
+
+get_video_files() used to re-glob the folder on every call, which blocks the
+GUI for seconds on network shares holding thousands of clips. VideoLibrary
+scans once, remembers each directory's mtime so later refreshes only re-list
+directories that changed, and can keep itself current with watchdog events so
+that reading the file list costs nothing at all.
+
+Watched libraries also rescan on a timer: inotify and friends do not see
+changes made by other hosts on network shares, and the mtime rescan is cheap
+when nothing changed. The first scan of a watched library can run in the
+background so GUIs never block on a slow share.
+"""
+
+import os
+import threading
+
+from src.probe import get_probe_cache
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Video extensions picked up by default
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+
+# Seconds between mtime rescans of a watched library
+RESCAN_INTERVAL = 30.0
+
+
+class _LibraryEventHandler(FileSystemEventHandler):
+    """Forwards watchdog events to the owning library."""
+
+    def __init__(self, library):
+        super().__init__()
+        self.library = library
+
+    def on_created(self, event):
+        self.library._on_created(event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.library._on_created(event.src_path, False)
+
+    def on_deleted(self, event):
+        self.library._on_deleted(event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        self.library._on_deleted(event.src_path, event.is_directory)
+        self.library._on_created(event.dest_path, event.is_directory)
+
+
+class VideoLibrary:
+    """
+    Cached, optionally watched listing of the videos under a folder.
+    """
+
+    def __init__(self, root, extensions=VIDEO_EXTENSIONS, recursive=False, cache_dir=".clip_cache",
+                 on_change=None, rescan_interval=RESCAN_INTERVAL):
+        """
+        Initialize the library. Nothing is read until refresh() or start().
+
+        Args:
+            root: Folder to index
+            extensions: File extensions (with the dot) counted as videos
+            recursive: Also index subfolders
+            cache_dir: Directory holding the shared probe cache
+            on_change: Optional callable invoked (from the watcher thread)
+                whenever the file list changes
+            rescan_interval: Seconds between mtime rescans while watched
+        """
+        self.root = os.path.abspath(root)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.recursive = recursive
+        self.cache_dir = cache_dir
+        self.rescan_interval = rescan_interval
+        self._listeners = [on_change] if on_change is not None else []
+        self._files = {}
+        self._dirs = {}
+        self._sorted = None
+        self._observer = None
+        self._rescanner = None
+        self._stop_event = None
+        self._users = 0
+        self._scanned = False
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    @property
+    def watching(self):
+        return self._rescanner is not None
+
+    @property
+    def scanned(self):
+        """True once the first scan has finished."""
+        return self._scanned
+
+    def add_listener(self, callback):
+        """
+        Call `callback()` (from a background thread) whenever the file list changes.
+
+        Adding a callback twice needs two remove_listener() calls to remove it.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _is_video(self, path):
+        return path.lower().endswith(self.extensions) and not os.path.basename(path).startswith(".")
+
+    def _changed(self):
+        self._sorted = None
+        with self._lock:
+            listeners = list(dict.fromkeys(self._listeners))
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in library change callback: {e}")
+
+    def _scan_dir(self, directory):
+        """Re-list one directory if its mtime changed. Returns True on changes."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return self._forget_dir(directory)
+        cached = self._dirs.get(directory)
+        if cached is not None and cached[0] == mtime:
+            changed = False
+            subdirs = cached[2]
+        else:
+            files, subdirs = {}, set()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and not entry.name.startswith("."):
+                                subdirs.add(entry.path)
+                        elif self._is_video(entry.name):
+                            stat = entry.stat()
+                            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError as e:
+                print(f"Error scanning {directory}: {e}")
+                return False
+            previous = set(cached[1]) if cached is not None else set()
+            for path in previous - set(files):
+                self._files.pop(path, None)
+            self._files.update(files)
+            changed = previous != set(files)
+            if cached is not None:
+                for gone in cached[2] - subdirs:
+                    changed = self._forget_dir(gone) or changed
+            self._dirs[directory] = (mtime, set(files), subdirs)
+        for subdir in subdirs:
+            changed = self._scan_dir(subdir) or changed
+        return changed
+
+    def _forget_dir(self, directory):
+        prefix = directory.rstrip(os.sep) + os.sep
+        gone_files = [path for path in self._files if path.startswith(prefix)]
+        for path in gone_files:
+            del self._files[path]
+        for path in [d for d in self._dirs if d == directory or d.startswith(prefix)]:
+            del self._dirs[path]
+        return bool(gone_files)
+
+    def refresh(self):
+        """
+        Bring the index up to date, re-listing only directories that changed.
+
+        Returns:
+            True if the file list changed (always True for the first scan)
+        """
+        with self._lock:
+            changed = self._scan_dir(self.root) or not self._scanned
+            self._scanned = True
+        if changed:
+            self._changed()
+        return changed
+
+    def files(self):
+        """Return the sorted list of indexed video paths."""
+        with self._lock:
+            if not self._scanned:
+                self.refresh()
+            if self._sorted is None:
+                self._sorted = sorted(self._files)
+            return list(self._sorted)
+
+    def __len__(self):
+        return len(self.files())
+
+    def metadata(self, video_path, probe=False):
+        """
+        Return cached probe metadata for an indexed file.
+
+        Args:
+            video_path: Path of an indexed video
+            probe: Read the headers if the file has not been probed yet
+
+        Returns:
+            Probe dict (see src.probe), or None if not cached and probe is False
+        """
+        cache = get_probe_cache(self.cache_dir)
+        try:
+            return cache.probe(video_path) if probe else cache.get(video_path)
+        except Exception as e:
+            print(f"Error reading metadata for {video_path}: {e}")
+            return None
+
+    def entries(self):
+        """
+        Return one dict per indexed file with its size, mtime and cached metadata.
+        """
+        with self._lock:
+            if not self._scanned:
+                self.refresh()
+            items = sorted(self._files.items())
+        return [
+            {"path": path, "size": size, "mtime_ns": mtime, "metadata": self.metadata(path)}
+            for path, (size, mtime) in items
+        ]
+
+    def probe_all(self, max_workers=4):
+        """Probe every indexed file, filling the shared metadata cache."""
+        return get_probe_cache(self.cache_dir).probe_many(self.files(), max_workers=max_workers)
+
+    # Watching -----------------------------------------------------------------------
+
+    def start(self, background=False):
+        """
+        Scan the folder and keep the index current.
+
+        Changes are picked up from watchdog events when it is installed, and
+        by an mtime rescan every rescan_interval seconds in any case. Every
+        start() must be paired with a stop(); watching ends with the last one.
+
+        Args:
+            background: Run the first scan on the rescan thread instead of
+                blocking; listeners are called when it finishes
+        """
+        with self._lock:
+            self._users += 1
+            if self._rescanner is not None:
+                return
+            self._stop_event = threading.Event()
+            self._rescanner = threading.Thread(target=self._rescan_loop, args=(self._stop_event,),
+                                               name=f"library-rescan {self.root}", daemon=True)
+        if not background:
+            self.refresh()
+        self._rescanner.start()
+        if Observer is None:
+            return
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(_LibraryEventHandler(self), self.root, recursive=self.recursive)
+        try:
+            observer.start()
+        except Exception as e:
+            print(f"Could not watch {self.root}, relying on rescans: {e}")
+            return
+        with self._lock:
+            if self._rescanner is None:
+                # Stopped while the observer was starting
+                observer.stop()
+                return
+            self._observer = observer
+
+    def stop(self):
+        """Release one start(); the watcher and rescans end with the last one."""
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users:
+                return
+            observer, self._observer = self._observer, None
+            stop_event, self._stop_event = self._stop_event, None
+            self._rescanner = None
+        if stop_event is not None:
+            stop_event.set()
+        if observer is not None:
+            observer.stop()
+            observer.join(timeout=2)
+
+    def _rescan_loop(self, stop_event):
+        if not self._scanned:
+            self._safe_refresh()
+        while not stop_event.wait(self.rescan_interval):
+            self._safe_refresh()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error rescanning {self.root}: {e}")
+
+    def _on_created(self, path, is_directory):
+        with self._lock:
+            if is_directory:
+                if not self.recursive:
+                    return
+                changed = self._scan_dir(os.path.abspath(path))
+            else:
+                if not self._is_video(path):
+                    return
+                if os.path.dirname(os.path.abspath(path)) != self.root and not self.recursive:
+                    return
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    return
+                changed = path not in self._files
+                self._files[path] = (stat.st_size, stat.st_mtime_ns)
+        if changed:
+            self._changed()
+
+    def _on_deleted(self, path, is_directory):
+        with self._lock:
+            if is_directory:
+                changed = self._forget_dir(os.path.abspath(path))
+            else:
+                changed = self._files.pop(path, None) is not None
+        if changed:
+            self._changed()
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def _shared_library(folder, extensions, recursive):
+    key = (os.path.abspath(folder), tuple(extensions), recursive)
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = VideoLibrary(folder, extensions, recursive)
+            _libraries[key] = library
+    return library
+
+
+def get_library(folder, extensions=VIDEO_EXTENSIONS, recursive=False, watch=False):
+    """
+    Return the shared VideoLibrary for a folder, creating it on first use.
+
+    Args:
+        folder: Folder to index
+        extensions: File extensions counted as videos
+        recursive: Also index subfolders
+        watch: Start watching the library (pair with library.stop()) instead
+            of refreshing it once
+
+    Returns:
+        VideoLibrary
+    """
+    library = _shared_library(folder, extensions, recursive)
+    if watch:
+        library.start()
+    else:
+        library.refresh()
+    return library
+
+
+def watch_library(folder, previous=None, on_change=None, extensions=VIDEO_EXTENSIONS,
+                  recursive=False):
+    """
+    Watch a folder's library for a view, releasing the library it replaces.
+
+    The first scan runs in the background, so this never blocks; check
+    library.scanned before reading files() and refresh the view from
+    on_change, which is called from a background thread.
+
+    Args:
+        folder: Folder to index
+        previous: Library the view watched until now, or None; it is
+            stopped unless it is the same library
+        on_change: Optional callable invoked whenever the file list changes
+        extensions: File extensions counted as videos
+        recursive: Also index subfolders
+
+    Returns:
+        VideoLibrary
+    """
+    library = _shared_library(folder, extensions, recursive)
+    if library is previous:
+        return library
+    if on_change is not None:
+        library.add_listener(on_change)
+    library.start(background=True)
+    if previous is not None:
+        if on_change is not None:
+            previous.remove_listener(on_change)
+        previous.stop()
+    return library
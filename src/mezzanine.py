@@ -0,0 +1,172 @@
+"""
+Ingest-time mezzanine transcoding.
+
+Sources arrive with mixed resolutions, frame rates, codecs and rotations, and
+every scramble pays again for scaling, fps conversion and long-GOP seeks. The
+mezzanine cache transcodes each source once into a normalized proxy (fixed
+fps, bounded resolution, rotation applied, short GOP without B-frames) stored
+under its content fingerprint, so later segment extraction and analysis can
+read the cheap proxy instead of the original.
+
+Generation opts in with use_mezzanine (ScramblePlanner, VideoGenerator,
+generate_batch and the apps' proxy setting): the planner swaps each source for
+its proxy, so every later stage decodes the proxy.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from src.probe import get_ffmpeg_binary, get_probe_cache
+
+
+class MezzanineCache:
+    """
+    Content-addressed store of normalized proxy files.
+    """
+
+    def __init__(self, cache_dir=".clip_cache", fps=30, max_dimension=1280, gop=15, crf=18,
+                 preset="veryfast"):
+        """
+        Initialize the mezzanine cache.
+
+        Args:
+            cache_dir: Directory holding the caches
+            fps: Frame rate every proxy is converted to
+            max_dimension: Longest side of a proxy in pixels (never upscaled)
+            gop: Keyframe interval in frames
+            crf: x264 quality of the proxies (lower is better)
+            preset: x264 speed preset used for the one-time transcode
+        """
+        self.cache_dir = cache_dir
+        self.proxy_dir = os.path.join(cache_dir, "mezzanine")
+        os.makedirs(self.proxy_dir, exist_ok=True)
+        self.fps = fps
+        self.max_dimension = max_dimension
+        self.gop = gop
+        self.crf = crf
+        self.preset = preset
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    @property
+    def params_key(self):
+        """Short hash of the normalization settings, part of every proxy name."""
+        params = {"fps": self.fps, "max_dimension": self.max_dimension,
+                  "gop": self.gop, "crf": self.crf}
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+    def proxy_path(self, video_path):
+        """Return where the proxy of a source is (or would be) stored."""
+        fingerprint = get_probe_cache(self.cache_dir).fingerprint(video_path)
+        return os.path.join(self.proxy_dir, f"{fingerprint}_{self.params_key}.mp4")
+
+    def _source_lock(self, proxy_path):
+        with self._locks_lock:
+            return self._locks.setdefault(proxy_path, threading.Lock())
+
+    def _transcode(self, video_path, proxy_path):
+        info = get_probe_cache(self.cache_dir).probe(video_path)
+        size = self.max_dimension
+        # Fit the longer side into max_dimension without upscaling; -2 keeps
+        # the other side even as x264 requires. Rotation is applied by ffmpeg.
+        if info["rotation"] in (90, 270):
+            landscape = info["height"] >= info["width"]
+        else:
+            landscape = info["width"] >= info["height"]
+        if landscape:
+            scale = f"scale='min({size},iw)':-2"
+        else:
+            scale = f"scale=-2:'min({size},ih)'"
+
+        tmp_path = f"{proxy_path}.{os.getpid()}.tmp.mp4"
+        cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+               "-i", video_path, "-map", "0:v:0", "-map", "0:a:0?",
+               "-vf", f"{scale},fps={self.fps},format=yuv420p",
+               "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+               "-tune", "fastdecode", "-g", str(self.gop), "-keyint_min", str(self.gop),
+               "-sc_threshold", "0", "-bf", "0",
+               "-c:a", "aac", "-ar", "44100", "-ac", "2",
+               "-movflags", "+faststart", tmp_path]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            message = result.stderr.decode("utf-8", "replace").strip()
+            raise RuntimeError(f"Mezzanine transcode failed for {video_path}: {message[-500:]}")
+        os.replace(tmp_path, proxy_path)
+
+    def get(self, video_path):
+        """
+        Return the proxy of a source, transcoding it on first use.
+
+        Args:
+            video_path: Path to the source video
+
+        Returns:
+            Path to the normalized proxy
+        """
+        proxy_path = self.proxy_path(video_path)
+        if os.path.exists(proxy_path):
+            return proxy_path
+        with self._source_lock(proxy_path):
+            if not os.path.exists(proxy_path):
+                self._transcode(video_path, proxy_path)
+        return proxy_path
+
+    def resolve(self, video_path):
+        """
+        Return the proxy of a source if it has been ingested, else the source.
+
+        Never transcodes, so it is safe to call on hot paths.
+        """
+        try:
+            proxy_path = self.proxy_path(video_path)
+        except OSError:
+            return video_path
+        return proxy_path if os.path.exists(proxy_path) else video_path
+
+    def ingest(self, video_paths, max_workers=2):
+        """
+        Transcode several sources to proxies.
+
+        Args:
+            video_paths: Source video paths
+            max_workers: Concurrent ffmpeg transcodes (each is multi-threaded)
+
+        Returns:
+            Dict mapping each source to its proxy, or to itself if the
+            transcode failed
+        """
+        def ingest_one(video_path):
+            try:
+                return self.get(video_path)
+            except Exception as e:
+                print(f"Error creating mezzanine for {video_path}: {e}")
+                return video_path
+
+        video_paths = list(video_paths)
+        if len(video_paths) <= 1 or max_workers <= 1:
+            proxies = [ingest_one(path) for path in video_paths]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(video_paths))) as pool:
+                proxies = list(pool.map(ingest_one, video_paths))
+        return dict(zip(video_paths, proxies))
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_mezzanine_cache(cache_dir=".clip_cache"):
+    """
+    Return the process-wide mezzanine cache, creating it on first use.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.cache_dir != cache_dir:
+            _default_cache = MezzanineCache(cache_dir)
+        return _default_cache
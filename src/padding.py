@@ -0,0 +1,140 @@
+"""
+Letterboxing onto a preallocated canvas.
+
+clip.margin() builds a brand-new padded array for every frame. The padder here
+allocates one canvas per clip, paints the fill once and then only copies each
+decoded frame into the canvas window, so the per-frame cost is a single copy
+(plus a small downscaled blur when the background is blurred). The same
+geometry can also be expressed as an ffmpeg filtergraph for renderers that let
+ffmpeg do the padding.
+"""
+
+import numpy as np
+import cv2
+
+# Background fill modes
+FILL_BLUR = "blur"
+
+
+def padded_size(width, height, target_ratio=(9, 16)):
+    """
+    Return the canvas size that fits a frame into the target aspect ratio.
+
+    The frame keeps its resolution; bars are added to the top and bottom of
+    frames wider than the target, or to the sides of frames narrower than it.
+
+    Args:
+        width: Frame width in pixels
+        height: Frame height in pixels
+        target_ratio: (width, height) aspect ratio to pad to
+
+    Returns:
+        (canvas_width, canvas_height, x_offset, y_offset)
+    """
+    target_aspect = target_ratio[0] / target_ratio[1]
+    if width / height > target_aspect:
+        # Same rounding as clip.margin(top=int(padding), bottom=int(padding))
+        padding = int((width / target_aspect - height) / 2)
+        return width, height + 2 * padding, 0, padding
+    padding = int((height * target_aspect - width) / 2)
+    return width + 2 * padding, height, padding, 0
+
+
+class LetterboxPadder:
+    """
+    Writes frames into a reused canvas of the target aspect ratio.
+
+    Calling the padder with a frame returns the canvas itself, so the result
+    is only valid until the next call. MoviePy's writer and compositor consume
+    each frame before requesting the next one; copy the result if it has to
+    be kept.
+    """
+
+    def __init__(self, width, height, target_ratio=(9, 16), fill=(0, 0, 0), blur_scale=0.1):
+        """
+        Initialize the padder for frames of one size.
+
+        Args:
+            width: Width of the incoming frames
+            height: Height of the incoming frames
+            target_ratio: (width, height) aspect ratio to pad to
+            fill: RGB tuple for solid bars, or "blur" to fill the bars with a
+                blurred, enlarged copy of the frame
+            blur_scale: Resolution factor the blurred background is computed at
+        """
+        self.width, self.height = width, height
+        canvas_w, canvas_h, self.x, self.y = padded_size(width, height, target_ratio)
+        self.size = (canvas_w, canvas_h)
+        self.fill = fill
+        self.canvas = np.empty((canvas_h, canvas_w, 3), dtype=np.uint8)
+        self._window = self.canvas[self.y:self.y + height, self.x:self.x + width]
+
+        if fill == FILL_BLUR:
+            # Scale that makes the frame cover the canvas, then shrink for the blur
+            cover = max(canvas_w / width, canvas_h / height)
+            small_w = max(1, int(canvas_w * blur_scale))
+            small_h = max(1, int(canvas_h * blur_scale))
+            self._cover_size = (int(round(width * cover)), int(round(height * cover)))
+            self._small_canvas = (small_w, small_h)
+            self._small_source = (max(1, int(self._cover_size[0] * blur_scale)),
+                                  max(1, int(self._cover_size[1] * blur_scale)))
+            self._blur_kernel = max(3, (min(small_w, small_h) // 8) | 1)
+        else:
+            self.canvas[:] = np.asarray(fill, dtype=np.uint8)
+
+    @property
+    def needs_padding(self):
+        return self.size != (self.width, self.height)
+
+    def _paint_blurred_background(self, frame):
+        small = cv2.resize(frame, self._small_source, interpolation=cv2.INTER_AREA)
+        # Center-crop the shrunken cover image to the shrunken canvas
+        sw, sh = self._small_canvas
+        ox = max(0, (small.shape[1] - sw) // 2)
+        oy = max(0, (small.shape[0] - sh) // 2)
+        small = small[oy:oy + sh, ox:ox + sw]
+        small = cv2.GaussianBlur(small, (self._blur_kernel, self._blur_kernel), 0)
+        cv2.resize(small, self.size, dst=self.canvas, interpolation=cv2.INTER_LINEAR)
+
+    def __call__(self, frame):
+        """
+        Pad one frame.
+
+        Args:
+            frame: HxWx3 array of the size given to the constructor
+
+        Returns:
+            The shared canvas with the frame written into it
+        """
+        if self.fill == FILL_BLUR:
+            self._paint_blurred_background(frame)
+        self._window[...] = frame
+        return self.canvas
+
+
+def ffmpeg_pad_filter(width, height, target_ratio=(9, 16), fill=(0, 0, 0),
+                      input_label="0:v", output_label="padded"):
+    """
+    Express the same padding as an ffmpeg filtergraph fragment.
+
+    Args:
+        width: Input frame width
+        height: Input frame height
+        target_ratio: (width, height) aspect ratio to pad to
+        fill: RGB tuple or "blur", as for LetterboxPadder
+        input_label: Filtergraph label of the input stream
+        output_label: Label given to the padded stream
+
+    Returns:
+        str usable inside -filter_complex
+    """
+    canvas_w, canvas_h, x, y = padded_size(width, height, target_ratio)
+    if fill == FILL_BLUR:
+        return (
+            f"[{input_label}]split=2[{output_label}_bg][{output_label}_fg];"
+            f"[{output_label}_bg]scale={canvas_w}:{canvas_h}:force_original_aspect_ratio=increase,"
+            f"crop={canvas_w}:{canvas_h},boxblur=20:2[{output_label}_blur];"
+            f"[{output_label}_blur][{output_label}_fg]overlay={x}:{y}[{output_label}]"
+        )
+    color = "0x{:02x}{:02x}{:02x}".format(*fill)
+    return f"[{input_label}]pad={canvas_w}:{canvas_h}:{x}:{y}:color={color}[{output_label}]"
@@ -0,0 +1,490 @@
+"""
+Deterministic scramble planning.
+
+A ScramblePlan is a plain, JSON-serializable description of one output video:
+which sources are used, the in/out point, speed and fades of every segment,
+the text overlay and the audio track with its offset. ScramblePlanner builds
+plans from an explicit seed without touching the global `random` state, and
+src.renderer turns a plan into pixels. Because a plan fully determines its
+render, plan_hash() can be used to cache, dedupe, distribute and exactly
+reproduce renders without re-running segment selection or analysis.
+"""
+
+import os
+import json
+import math
+import random
+import hashlib
+
+from src.allocator import SegmentAllocator
+from src.keyframes import build_keyframe_indexes, get_keyframe_index
+from src.mezzanine import get_mezzanine_cache
+from src.profiles import get_profile
+from src.probe import get_probe_cache
+from src.stream_copy import is_stream_copy_eligible, shares_signature
+from src.shots import merge_short_shots
+
+# Bump when the plan layout changes
+PLAN_VERSION = 1
+
+# Output length used when neither a duration nor an audio track is given
+DEFAULT_OUTPUT_DURATION = 15.0
+
+# Same rule as prepare_clip_for_concat: shorter segments get no effects
+MIN_EFFECT_DURATION = 1.5
+
+
+def derive_seed(seed, *parts):
+    """
+    Derive a child seed from a parent seed and any identifying parts.
+
+    Used to give every output of a batch (and every worker) its own
+    reproducible random stream.
+    """
+    text = json.dumps([seed] + [str(part) for part in parts])
+    return int(hashlib.sha256(text.encode()).hexdigest()[:16], 16)
+
+
+def _rounded(value):
+    return round(float(value), 6)
+
+
+class ScramblePlan:
+    """
+    Serializable description of a single scrambled output.
+    """
+
+    def __init__(self, seed, sources, segments, settings=None, text=None, audio=None,
+                 warnings=None):
+        """
+        Initialize a plan.
+
+        Args:
+            seed: Seed the plan was generated from
+            sources: List of {"path", "fingerprint", "duration", "width",
+                "height"} dicts, with "original" set when "path" is the
+                mezzanine proxy of that file
+            segments: List of {"source", "start", "end", "speed", "fade_in",
+                "fade_out"} dicts in playback order; "source" indexes sources
+            settings: Render settings such as target_ratio, pad_fill and fps
+            text: Text overlay parameters, or None
+            audio: {"path", "fingerprint", "offset"} dict, or None
+            warnings: Messages about compromises made while planning, such
+                as reusing footage once the sources ran out
+        """
+        self.seed = seed
+        self.sources = sources
+        self.segments = segments
+        self.settings = settings or {}
+        self.text = text
+        self.audio = audio
+        self.warnings = list(warnings or [])
+
+    def to_dict(self):
+        data = {
+            "version": PLAN_VERSION,
+            "seed": self.seed,
+            "sources": self.sources,
+            "segments": self.segments,
+            "settings": self.settings,
+            "text": self.text,
+            "audio": self.audio,
+        }
+        if self.warnings:
+            data["warnings"] = self.warnings
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version: {data.get('version')}")
+        return cls(data["seed"], data["sources"], data["segments"],
+                   data.get("settings"), data.get("text"), data.get("audio"),
+                   data.get("warnings"))
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json(indent=2))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_json(f.read())
+
+    def plan_hash(self, profile=None):
+        """
+        Hash of everything that affects the rendered pixels and audio.
+
+        Sources and audio are identified by content fingerprint rather than
+        path, so the same plan over re-uploaded copies hashes identically.
+        The seed is left out: two seeds producing the same cuts render the
+        same video.
+
+        Args:
+            profile: Render profile name or RenderProfile the plan is
+                rendered with; its settings become part of the hash, so
+                draft and final renders of one plan never share a key
+        """
+        canonical = {
+            "sources": [source.get("fingerprint") or source["path"] for source in self.sources],
+            "segments": [
+                {key: _rounded(value) if isinstance(value, float) else value
+                 for key, value in segment.items()}
+                for segment in self.segments
+            ],
+            "settings": self.settings,
+            "text": self.text,
+            "audio": None if self.audio is None else {
+                "source": self.audio.get("fingerprint") or self.audio["path"],
+                "offset": _rounded(self.audio.get("offset", 0.0)),
+            },
+        }
+        if profile is not None:
+            canonical["profile"] = vars(get_profile(profile))
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+    @property
+    def duration(self):
+        """Length of the rendered video in seconds."""
+        return sum((seg["end"] - seg["start"]) / seg.get("speed", 1.0) for seg in self.segments)
+
+    def segment_tuples(self):
+        """Return (video_path, start_time, end_time) tuples in playback order."""
+        return [(self.sources[seg["source"]]["path"], seg["start"], seg["end"])
+                for seg in self.segments]
+
+    @property
+    def has_effects(self):
+        return any(seg.get("speed", 1.0) != 1.0 or seg.get("fade_in") or seg.get("fade_out")
+                   for seg in self.segments)
+
+    @property
+    def needs_padding(self):
+        """True if any used source is landscape and padding is enabled."""
+        if not self.settings.get("target_ratio"):
+            return False
+        used = {seg["source"] for seg in self.segments}
+        return any(self.sources[i]["width"] > self.sources[i]["height"] for i in used)
+
+    def output_name(self, prefix="scramble", profile=None):
+        """File name derived from the plan hash and render profile, for render caching."""
+        name = f"{prefix}_{self.plan_hash(profile)[:12]}"
+        if profile is not None:
+            name += f"_{get_profile(profile).name}"
+        return f"{name}.mp4"
+
+
+class ScramblePlanner:
+    """
+    Builds ScramblePlans from an explicit seed.
+
+    Segment usage is tracked in one SegmentAllocator per source for the
+    lifetime of the planner, so consecutive plans avoid reusing footage
+    until a source runs out of unused segments.
+
+    Plans the renderer will stream copy always start their segments on
+    keyframes, because a stream-copy cut can only begin at one; the planned,
+    reserved and rendered footage then agree.
+
+    With use_mezzanine, every source is replaced by its mezzanine proxy (see
+    src.mezzanine) before planning, so selection, analysis and rendering all
+    decode the normalized proxies.
+    """
+
+    def __init__(self, seed=None, analyzer=None, snap_to_keyframes=False, cache_dir=".clip_cache",
+                 within_shots=False, analysis_budget=None, use_mezzanine=False):
+        """
+        Initialize the planner.
+
+        Args:
+            seed: Seed for all random choices; a random one is drawn and
+                recorded in the plans when None
+            analyzer: Optional VideoContentAnalyzer used for AI segment selection
+            snap_to_keyframes: Start segments on source keyframes even when
+                the plan will be re-encoded
+            cache_dir: Directory holding the probe and keyframe caches
+            within_shots: Keep segments inside single shots, using the
+                analyzer's shot boundaries (ignored without an analyzer)
+            analysis_budget: Optional time limit in seconds for each
+                analyzer call; segments it has no time to find are drawn
+                at random, and plan.warnings says when it ran out
+            use_mezzanine: Plan on mezzanine proxies of the sources,
+                transcoding each source once on first use
+        """
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.analyzer = analyzer
+        self.snap_to_keyframes = snap_to_keyframes
+        self.cache_dir = cache_dir
+        self.within_shots = within_shots
+        self.analysis_budget = analysis_budget
+        self.use_mezzanine = use_mezzanine
+        self.allocators = {}
+        self._proxies = {}
+        self._indexed = set()
+        self._plans_made = 0
+
+    def _describe_source(self, video_path):
+        original = video_path
+        if self.use_mezzanine:
+            if video_path not in self._proxies:
+                self._proxies.update(get_mezzanine_cache(self.cache_dir).ingest([video_path]))
+            video_path = self._proxies[video_path]
+        info = get_probe_cache(self.cache_dir).probe(video_path)
+        width, height = info["width"], info["height"]
+        if info.get("rotation") in (90, 270):
+            width, height = height, width
+        source = {"path": video_path, "fingerprint": info.get("fingerprint"),
+                  "duration": info["duration"], "width": width, "height": height}
+        if video_path != original:
+            source["original"] = original
+        return source
+
+    def ingest(self, video_paths):
+        """Transcode the mezzanine proxies of new sources up front, in parallel."""
+        if self.use_mezzanine:
+            missing = [path for path in video_paths if path not in self._proxies]
+            if missing:
+                self._proxies.update(get_mezzanine_cache(self.cache_dir).ingest(missing))
+
+    def _will_stream_copy(self, sources, segment_duration, add_transitions, target_ratio,
+                          text_overlay):
+        """
+        Return True if plan() arguments lead to a plan the renderer stream copies.
+
+        Sources with B-frames are left to the re-encoding renderers: snapped
+        segments start on keyframes but end between them, where a copied cut
+        cannot stop exactly.
+        """
+        probe_cache = get_probe_cache(self.cache_dir)
+        if not (is_stream_copy_eligible(
+            add_transitions=add_transitions and segment_duration >= MIN_EFFECT_DURATION,
+            pad_to_ratio=bool(target_ratio) and any(s["width"] > s["height"] for s in sources),
+            text_overlay=text_overlay,
+        ) and shares_signature([probe_cache.probe(source["path"]) for source in sources])):
+            return False
+        self._index_keyframes(sources)
+        return not any(get_keyframe_index(source["path"], self.cache_dir).reordered
+                       for source in sources)
+
+    def _index_keyframes(self, sources):
+        """Build the keyframe indexes of sources new to this planner, in parallel."""
+        paths = [source["path"] for source in sources if source["path"] not in self._indexed]
+        if paths:
+            build_keyframe_indexes(paths, self.cache_dir)
+            self._indexed.update(paths)
+
+    def _allocator(self, source, segment_duration=None):
+        allocator = self.allocators.get(source["path"])
+        if allocator is None:
+            allocator = SegmentAllocator(source["duration"])
+            if self.within_shots and self.analyzer is not None and segment_duration:
+                boundaries = self.analyzer.get_shot_boundaries(source["path"])
+                allocator.split_at(merge_short_shots(boundaries, source["duration"], segment_duration))
+            self.allocators[source["path"]] = allocator
+        return allocator
+
+    def _cheapest_segment(self, allocator, keyframes, segment_duration, rng):
+        """
+        Reserve the free segment that is cheapest to seek to, or return None.
+
+        Each free range contributes its earliest start, snapped onto a
+        keyframe when one fits; ties are broken at random.
+        """
+        starts = [keyframes.snap_start(start, start, end - segment_duration)
+                  for start, end in allocator.free_ranges(segment_duration)]
+        if not starts:
+            return None
+        rng.shuffle(starts)
+        start = keyframes.rank_by_seek_cost(starts)[0]
+        allocator.reserve(start, start + segment_duration)
+        return start, start + segment_duration
+
+    def _random_segments(self, sources, count, segment_duration, rng, snap=False,
+                         keyframes_only=False, warnings=None):
+        """
+        Draw segments from random sources, skipping exhausted ones.
+
+        When every source is exhausted, footage is reused and a message is
+        appended to `warnings`; so is a message when `keyframes_only` could
+        not be honoured.
+        """
+        picks = []
+        off_keyframe = 0
+        candidates = [i for i, source in enumerate(sources) if source["duration"] > 0]
+        while len(picks) < count and candidates:
+            index = rng.choice(candidates)
+            source = sources[index]
+            if source["duration"] <= segment_duration:
+                picks.append((index, 0.0, source["duration"]))
+                continue
+            keyframes = None
+            if snap:
+                keyframes = get_keyframe_index(source["path"], self.cache_dir)
+            allocator = self._allocator(source, segment_duration)
+            segment = allocator.allocate_one(segment_duration, rng, keyframes, keyframes_only)
+            if segment is None and keyframes_only:
+                # Out of keyframe starts: use the rest of the footage, at the cost
+                # of re-encoding this plan instead of stream copying it
+                segment = self._cheapest_segment(allocator, keyframes, segment_duration, rng)
+                if segment is not None and keyframes.seek_cost(segment[0]) > 0.0:
+                    off_keyframe += 1
+            if segment is None:
+                candidates.remove(index)
+                continue
+            picks.append((index, segment[0], segment[1]))
+
+        if off_keyframe:
+            message = (f"{off_keyframe} of {count} segments could not start on a keyframe; "
+                       f"the output is re-encoded instead of stream copied")
+            print(message)
+            if warnings is not None:
+                warnings.append(message)
+
+        if len(picks) < count:
+            # Every source is exhausted; reuse footage rather than come up short
+            message = (f"Source footage ran out after {len(picks)} of {count} segments; "
+                       f"the remaining {count - len(picks)} reuse footage")
+            print(message)
+            if warnings is not None:
+                warnings.append(message)
+            usable = [i for i, source in enumerate(sources) if source["duration"] > 0]
+            while len(picks) < count and usable:
+                index = rng.choice(usable)
+                length = min(segment_duration, sources[index]["duration"])
+                start = rng.uniform(0, sources[index]["duration"] - length)
+                if snap:
+                    keyframes = get_keyframe_index(sources[index]["path"], self.cache_dir)
+                    start = keyframes.snap_start(start, 0.0, sources[index]["duration"] - length)
+                picks.append((index, start, start + length))
+        return picks
+
+    def _analyzed_segments(self, sources, count, segment_duration, rng, batch_id, snap=False,
+                           keyframes_only=False, warnings=None):
+        """Let the analyzer choose segments, topping up with random ones."""
+        used = []
+        for source in sources:
+            allocator = self.allocators.get(source["path"])
+            if allocator is not None:
+                used.extend((source["path"], start, end) for start, end in allocator.used_ranges())
+        best = self.analyzer.find_best_clips(
+            [source["path"] for source in sources], num_clips=count,
+            clip_duration=segment_duration, used_segments=used, batch_id=batch_id,
+            snap_to_keyframes=snap, rng=rng, within_shots=self.within_shots,
+            budget=self.analysis_budget)
+        stats = self.analyzer.last_run_stats
+        if warnings is not None and stats.get("budget_exhausted"):
+            warnings.append(
+                f"Analysis time limit of {stats['budget']:g}s ran out after scoring "
+                f"{stats['sources_scored']} of {stats['sources']} sources "
+                f"({stats['seconds_covered']:.0f}s of footage)")
+        index_of = {source["path"]: i for i, source in enumerate(sources)}
+        picks = []
+        for video_path, start, end, _ in best:
+            self._allocator(sources[index_of[video_path]], segment_duration).reserve(start, end)
+            picks.append((index_of[video_path], start, end))
+        rng.shuffle(picks)
+        if len(picks) < count:
+            picks.extend(self._random_segments(sources, count - len(picks), segment_duration, rng,
+                                               snap, keyframes_only, warnings))
+        return picks
+
+    def plan(self, video_paths, segment_duration=0.5, num_segments=None, total_duration=None,
+             add_transitions=True, target_ratio=(9, 16), pad_fill=(0, 0, 0), text_overlay=None,
+             audio_path=None, use_ai=False, batch_id=None, fps=30, seed=None):
+        """
+        Plan one scrambled output.
+
+        Args:
+            video_paths: Source video paths
+            segment_duration: Length of each segment in seconds
+            num_segments: Number of segments; derived from total_duration when None
+            total_duration: Target output length; defaults to the audio track's
+                length, or DEFAULT_OUTPUT_DURATION without audio
+            add_transitions: Apply the prepare_clip_for_concat fade and speed jitter
+            target_ratio: Aspect ratio landscape sources are padded to, or None
+            pad_fill: RGB fill or "blur" for the padding
+            text_overlay: Text overlay parameters (as built by streamlit_app.py)
+            audio_path: Optional audio track
+            use_ai: Select segments with the analyzer instead of at random
+            batch_id: Batch ID passed to the analyzer for cross-output diversity
+            fps: Output frame rate
+            seed: Seed for this plan; derived from the planner seed when None
+
+        Returns:
+            ScramblePlan; plan.warnings says when footage had to be reused
+        """
+        if seed is None:
+            seed = derive_seed(self.seed, self._plans_made)
+        self._plans_made += 1
+        rng = random.Random(seed)
+
+        self.ingest(video_paths)
+        sources = [self._describe_source(path) for path in video_paths]
+        audio = None
+        audio_duration = None
+        if audio_path:
+            audio_info = get_probe_cache(self.cache_dir).probe(audio_path)
+            audio_duration = audio_info["duration"]
+            audio = {"path": audio_path, "fingerprint": audio_info.get("fingerprint"), "offset": 0.0}
+
+        if num_segments is None:
+            if total_duration is None:
+                total_duration = audio_duration or DEFAULT_OUTPUT_DURATION
+            num_segments = max(1, int(math.ceil(total_duration / segment_duration)))
+
+        stream_copy = self._will_stream_copy(sources, segment_duration, add_transitions,
+                                             target_ratio, text_overlay)
+        snap = self.snap_to_keyframes or stream_copy
+        if snap:
+            self._index_keyframes(sources)
+        warnings = []
+        if use_ai and self.analyzer is not None:
+            picks = self._analyzed_segments(sources, num_segments, segment_duration, rng, batch_id,
+                                            snap, stream_copy, warnings)
+        else:
+            picks = self._random_segments(sources, num_segments, segment_duration, rng,
+                                          snap, stream_copy, warnings)
+
+        segments = []
+        for index, start, end in picks:
+            segment = {"source": index, "start": start, "end": end,
+                       "speed": 1.0, "fade_in": 0.0, "fade_out": 0.0}
+            if add_transitions and end - start >= MIN_EFFECT_DURATION:
+                segment["speed"] = rng.uniform(0.95, 1.05)
+                segment["fade_out"] = 0.3
+            segments.append(segment)
+
+        plan = ScramblePlan(
+            seed, sources, segments,
+            settings={"target_ratio": list(target_ratio) if target_ratio else None,
+                      "pad_fill": pad_fill if pad_fill == "blur" else list(pad_fill),
+                      "fps": fps},
+            text=dict(text_overlay) if text_overlay else None,
+            audio=audio,
+            warnings=warnings,
+        )
+        if audio is not None and audio_duration and audio_duration > plan.duration:
+            # Start the track somewhere random when it is longer than the video
+            audio["offset"] = rng.uniform(0, audio_duration - plan.duration)
+        return plan
+
+    def plan_batch(self, num_videos, video_paths, **kwargs):
+        """
+        Plan several outputs that avoid reusing each other's footage.
+
+        Args:
+            num_videos: Number of outputs
+            video_paths: Source video paths
+            **kwargs: Passed to plan()
+
+        Returns:
+            List of ScramblePlan, reproducible from the planner seed
+        """
+        return [self.plan(video_paths, **kwargs) for _ in range(num_videos)]
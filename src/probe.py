@@ -0,0 +1,396 @@
+"""
+Header-only media probing with a persistent on-disk metadata cache.
+
+Reading a duration through VideoFileClip starts an ffmpeg reader and decodes
+the first frame. The functions here only ask ffprobe (or `ffmpeg -i` when
+ffprobe is not installed) to parse the container headers, and remember the
+result on disk so the same file is never probed twice.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Bump when the shape of the probe result changes so stale entries are ignored
+PROBE_VERSION = 1
+
+# Bytes read from the head and tail of a file to build its content fingerprint
+FINGERPRINT_CHUNK = 64 * 1024
+
+# Most entries kept in the probe cache file; the oldest probes are dropped first
+MAX_PROBE_ENTRIES = 5000
+
+
+def get_ffmpeg_binary():
+    """
+    Return the ffmpeg executable MoviePy is configured to use.
+    """
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except Exception:
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def get_ffprobe_binary():
+    """
+    Return the ffprobe executable, or None if it is not installed.
+
+    imageio-ffmpeg only ships ffmpeg, so ffprobe is looked up next to the
+    configured ffmpeg binary first and then on the PATH.
+    """
+    ffmpeg = get_ffmpeg_binary()
+    candidate = os.path.join(os.path.dirname(ffmpeg), "ffprobe")
+    if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+        return candidate
+    return shutil.which("ffprobe")
+
+
+def file_fingerprint(path):
+    """
+    Build a cheap content fingerprint for a file.
+
+    The fingerprint hashes the file size with its first and last
+    FINGERPRINT_CHUNK bytes, so it survives renames and copies (e.g. the
+    per-rerun temp directories Streamlit uploads are written to) without
+    reading whole videos.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        str: Hex digest identifying the file contents
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if size > 2 * FINGERPRINT_CHUNK:
+            f.seek(-FINGERPRINT_CHUNK, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+
+def _parse_rate(rate):
+    """Parse an ffprobe rational like '30000/1001' into a float."""
+    try:
+        num, _, den = str(rate).partition("/")
+        return float(num) / float(den) if den else float(num)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _probe_with_ffprobe(ffprobe, path):
+    """Read stream headers with ffprobe's JSON output."""
+    cmd = [ffprobe, "-v", "error", "-print_format", "json",
+           "-show_format", "-show_streams", path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    data = json.loads(result.stdout.decode("utf-8", "replace"))
+
+    info = _empty_info()
+    info["duration"] = float(data.get("format", {}).get("duration") or 0)
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info["video_codec"] is None:
+            info["video_codec"] = stream.get("codec_name")
+            info["pix_fmt"] = stream.get("pix_fmt")
+            info["width"] = int(stream.get("width") or 0)
+            info["height"] = int(stream.get("height") or 0)
+            info["fps"] = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+            rotation = stream.get("tags", {}).get("rotate")
+            for side_data in stream.get("side_data_list", []):
+                if "rotation" in side_data:
+                    rotation = side_data["rotation"]
+            info["rotation"] = int(float(rotation or 0)) % 360
+            if not info["duration"]:
+                info["duration"] = float(stream.get("duration") or 0)
+        elif stream.get("codec_type") == "audio" and not info["has_audio"]:
+            info["has_audio"] = True
+            info["audio_codec"] = stream.get("codec_name")
+            info["audio_fps"] = int(stream.get("sample_rate") or 0)
+    return info
+
+
+def _probe_with_ffmpeg(ffmpeg, path):
+    """Read stream headers from the banner `ffmpeg -i` prints to stderr."""
+    cmd = [ffmpeg, "-hide_banner", "-i", path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    text = result.stderr.decode("utf-8", "replace")
+    if "Stream #" not in text:
+        raise IOError(f"ffmpeg could not read {path}: {text.strip().splitlines()[-1:]}")
+
+    info = _empty_info()
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    video_line = re.search(r"Stream #.*?Video:\s*(.*)", text)
+    if video_line:
+        line = video_line.group(1)
+        info["video_codec"] = line.split()[0].strip(",")
+        pix_fmt = re.search(r",\s*([a-z0-9_]+)(?:\(|,)", line)
+        if pix_fmt:
+            info["pix_fmt"] = pix_fmt.group(1)
+        size = re.search(r"\s(\d{2,5})x(\d{2,5})[\s,]", line)
+        if size:
+            info["width"], info["height"] = int(size.group(1)), int(size.group(2))
+        fps = re.search(r"([\d.]+)\s*(?:fps|tbr)", line)
+        if fps:
+            info["fps"] = float(fps.group(1))
+
+    rotation = re.search(r"rotate\s*:\s*(-?\d+)", text) or re.search(r"rotation of (-?[\d.]+) degrees", text)
+    if rotation:
+        info["rotation"] = int(float(rotation.group(1))) % 360
+
+    audio_line = re.search(r"Stream #.*?Audio:\s*(.*)", text)
+    if audio_line:
+        line = audio_line.group(1)
+        info["has_audio"] = True
+        info["audio_codec"] = line.split()[0].strip(",")
+        rate = re.search(r"(\d+)\s*Hz", line)
+        if rate:
+            info["audio_fps"] = int(rate.group(1))
+    return info
+
+
+def _empty_info():
+    return {
+        "duration": 0.0,
+        "fps": 0.0,
+        "width": 0,
+        "height": 0,
+        "rotation": 0,
+        "video_codec": None,
+        "pix_fmt": None,
+        "has_audio": False,
+        "audio_codec": None,
+        "audio_fps": 0,
+    }
+
+
+def read_media_headers(path):
+    """
+    Probe a media file from its container headers without decoding frames.
+
+    Args:
+        path: Path to the media file
+
+    Returns:
+        dict with duration, fps, width, height, rotation, video_codec,
+        pix_fmt, has_audio, audio_codec and audio_fps
+    """
+    ffprobe = get_ffprobe_binary()
+    if ffprobe:
+        try:
+            return _probe_with_ffprobe(ffprobe, path)
+        except Exception as e:
+            print(f"ffprobe failed for {path}, falling back to ffmpeg: {e}")
+    return _probe_with_ffmpeg(get_ffmpeg_binary(), path)
+
+
+def display_size(info):
+    """
+    Return the (width, height) a probed video is displayed at, after rotation.
+    """
+    if info.get("rotation") in (90, 270):
+        return info["height"], info["width"]
+    return info["width"], info["height"]
+
+
+class MediaProbeCache:
+    """
+    Persistent cache of probe results keyed by file content fingerprint.
+
+    Fingerprints are memoized per (path, size, mtime) so repeated lookups of
+    an unchanged file never re-read it. The cache is a single JSON file
+    inside cache_dir and is safe to share between threads. It is only
+    rewritten when new probes were added, and saves merge with the file on
+    disk so processes sharing cache_dir keep each other's entries.
+    """
+
+    def __init__(self, cache_dir=".clip_cache", filename="probe_cache.json",
+                 max_entries=MAX_PROBE_ENTRIES):
+        """
+        Initialize the probe cache.
+
+        Args:
+            cache_dir: Directory to store the cache file in
+            filename: Name of the JSON cache file
+            max_entries: Most entries kept on disk; the oldest are pruned
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, filename)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self._dirty = set()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == PROBE_VERSION:
+                return data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _prune(self, entries):
+        """Drop the oldest probes beyond max_entries."""
+        if len(entries) <= self.max_entries:
+            return entries
+        newest = sorted(entries.items(), key=lambda item: item[1].get("probed_at", 0),
+                        reverse=True)
+        return dict(newest[:self.max_entries])
+
+    def save(self):
+        """
+        Write new entries to disk, merged with what other processes saved.
+
+        Does nothing when no probe was added since the last save. The file is
+        replaced atomically through a temp file.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty = {key: self._entries[key] for key in self._dirty}
+            self._dirty = set()
+        entries = self._load()
+        entries.update(dirty)
+        entries = self._prune(entries)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"version": PROBE_VERSION, "entries": entries}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Error saving probe cache: {e}")
+            with self._lock:
+                self._dirty.update(dirty)
+            return
+        with self._lock:
+            # Keep entries probed while saving; pick up other processes' probes
+            entries.update({key: self._entries[key] for key in self._dirty})
+            self._entries = entries
+
+    def fingerprint(self, path):
+        """
+        Return the content fingerprint of a file, memoized by (path, size, mtime).
+        """
+        stat = os.stat(path)
+        stat_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._fingerprints.get(stat_key)
+        if cached is None:
+            cached = file_fingerprint(path)
+            with self._lock:
+                self._fingerprints[stat_key] = cached
+        return cached
+
+    def get(self, path):
+        """Return the cached probe result for a file, or None."""
+        key = self.fingerprint(path)
+        with self._lock:
+            entry = self._entries.get(key)
+        return dict(entry) if entry is not None else None
+
+    def probe(self, path, persist=True):
+        """
+        Probe a file, reading headers only on a cache miss.
+
+        Args:
+            path: Path to the media file
+            persist: Write the cache to disk after a miss
+
+        Returns:
+            dict of probe metadata (see read_media_headers)
+        """
+        key = self.fingerprint(path)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return dict(entry)
+
+        info = read_media_headers(path)
+        info["fingerprint"] = key
+        info["probed_at"] = time.time()
+        with self._lock:
+            self._entries[key] = info
+            self._dirty.add(key)
+        if persist:
+            self.save()
+        return dict(info)
+
+    def probe_many(self, paths, max_workers=4):
+        """
+        Probe several files, running cache misses in parallel.
+
+        Args:
+            paths: List of media file paths
+            max_workers: Maximum number of concurrent probe subprocesses
+
+        Returns:
+            List of probe dicts in the same order as paths (None for
+            files that could not be probed)
+        """
+        def probe_one(path):
+            try:
+                return self.probe(path, persist=False)
+            except Exception as e:
+                print(f"Error probing {path}: {e}")
+                return None
+
+        if len(paths) <= 1 or max_workers <= 1:
+            results = [probe_one(path) for path in paths]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+                results = list(pool.map(probe_one, paths))
+        self.save()
+        return results
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_probe_cache(cache_dir=".clip_cache"):
+    """
+    Return the process-wide probe cache, creating it on first use.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.cache_dir != cache_dir:
+            _default_cache = MediaProbeCache(cache_dir)
+        return _default_cache
+
+
+def probe_video(video_path, cache_dir=".clip_cache"):
+    """
+    Probe a video's header metadata through the shared on-disk cache.
+
+    Args:
+        video_path: Path to the video file
+        cache_dir: Directory holding the probe cache
+
+    Returns:
+        dict of probe metadata (see read_media_headers)
+    """
+    return get_probe_cache(cache_dir).probe(video_path)
+
+
+def probe_videos(video_paths, cache_dir=".clip_cache", max_workers=4):
+    """
+    Probe several videos through the shared cache, in parallel on misses.
+
+    Returns:
+        List of probe dicts (None for unreadable files) in input order
+    """
+    return get_probe_cache(cache_dir).probe_many(list(video_paths), max_workers=max_workers)
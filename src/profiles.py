@@ -0,0 +1,112 @@
+"""
+Named encoder profiles.
+
+A profile fixes how outputs are encoded: codec, x264 preset, constant quality
+(CRF) or bitrate, a cap on the output resolution, the frame rate and the
+number of encoder threads. "draft" trades quality for speed so text and
+segment settings can be previewed in seconds; "final" spends the time on
+quality for delivery.
+"""
+
+# Profile used when none is chosen
+DEFAULT_PROFILE = "standard"
+
+
+class RenderProfile:
+    """
+    Encoding settings for rendered outputs.
+    """
+
+    def __init__(self, name, codec="libx264", preset="medium", crf=23, bitrate=None,
+                 max_size=None, fps=None, threads=None, audio_bitrate=None):
+        """
+        Initialize a profile.
+
+        Args:
+            name: Profile name
+            codec: Video encoder
+            preset: Encoder speed preset (x264/x265 names)
+            crf: Constant rate factor; ignored when bitrate is set
+            bitrate: Target video bitrate such as "2M", or None for CRF
+            max_size: Cap on the longer side of the output in pixels, or None
+            fps: Cap on the output frame rate, or None for the plan's rate
+            threads: Encoder threads, or None to use the batch's CPU split
+            audio_bitrate: Audio bitrate such as "128k", or None for the
+                encoder default
+        """
+        self.name = name
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.bitrate = bitrate
+        self.max_size = max_size
+        self.fps = fps
+        self.threads = threads
+        self.audio_bitrate = audio_bitrate
+
+    def __repr__(self):
+        return f"RenderProfile({self.name!r})"
+
+    def output_fps(self, fps):
+        """Frame rate to render a plan of the given rate at."""
+        return min(fps, self.fps) if self.fps else fps
+
+    def output_size(self, width, height):
+        """
+        Even frame size after applying the resolution cap.
+
+        Args:
+            width: Frame width before the cap
+            height: Frame height before the cap
+
+        Returns:
+            (width, height), scaled down so the longer side fits max_size
+        """
+        if not self.max_size or max(width, height) <= self.max_size:
+            return width, height
+        scale = self.max_size / float(max(width, height))
+        return (max(2, int(round(width * scale / 2.0)) * 2),
+                max(2, int(round(height * scale / 2.0)) * 2))
+
+    def video_args(self):
+        """ffmpeg output options for the video encoder."""
+        args = ["-c:v", self.codec]
+        if self.preset:
+            args += ["-preset", self.preset]
+        if self.bitrate:
+            args += ["-b:v", self.bitrate]
+        elif self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        return args
+
+    def audio_args(self):
+        """ffmpeg output options for the audio bitrate."""
+        return ["-b:a", self.audio_bitrate] if self.audio_bitrate else []
+
+
+RENDER_PROFILES = {
+    "draft": RenderProfile("draft", preset="ultrafast", crf=32, max_size=854, fps=24,
+                           audio_bitrate="96k"),
+    "standard": RenderProfile("standard", preset="veryfast", crf=23, max_size=1920,
+                              audio_bitrate="128k"),
+    "final": RenderProfile("final", preset="slow", crf=18, audio_bitrate="192k"),
+}
+
+
+def get_profile(profile=None):
+    """
+    Resolve a profile name (or profile) to a RenderProfile.
+
+    Args:
+        profile: Name from RENDER_PROFILES, a RenderProfile, or None for
+            DEFAULT_PROFILE
+
+    Returns:
+        RenderProfile
+    """
+    if isinstance(profile, RenderProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {name} (choose from {', '.join(RENDER_PROFILES)})")
+    return RENDER_PROFILES[name]
@@ -9,7 +9,7 @@ from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, 
     QWidget, QFrame, QLineEdit, QSpinBox, QListWidget, QProgressBar, QFileDialog,
     QMessageBox, QGroupBox, QGraphicsDropShadowEffect, QGridLayout, QCheckBox,
-    QDesktopWidget
+    QDesktopWidget, QComboBox
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QObject, QThread
 from PyQt5.QtGui import QColor, QFont, QIcon, QPalette, QLinearGradient, QBrush, QPainter, QGradient
@@ -17,7 +17,9 @@ from PyQt5.QtGui import QColor, QFont, QIcon, QPalette, QLinearGradient, QBrush,
 # Add parent directory to path to import modules correctly
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.generator import generate_batch
+from src.profiles import RENDER_PROFILES, DEFAULT_PROFILE
 from src.utils import get_video_files
+from src.library import watch_library
 
 # Define color scheme
 COLORS = {
@@ -93,6 +95,9 @@ class ProgressSignals(QObject):
     complete = pyqtSignal(int)  # Sends number of videos generated
 
 class ScrambleClipGUI(QMainWindow):
+    # Emitted from library threads when a watched folder changes
+    library_changed = pyqtSignal()
+    
     def __init__(self):
         super().__init__()
         
@@ -106,6 +111,11 @@ class ScrambleClipGUI(QMainWindow):
         os.makedirs(os.path.dirname(self.input_audio_path), exist_ok=True)
         os.makedirs(self.output_path, exist_ok=True)
         
+        # Watched folder libraries behind the two lists
+        self.input_library = None
+        self.output_library = None
+        self.library_changed.connect(self.refresh_video_lists)
+        
         # Initialize UI
         self.init_ui()
         
@@ -295,6 +305,42 @@ class ScrambleClipGUI(QMainWindow):
         """)
         controls_layout.addWidget(self.num_videos_spinner)
         
+        controls_layout.addWidget(QLabel("Quality:"))
+        
+        self.profile_combo = QComboBox()
+        self.profile_combo.addItems(list(RENDER_PROFILES))
+        self.profile_combo.setCurrentText(DEFAULT_PROFILE)
+        self.profile_combo.setToolTip("Draft renders small, low-quality previews quickly; final is slower but sharper")
+        self.profile_combo.setStyleSheet(f"""
+            background-color: {COLORS['darker']};
+            color: white;
+            border: 1px solid {COLORS['darkest']};
+            border-radius: 4px;
+            padding: 5px;
+        """)
+        controls_layout.addWidget(self.profile_combo)
+        
+        controls_layout.addWidget(QLabel("AI time limit:"))
+        
+        self.analysis_budget_spinner = QSpinBox()
+        self.analysis_budget_spinner.setMinimum(0)
+        self.analysis_budget_spinner.setMaximum(600)
+        self.analysis_budget_spinner.setValue(0)
+        self.analysis_budget_spinner.setSuffix(" s")
+        self.analysis_budget_spinner.setSpecialValueText("None")
+        self.analysis_budget_spinner.setToolTip(
+            "Longest time AI clip selection may spend analyzing footage per video; "
+            "with a limit, clips are picked from the footage analyzed so far"
+        )
+        self.analysis_budget_spinner.setStyleSheet(f"""
+            background-color: {COLORS['darker']};
+            color: white;
+            border: 1px solid {COLORS['darkest']};
+            border-radius: 4px;
+            padding: 5px;
+        """)
+        controls_layout.addWidget(self.analysis_budget_spinner)
+        
         # Add checkboxes to layout
         checks_layout = QVBoxLayout() 
         
@@ -315,6 +361,7 @@ class ScrambleClipGUI(QMainWindow):
             "The AI scores clips based on motion, visual complexity, and more."
         )
         checks_layout.addWidget(self.use_ai_checkbox)
+        self.use_ai_checkbox.toggled.connect(self.analysis_budget_spinner.setEnabled)
         
         # Add AI Effects checkbox
         self.use_effects_checkbox = QCheckBox("Add AI-powered effects & transitions")
@@ -334,6 +381,23 @@ class ScrambleClipGUI(QMainWindow):
         )
         checks_layout.addWidget(self.use_effects_checkbox)
         
+        # Add proxy checkbox
+        self.use_proxies_checkbox = QCheckBox("Use proxies for faster repeat renders")
+        self.use_proxies_checkbox.setChecked(False)
+        self.use_proxies_checkbox.setStyleSheet(f"""
+            color: white;
+            font-weight: bold;
+            padding: 5px;
+        """)
+        self.use_proxies_checkbox.setToolTip(
+            "When enabled, each input video is converted once to a\n"
+            "normalized proxy (30 fps, at most 1280 px, short GOP)\n"
+            "and all later generations read the proxies instead.\n"
+            "\n"
+            "The first run is slower while the proxies are created."
+        )
+        checks_layout.addWidget(self.use_proxies_checkbox)
+        
         # Add Text Overlay checkbox
         self.use_text_checkbox = QCheckBox("Add text to videos")
         self.use_text_checkbox.setChecked(False)
@@ -347,15 +411,12 @@ class ScrambleClipGUI(QMainWindow):
         # Connect checkbox state change to show/hide text input
         self.use_text_checkbox.stateChanged.connect(self.toggle_text_input)
         
-        # Add ImageMagick tooltip info
+        # Add text overlay tooltip info
         self.use_text_checkbox.setToolTip(
             "When enabled, videos will include:\n"
             "• Attention-grabbing captions\n"
             "• Clear, visible text overlay\n"
-            "• Professional styling suited for short-form content\n"
-            "\n"
-            "Note: For best text quality, ImageMagick should be installed.\n"
-            "If not installed, a simplified text style will be used."
+            "• Professional styling suited for short-form content"
         )
         
         # Add the checkboxes layout to the main layout
@@ -479,22 +540,38 @@ class ScrambleClipGUI(QMainWindow):
         self.input_audio_path = self.input_audio_path_label.text()
         self.output_path = self.output_path_label.text()
         
-        # Fill input videos list
+        # Fill input videos list (folders are scanned in the background and
+        # the lists refilled when the scan finishes)
+        scanning = False
         if os.path.exists(self.input_video_path):
-            input_videos = get_video_files(self.input_video_path)
-            for video in input_videos:
-                self.input_video_list.addItem(os.path.basename(video))
+            self.input_library = watch_library(self.input_video_path, self.input_library,
+                                               self.on_library_change)
+            scanning = not self.input_library.scanned
+            if not scanning:
+                for video in self.input_library.files():
+                    self.input_video_list.addItem(os.path.basename(video))
         
         # Fill output videos list
         if os.path.exists(self.output_path):
-            output_videos = get_video_files(self.output_path)
-            for video in output_videos:
-                self.output_video_list.addItem(os.path.basename(video))
+            self.output_library = watch_library(self.output_path, self.output_library,
+                                                self.on_library_change)
+            if self.output_library.scanned:
+                for video in self.output_library.files():
+                    self.output_video_list.addItem(os.path.basename(video))
+            else:
+                scanning = True
                 
         # Update status
         input_count = self.input_video_list.count()
         output_count = self.output_video_list.count()
-        self.status_label.setText(f"Found {input_count} input videos, {output_count} output videos")
+        if scanning:
+            self.status_label.setText("Scanning video folders...")
+        else:
+            self.status_label.setText(f"Found {input_count} input videos, {output_count} output videos")
+    
+    def on_library_change(self):
+        """Called from a library thread when a folder's file list changes."""
+        self.library_changed.emit()
     
     def play_video(self, list_widget):
         """Play the selected video in the default system player."""
@@ -655,6 +732,9 @@ class ScrambleClipGUI(QMainWindow):
             use_ai = self.use_ai_checkbox.isChecked()
             use_effects = self.use_effects_checkbox.isChecked()
             use_text = self.use_text_checkbox.isChecked()
+            use_mezzanine = self.use_proxies_checkbox.isChecked()
+            profile = self.profile_combo.currentText()
+            analysis_budget = self.analysis_budget_spinner.value() or None
             
             # Get custom text if text overlay is enabled
             custom_text = None
@@ -675,7 +755,10 @@ class ScrambleClipGUI(QMainWindow):
                 use_ai=use_ai,
                 use_effects=use_effects,
                 use_text=use_text,
-                custom_text=custom_text
+                custom_text=custom_text,
+                profile=profile,
+                use_mezzanine=use_mezzanine,
+                analysis_budget=analysis_budget
             )
             
             # Move worker to thread
@@ -824,24 +907,6 @@ class ScrambleClipGUI(QMainWindow):
         if state == Qt.Checked:
             self.text_input_label.setVisible(True)
             self.text_input.setVisible(True)
-            
-            # First time the text checkbox is checked, show ImageMagick info
-            if not hasattr(self, '_text_info_shown'):
-                try:
-                    # Try to import a module that requires ImageMagick
-                    from moviepy.config import get_setting
-                    magick_path = get_setting("IMAGEMAGICK_BINARY")
-                    if magick_path == "unset" or not os.path.exists(magick_path):
-                        raise Exception("ImageMagick not properly configured")
-                except Exception:
-                    # Show info about ImageMagick if it's not available
-                    QMessageBox.information(self, "Text Overlay Info",
-                        "For best text quality, ImageMagick should be installed.\n\n"
-                        "Without ImageMagick, a simplified text style will be used. "
-                        "Videos will still be created successfully, but text effects "
-                        "may be limited.\n\n"
-                        "This is only needed for high-quality text overlays.")
-                    self._text_info_shown = True
         else:
             self.text_input_label.setVisible(False)
             self.text_input.setVisible(False)
@@ -874,7 +939,7 @@ class GenerateWorker(QObject):
     finished = pyqtSignal()
     error = pyqtSignal(str)
     
-    def __init__(self, num_videos, input_video_path, input_audio_path, output_path, use_ai=True, use_effects=False, use_text=False, custom_text=None):
+    def __init__(self, num_videos, input_video_path, input_audio_path, output_path, use_ai=True, use_effects=False, use_text=False, custom_text=None, profile=DEFAULT_PROFILE, use_mezzanine=False, analysis_budget=None):
         super().__init__()
         self.num_videos = num_videos
         self.input_video_path = input_video_path
@@ -884,6 +949,9 @@ class GenerateWorker(QObject):
         self.use_effects = use_effects
         self.use_text = use_text
         self.custom_text = custom_text
+        self.profile = profile
+        self.use_mezzanine = use_mezzanine
+        self.analysis_budget = analysis_budget
     
     def run(self):
         """Run the video generation process."""
@@ -898,6 +966,9 @@ class GenerateWorker(QObject):
             print(f"- Use Effects: {self.use_effects}")
             print(f"- Use Text: {self.use_text}")
             print(f"- Custom Text: {self.custom_text}")
+            print(f"- Render profile: {self.profile}")
+            print(f"- Use proxies: {self.use_mezzanine}")
+            print(f"- AI time limit: {self.analysis_budget}")
             
             # Verify paths exist
             if not os.path.exists(self.input_video_path):
@@ -935,7 +1006,11 @@ class GenerateWorker(QObject):
                 use_effects=self.use_effects,
                 use_text=self.use_text,
                 custom_text=self.custom_text,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                use_ai=self.use_ai,
+                profile=self.profile,
+                use_mezzanine=self.use_mezzanine,
+                analysis_budget=self.analysis_budget
             )
             
             # Print paths again for verification
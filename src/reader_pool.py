@@ -0,0 +1,135 @@
+"""
+Shared, LRU-bounded pool of VideoFileClip readers.
+
+Opening a VideoFileClip starts an ffmpeg subprocess (two with audio) and holds
+its pipes open until the clip is closed. Subclips share the reader of the clip
+they were cut from, so one open reader per source is enough for any number of
+segments. The pool hands out that reader, keeps at most max_readers of them
+open and closes the least recently used idle reader when it needs room.
+"""
+
+import threading
+from collections import OrderedDict
+from moviepy.editor import VideoFileClip
+
+
+class VideoReaderPool:
+    """
+    Reuses one VideoFileClip per source path across segments and outputs.
+
+    Readers returned by get() are leased: they are never evicted while a
+    segment cut from them may still be rendered. Call release() (or
+    release_all() once an output is written) to make them evictable again,
+    and close_all() (or leave the `with` block) when the batch ends.
+    """
+
+    def __init__(self, max_readers=8, audio=True, target_resolution=None, path_resolver=None):
+        """
+        Initialize the reader pool.
+
+        Args:
+            max_readers: Maximum number of idle-or-leased readers kept open
+            audio: Whether readers also open the source audio track
+            target_resolution: Optional (height, width) passed to VideoFileClip
+            path_resolver: Optional callable mapping a source path to the file
+                actually decoded, e.g. MezzanineCache.resolve to read proxies
+        """
+        self.max_readers = max(1, int(max_readers))
+        self.audio = audio
+        self.target_resolution = target_resolution
+        self.path_resolver = path_resolver
+        self._readers = OrderedDict()
+        self._leases = {}
+        self._lock = threading.RLock()
+        self.stats = {"opened": 0, "reused": 0, "evicted": 0, "closed": 0, "overflow": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close_all()
+        return False
+
+    def __len__(self):
+        return len(self._readers)
+
+    def _open(self, video_path):
+        if self.path_resolver is not None:
+            video_path = self.path_resolver(video_path)
+        return VideoFileClip(video_path, audio=self.audio,
+                             target_resolution=self.target_resolution)
+
+    def _close_reader(self, video_path):
+        clip = self._readers.pop(video_path)
+        self._leases.pop(video_path, None)
+        try:
+            clip.close()
+        except Exception as e:
+            print(f"Error closing reader for {video_path}: {e}")
+        self.stats["closed"] += 1
+
+    def _evict_idle(self, room_for=1):
+        """Close least recently used idle readers until there is room."""
+        for video_path in list(self._readers):
+            if len(self._readers) + room_for <= self.max_readers:
+                return
+            if self._leases.get(video_path, 0) == 0:
+                self._close_reader(video_path)
+                self.stats["evicted"] += 1
+        if len(self._readers) + room_for > self.max_readers:
+            # Every open reader is leased; going over the cap beats breaking a render
+            self.stats["overflow"] += 1
+
+    def get(self, video_path):
+        """
+        Return the shared reader for a source and lease it.
+
+        Args:
+            video_path: Path to the video file
+
+        Returns:
+            VideoFileClip for the whole source. Cut segments with subclip();
+            do not close it directly.
+        """
+        with self._lock:
+            clip = self._readers.get(video_path)
+            if clip is not None:
+                self._readers.move_to_end(video_path)
+                self.stats["reused"] += 1
+            else:
+                self._evict_idle()
+                clip = self._open(video_path)
+                self._readers[video_path] = clip
+                self.stats["opened"] += 1
+            self._leases[video_path] = self._leases.get(video_path, 0) + 1
+            return clip
+
+    def release(self, video_path):
+        """Drop one lease on a source's reader, leaving it open for reuse."""
+        with self._lock:
+            if self._leases.get(video_path, 0) > 0:
+                self._leases[video_path] -= 1
+
+    def release_all(self):
+        """Drop every lease, e.g. once an output video has been written."""
+        with self._lock:
+            for video_path in self._leases:
+                self._leases[video_path] = 0
+            self._evict_idle(room_for=0)
+
+    def close(self, video_path):
+        """Close a source's reader regardless of leases."""
+        with self._lock:
+            if video_path in self._readers:
+                self._close_reader(video_path)
+
+    def close_all(self):
+        """Close every reader held by the pool."""
+        with self._lock:
+            for video_path in list(self._readers):
+                self._close_reader(video_path)
+
+    def open_readers(self):
+        """Return the paths of the currently open readers, oldest first."""
+        with self._lock:
+            return list(self._readers)
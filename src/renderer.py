@@ -0,0 +1,455 @@
+"""
+Render ScramblePlans to video files.
+
+The renderer never makes random choices: everything it needs (segments,
+speeds, fades, text, audio offset) is read from the plan. Plans that need no
+per-frame processing go through the stream-copy path; everything else is
+compiled into a single ffmpeg filtergraph (see src.filter_render), or composed
+with MoviePy when the filtergraph cannot express the plan.
+
+MoviePy composes frames in a single Python thread, so a batch is rendered
+fastest by running several renders side by side: render_plans_parallel()
+sends plans to a process pool and splits the CPU budget between the worker
+processes and the ffmpeg encoder threads of each.
+
+Batches decode each audio track once (see src.shared_audio) and hand every
+output its slice, through shared memory when rendering in a process pool.
+MoviePy renders pipe their frames to an ffmpeg process that reads the audio
+slice from the track itself, so no render writes temporary audio files.
+"""
+
+import os
+import queue
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from proglog import ProgressBarLogger
+from moviepy.editor import concatenate_videoclips
+
+from src.reader_pool import VideoReaderPool
+from src.utils import pad_clip_to_ratio
+from src.transitions import fade_speed
+from src.stream_copy import can_copy_segments, is_stream_copy_eligible, render_stream_copy
+from src.text_overlay import TextOverlayFilter, text_patch_for
+from src.filter_render import can_render_with_ffmpeg, render_plan_ffmpeg
+from src.plan import ScramblePlan
+from src.shared_audio import PCMAudio, decode_audio
+from src.probe import get_ffmpeg_binary
+from src.profiles import get_profile
+
+# Render backends: "auto" picks stream copy, then ffmpeg, then MoviePy
+BACKENDS = ("auto", "ffmpeg", "moviepy")
+
+# Upper bound on render processes; each holds decoders and frame buffers
+MAX_RENDER_WORKERS = 8
+
+# Smallest change in an output's progress that is reported by a worker
+PROGRESS_STEP = 0.02
+
+
+def can_stream_copy(plan):
+    """Return True if a plan can be rendered without decoding any frames."""
+    return is_stream_copy_eligible(
+        add_transitions=plan.has_effects,
+        pad_to_ratio=plan.needs_padding,
+        text_overlay=plan.text,
+    ) and can_copy_segments(plan.segment_tuples())
+
+
+def decode_plan_audio(plans):
+    """
+    Decode every audio track used by a set of plans, once each.
+
+    Returns:
+        Dict of audio path -> PCMAudio; tracks that fail to decode are
+        reported and left out (their outputs decode the file themselves)
+    """
+    tracks = {}
+    for plan in plans:
+        path = plan.audio and plan.audio.get("path")
+        if not path or path in tracks or can_stream_copy(plan):
+            continue
+        try:
+            tracks[path] = decode_audio(path)
+        except Exception as e:
+            print(f"Error decoding audio {path}: {e}")
+    return tracks
+
+
+def build_video_clip(plan, pool):
+    """
+    Compose a plan's video into a MoviePy clip without writing it.
+
+    Args:
+        plan: ScramblePlan to compose
+        pool: VideoReaderPool the segments are cut from
+
+    Returns:
+        Silent clip; the audio is added when encoding (see _encode_clip)
+    """
+    target_ratio = plan.settings.get("target_ratio")
+    pad_fill = plan.settings.get("pad_fill", (0, 0, 0))
+    if isinstance(pad_fill, list):
+        pad_fill = tuple(pad_fill)
+
+    clips = []
+    for segment in plan.segments:
+        source = pool.get(plan.sources[segment["source"]]["path"])
+        clip = source.subclip(segment["start"], min(segment["end"], source.duration))
+        if target_ratio:
+            clip = pad_clip_to_ratio(clip, tuple(target_ratio), pad_fill)
+        clip = fade_speed(clip, speed=segment.get("speed", 1.0),
+                          fade_in=segment.get("fade_in", 0.0),
+                          fade_out=segment.get("fade_out", 0.0))
+        clips.append(clip)
+
+    video = concatenate_videoclips(clips, method="compose")
+
+    if plan.text and plan.text.get("text"):
+        video = video.fl_image(TextOverlayFilter(text_patch_for(plan.text, video.size), video.size))
+
+    return video
+
+
+def _encode_clip(video, output_path, fps, output_args, audio=None, logger=None):
+    """
+    Encode a MoviePy clip with one ffmpeg process.
+
+    write_videofile writes the audio to a temporary file before muxing it;
+    here the frames are piped to ffmpeg and the same process reads the audio
+    slice straight from its track.
+
+    Args:
+        video: Clip to encode
+        output_path: Path of the video to write
+        fps: Output frame rate
+        output_args: ffmpeg encoder options
+        audio: Optional plan.audio dict ({"path", "offset"})
+        logger: MoviePy progress logger (None for silent)
+
+    Returns:
+        output_path
+    """
+    width, height = video.size
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+           "-i", "pipe:0"]
+    maps = ["-map", "0:v"]
+    if audio:
+        cmd += ["-ss", f"{audio.get('offset', 0.0):.6f}", "-t", f"{video.duration:.6f}",
+                "-i", audio["path"]]
+        maps += ["-map", "1:a:0"]
+    cmd += maps + output_args + ["-pix_fmt", "yuv420p", output_path]
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                   stderr=errors)
+        try:
+            for frame in video.iter_frames(fps=fps, logger=logger, dtype="uint8"):
+                process.stdin.write(frame.tobytes())
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            process.wait()
+        errors.seek(0)
+        message = errors.read().decode("utf-8", "replace").strip()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg render failed: {message[-500:]}")
+    return output_path
+
+
+def render_plan(plan, output_path, pool=None, allow_stream_copy=True, skip_existing=False,
+                codec="libx264", audio_codec="aac", logger=None, threads=None, backend="auto",
+                on_progress=None, audio_track=None, profile=None):
+    """
+    Render one plan to a video file.
+
+    Args:
+        plan: ScramblePlan to render
+        output_path: Path of the video to write
+        pool: Optional VideoReaderPool shared across renders; a private one is
+            used and closed otherwise
+        allow_stream_copy: Use the stream-copy path when the plan allows it
+        skip_existing: Return immediately if output_path already exists
+            (useful with plan.output_name(profile=profile) as a render cache)
+        codec: Video codec for MoviePy renders
+        audio_codec: Audio codec for MoviePy renders
+        logger: MoviePy progress logger (None for silent)
+        threads: Number of encoder threads, or None for ffmpeg's default
+        backend: "auto" to use the fastest path the plan allows, "ffmpeg"
+            to require the filtergraph renderer, "moviepy" to compose in Python
+        on_progress: Optional callable(fraction) for ffmpeg renders
+            (MoviePy renders report through logger)
+        audio_track: Optional PCMAudio of plan.audio's track, decoded once
+            for a whole batch and piped to ffmpeg renders; the track file is
+            decoded otherwise
+        profile: Optional render profile name or RenderProfile (see
+            src.profiles) setting codec, quality, size and frame rate caps
+            and encoder threads; stream-copy renders are not re-encoded
+
+    Returns:
+        output_path
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown render backend: {backend}")
+    if skip_existing and os.path.exists(output_path):
+        return output_path
+
+    if allow_stream_copy and backend == "auto" and can_stream_copy(plan):
+        audio = plan.audio or {}
+        return render_stream_copy(plan.segment_tuples(), output_path,
+                                  audio_path=audio.get("path"),
+                                  audio_offset=audio.get("offset", 0.0))
+
+    if backend != "moviepy":
+        if can_render_with_ffmpeg(plan):
+            return render_plan_ffmpeg(plan, output_path, codec, audio_codec, threads, on_progress,
+                                      audio_track, profile)
+        if backend == "ffmpeg":
+            raise ValueError("This ffmpeg build cannot render the plan")
+
+    fps = plan.settings.get("fps", 30)
+    output_args = ["-c:a", audio_codec] if plan.audio else []
+    if profile is not None:
+        profile = get_profile(profile)
+        fps = profile.output_fps(fps)
+        threads = profile.threads or threads
+        output_args += profile.video_args() + profile.audio_args()
+    else:
+        output_args += ["-c:v", codec]
+    if threads:
+        output_args += ["-threads", str(threads)]
+
+    own_pool = pool is None
+    pool = pool or VideoReaderPool()
+    try:
+        video = build_video_clip(plan, pool)
+        if profile is not None and profile.output_size(*video.size) != tuple(video.size):
+            video = video.resize(newsize=profile.output_size(*video.size))
+        return _encode_clip(video, output_path, fps, output_args, plan.audio, logger)
+    finally:
+        if own_pool:
+            pool.close_all()
+        else:
+            pool.release_all()
+
+
+def output_path_for(output_dir, index):
+    """Path of the index-th (1-based) output of a batch."""
+    return os.path.join(output_dir, f"output_{index}.mp4")
+
+
+def render_plans(plans, output_dir, progress_callback=None, pool=None, first_index=1, **kwargs):
+    """
+    Render several plans one after another.
+
+    Args:
+        plans: List of ScramblePlan
+        output_dir: Directory the videos are written to
+        progress_callback: Optional callable(progress_percent, status_message)
+        pool: Optional VideoReaderPool shared by all renders
+        first_index: Number of the first output file (output_<n>.mp4)
+        **kwargs: Passed to render_plan()
+
+    Returns:
+        List of output paths (None for outputs that failed)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    own_pool = pool is None
+    pool = pool or VideoReaderPool()
+    tracks = decode_plan_audio(plans)
+    outputs = []
+    try:
+        for i, plan in enumerate(plans):
+            if progress_callback:
+                progress_callback(int(100 * i / len(plans)), f"Rendering video {i + 1} of {len(plans)}...")
+            output_path = output_path_for(output_dir, first_index + i)
+            try:
+                track = tracks.get(plan.audio["path"]) if plan.audio else None
+                outputs.append(render_plan(plan, output_path, pool=pool, audio_track=track, **kwargs))
+            except Exception as e:
+                print(f"Error rendering video {i + 1}: {e}")
+                outputs.append(None)
+    finally:
+        if own_pool:
+            pool.close_all()
+    if progress_callback:
+        progress_callback(100, f"Rendered {sum(1 for p in outputs if p)} of {len(plans)} videos")
+    return outputs
+
+
+def render_budget(num_outputs, cpu_budget=None, workers=None):
+    """
+    Split a CPU budget between render processes and encoder threads.
+
+    Compositing is single-threaded, so cores are given to separate renders
+    first; encoder threads only get the cores left over when there are
+    fewer outputs than cores.
+
+    Args:
+        num_outputs: Number of videos to render
+        cpu_budget: Total number of cores to use; all of them when None
+        workers: Number of render processes; derived from the budget when None
+
+    Returns:
+        (workers, threads_per_encoder)
+    """
+    cpu_budget = max(1, int(cpu_budget or os.cpu_count() or 1))
+    if workers is None:
+        workers = min(cpu_budget, MAX_RENDER_WORKERS)
+    workers = max(1, min(int(workers), num_outputs, cpu_budget))
+    return workers, max(1, cpu_budget // workers)
+
+
+class _QueueProgressLogger(ProgressBarLogger):
+    """MoviePy logger forwarding one render's frame progress to a queue."""
+
+    def __init__(self, progress_queue, index):
+        super().__init__()
+        self.progress_queue = progress_queue
+        self.index = index
+        self._reported = 0.0
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar != "t" or attr != "index":
+            return
+        total = self.bars[bar].get("total")
+        if not total:
+            return
+        self.report((value + 1) / total)
+
+    def report(self, fraction):
+        fraction = min(1.0, fraction)
+        if fraction - self._reported >= PROGRESS_STEP:
+            self._reported = fraction
+            self.progress_queue.put((self.index, fraction))
+
+
+def _render_in_process(plan_data, output_path, index, progress_queue, audio_handle, kwargs):
+    """
+    Process-pool entry point: render one plan.
+
+    The plan's audio comes from the parent's shared PCM block when
+    audio_handle is given (see PCMAudio.share).
+
+    A failed render removes its partial output file and re-raises, so the
+    failure is reported for this output only.
+    """
+    plan = ScramblePlan.from_dict(plan_data)
+    logger = _QueueProgressLogger(progress_queue, index) if progress_queue is not None else None
+    audio_track = PCMAudio.attach(audio_handle) if audio_handle else None
+    try:
+        return render_plan(plan, output_path, logger=logger,
+                           on_progress=logger.report if logger is not None else None,
+                           audio_track=audio_track, **kwargs)
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def render_plans_parallel(plans, output_dir, progress_callback=None, workers=None,
+                          cpu_budget=None, first_index=1, **kwargs):
+    """
+    Render several plans in a process pool.
+
+    Progress of all renders is merged into one percentage: every output
+    counts for an equal share, filled in as its frames are written.
+    Failures are isolated per output, including a worker process dying: the
+    outputs lost with it are retried once in a fresh pool.
+
+    Args:
+        plans: List of ScramblePlan
+        output_dir: Directory the videos are written to
+        progress_callback: Optional callable(progress_percent, status_message)
+        workers: Number of render processes; derived from cpu_budget when None
+        cpu_budget: Total number of cores to use; all of them when None
+        first_index: Number of the first output file (output_<n>.mp4)
+        **kwargs: Passed to render_plan()
+
+    Returns:
+        List of output paths (None for outputs that failed)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if not plans:
+        return []
+    workers, threads = render_budget(len(plans), cpu_budget, workers)
+    if kwargs.get("profile") is not None:
+        threads = get_profile(kwargs["profile"]).threads or threads
+    if workers == 1:
+        return render_plans(plans, output_dir, progress_callback, first_index=first_index,
+                            threads=threads, **kwargs)
+    kwargs = dict(kwargs, threads=threads)
+
+    outputs = [None] * len(plans)
+    fractions = [0.0] * len(plans)
+    done = set()
+    reported = [-1]
+
+    def report():
+        if progress_callback is None:
+            return
+        progress = int(100 * sum(fractions) / len(plans))
+        if progress != reported[0]:
+            reported[0] = progress
+            progress_callback(min(progress, 99), f"Rendered {len(done)} of {len(plans)} videos "
+                                                 f"({workers} at a time)...")
+
+    tracks = decode_plan_audio(plans)
+    handles = {path: track.share() for path, track in tracks.items()}
+    try:
+        with multiprocessing.Manager() as manager:
+            progress_queue = manager.Queue() if progress_callback else None
+            remaining = list(range(len(plans)))
+            for attempt in range(2):
+                broken = []
+                with ProcessPoolExecutor(max_workers=min(workers, len(remaining))) as executor:
+                    futures = {
+                        executor.submit(_render_in_process, plans[i].to_dict(),
+                                        output_path_for(output_dir, first_index + i), i,
+                                        progress_queue, handles.get((plans[i].audio or {}).get("path")),
+                                        kwargs): i
+                        for i in remaining
+                    }
+                    report()
+                    pending = set(futures)
+                    while pending:
+                        finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                        while progress_queue is not None:
+                            try:
+                                index, fraction = progress_queue.get_nowait()
+                            except queue.Empty:
+                                break
+                            if index not in done:
+                                fractions[index] = max(fractions[index], fraction)
+                        for future in finished:
+                            i = futures[future]
+                            try:
+                                outputs[i] = future.result()
+                            except BrokenProcessPool as e:
+                                if attempt == 0:
+                                    broken.append(i)
+                                    fractions[i] = 0.0
+                                    continue
+                                print(f"Error rendering video {first_index + i}: {e}")
+                            except Exception as e:
+                                print(f"Error rendering video {first_index + i}: {e}")
+                            done.add(i)
+                            fractions[i] = 1.0
+                        report()
+                if not broken:
+                    break
+                print(f"Render worker died; retrying {len(broken)} videos")
+                remaining = sorted(broken)
+    finally:
+        for track in tracks.values():
+            track.close()
+
+    if progress_callback:
+        progress_callback(100, f"Rendered {sum(1 for p in outputs if p)} of {len(plans)} videos")
+    return outputs
@@ -0,0 +1,181 @@
+"""
+Diversity-aware clip selection.
+
+Two clips are compared by the dot product of their sources' mean normalized
+frame features, as in calculate_clip_similarity. Clips of the same source
+that overlap score at least their overlap ratio (1 when identical): overlap
+can only make two clips more alike, never less. Summing that similarity over
+a set of clips therefore only needs the sum of their feature vectors plus a
+correction for same-source overlaps, which is what BatchDiversityState keeps
+per batch. mmr_select then picks clips by maximal marginal relevance with one
+vectorized update per pick, passing over windows that overlap a clip it
+already picked from the same source while any other candidate is left.
+"""
+
+import numpy as np
+
+# Score penalty per unit of similarity, as in find_best_clips
+SIMILARITY_PENALTY = 5.0
+
+# Candidates considered by MMR, as a multiple of the number of picks
+MMR_POOL_FACTOR = 10
+MMR_MIN_POOL = 200
+
+
+def _overlap_similarity(start, end, cand_start, cand_end):
+    """
+    Same-source similarity of one clip to many; NaN where the clips don't overlap.
+    """
+    overlap = np.minimum(cand_end, end) - np.maximum(cand_start, start)
+    shortest = np.minimum(cand_end - cand_start, end - start)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(overlap > 0, overlap / shortest, np.nan)
+    identical = (np.abs(cand_start - start) < 0.1) & (np.abs(cand_end - end) < 0.1)
+    return np.where(identical, 1.0, ratio)
+
+
+def similarity_to_clip(clip, feature, sources, starts, ends, features):
+    """
+    Similarity of many clips to one clip.
+
+    Args:
+        clip: (video_path, start_time, end_time) of the reference clip
+        feature: Mean normalized feature of the reference clip's source
+        sources: Array of candidate source paths
+        starts: Array of candidate start times
+        ends: Array of candidate end times
+        features: (n, d) array of candidate source features
+
+    Returns:
+        Array of n similarity scores
+    """
+    similarity = features @ feature
+    same = np.nonzero(sources == clip[0])[0]
+    if len(same):
+        overlap = _overlap_similarity(clip[1], clip[2], starts[same], ends[same])
+        similarity[same] = np.fmax(similarity[same], overlap)
+    return similarity
+
+
+class BatchDiversityState:
+    """
+    Running summary of the clips already used by the outputs of one batch.
+    """
+
+    def __init__(self):
+        self.feature_sum = None
+        self.clips = []
+        self.outputs = 0
+        self._features = []
+
+    def __len__(self):
+        return len(self.clips)
+
+    def add_output(self, clips, features):
+        """
+        Record the clips chosen for one output.
+
+        Args:
+            clips: List of (video_path, start_time, end_time) tuples
+            features: (len(clips), d) array of their source features
+        """
+        features = np.asarray(features, dtype=np.float64).reshape(len(clips), -1)
+        if len(clips):
+            total = features.sum(axis=0)
+            self.feature_sum = total if self.feature_sum is None else self.feature_sum + total
+        self.clips.extend(tuple(clip) for clip in clips)
+        self._features.extend(features)
+        self.outputs += 1
+
+    def penalties(self, sources, starts, ends, features, weight=SIMILARITY_PENALTY):
+        """
+        Score penalty of each candidate for resembling clips of the batch.
+
+        The summed similarity to the batch's clips is divided by the number
+        of outputs recorded, so it stays on the scale of one output's clips
+        however many outputs the batch has.
+
+        Returns:
+            Array of non-negative penalties
+        """
+        if self.feature_sum is None or len(sources) == 0:
+            return np.zeros(len(sources))
+        total = features @ self.feature_sum
+        # Raise the feature term to the overlap ratio for same-source overlaps
+        for clip, feature in zip(self.clips, self._features):
+            same = np.nonzero(sources == clip[0])[0]
+            if not len(same):
+                continue
+            overlap = _overlap_similarity(clip[1], clip[2], starts[same], ends[same])
+            term = features[same] @ feature
+            hit = overlap > term
+            total[same[hit]] += overlap[hit] - term[hit]
+        return np.maximum(total, 0.0) * weight / max(self.outputs, 1)
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first, without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=int)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def mmr_select(sources, starts, ends, features, relevance, k, diversity=1.0,
+               weight=SIMILARITY_PENALTY, pool_size=None, conflicts=None):
+    """
+    Choose k clips by maximal marginal relevance.
+
+    Each pick maximizes relevance minus weight * diversity * (similarity to
+    the clips already picked). Windows overlapping an earlier pick from the
+    same source are only picked once no other candidate is left. Only the
+    pool_size most relevant candidates are considered, found with
+    argpartition.
+
+    Args:
+        sources: Array of candidate source paths
+        starts: Array of candidate start times
+        ends: Array of candidate end times
+        features: (n, d) array of candidate source features
+        relevance: Array of candidate scores
+        k: Number of clips to pick
+        diversity: Weight of redundancy with earlier picks; 0 is plain top-k
+        weight: Score penalty per unit of similarity
+        pool_size: Candidates considered; defaults to max(10k, 200)
+        conflicts: Optional callable(index) returning a boolean mask of the
+            candidates that may no longer be picked once index is picked,
+            e.g. near-duplicates of it from other sources
+
+    Returns:
+        List of candidate indices in pick order
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    if (diversity <= 0 or k <= 1) and conflicts is None:
+        return list(top_k(relevance, k))
+    pool_size = pool_size or max(MMR_POOL_FACTOR * k, MMR_MIN_POOL)
+    pool = top_k(relevance, pool_size)
+    pool_sources, pool_starts, pool_ends = sources[pool], starts[pool], ends[pool]
+    pool_features = features[pool]
+    marginal = relevance[pool].copy()
+    available = np.ones(len(pool), dtype=bool)
+    overlapping = np.zeros(len(pool), dtype=bool)
+    picks = []
+    for _ in range(min(k, len(pool))):
+        if not available.any():
+            break
+        candidates = available & ~overlapping
+        if not candidates.any():
+            candidates = available
+        best = int(np.argmax(np.where(candidates, marginal, -np.inf)))
+        picks.append(int(pool[best]))
+        available[best] = False
+        same = pool_sources == pool_sources[best]
+        overlapping |= same & (pool_starts < pool_ends[best]) & (pool_ends > pool_starts[best])
+        if conflicts is not None:
+            available &= ~conflicts(int(pool[best]))[pool]
+        if diversity > 0:
+            clip = (pool_sources[best], pool_starts[best], pool_ends[best])
+            marginal -= weight * diversity * similarity_to_clip(
+                clip, pool_features[best], pool_sources, pool_starts, pool_ends, pool_features)
+    return picks
@@ -0,0 +1,147 @@
+"""
+Decode-once PCM audio shared by every output of a batch.
+
+Every output of a batch plays a slice of the same track, yet AudioFileClip
+starts a fresh ffmpeg decoder for each of them. PCMAudio decodes a track once
+into an int16 array; outputs cut their slice from it. For process-pool renders the samples are copied once into shared
+memory and workers attach to that block instead of decoding the track again.
+"""
+
+import subprocess
+import numpy as np
+from multiprocessing import shared_memory
+
+from src.probe import get_ffmpeg_binary
+
+AUDIO_FPS = 44100
+AUDIO_CHANNELS = 2
+
+# Shared blocks attached by this process, by name
+_attached = {}
+
+
+def decode_audio(audio_path, fps=AUDIO_FPS, channels=AUDIO_CHANNELS):
+    """
+    Decode a whole audio track to 16-bit PCM.
+
+    Args:
+        audio_path: Path to the audio (or video) file
+        fps: Sample rate to resample to
+        channels: Number of channels to mix to
+
+    Returns:
+        PCMAudio
+    """
+    cmd = [get_ffmpeg_binary(), "-v", "error", "-nostdin", "-i", audio_path, "-vn",
+           "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(fps), "-ac", str(channels), "-"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"Could not decode audio {audio_path}: {message[-300:]}")
+    samples = np.frombuffer(result.stdout, dtype=np.int16).reshape(-1, channels)
+    return PCMAudio(samples, fps)
+
+
+class PCMAudio:
+    """
+    A decoded audio track held as an (n, channels) int16 array.
+    """
+
+    def __init__(self, samples, fps=AUDIO_FPS, shm=None, owner=False):
+        """
+        Initialize the track.
+
+        Args:
+            samples: (n, channels) int16 array
+            fps: Sample rate
+            shm: SharedMemory block backing samples, if any
+            owner: Whether close() should also free the shared block
+        """
+        self.samples = samples
+        self.fps = fps
+        self._shm = shm
+        self._owner = owner
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def duration(self):
+        return len(self.samples) / float(self.fps)
+
+    def segment(self, offset, duration):
+        """
+        Cut a slice of the track.
+
+        Args:
+            offset: Start of the slice in seconds
+            duration: Length of the slice in seconds; shorter at the end of
+                the track
+
+        Returns:
+            (n, channels) int16 view of the track
+        """
+        start = max(0, int(round(offset * self.fps)))
+        end = min(len(self.samples), start + int(round(duration * self.fps)))
+        return self.samples[start:end]
+
+    def share(self):
+        """
+        Copy the samples into shared memory (once) and return a picklable handle.
+
+        Returns:
+            {"name", "shape", "fps"} dict for attach()
+        """
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.samples.nbytes))
+            shared = np.ndarray(self.samples.shape, dtype=np.int16, buffer=self._shm.buf)
+            shared[...] = self.samples
+            self.samples = shared
+            self._owner = True
+        return {"name": self._shm.name, "shape": list(self.samples.shape), "fps": self.fps}
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Map a track shared by another process, once per process.
+
+        Args:
+            handle: Dict returned by share()
+
+        Returns:
+            PCMAudio backed by the shared block
+        """
+        audio = _attached.get(handle["name"])
+        if audio is None:
+            try:
+                shm = shared_memory.SharedMemory(name=handle["name"], track=False)
+            except TypeError:
+                # Before Python 3.13 attaching registers the block with the
+                # resource tracker, which frees it when this process exits;
+                # only the creating process may do that
+                from multiprocessing import resource_tracker
+                register = resource_tracker.register
+                resource_tracker.register = lambda *args, **kwargs: None
+                try:
+                    shm = shared_memory.SharedMemory(name=handle["name"])
+                finally:
+                    resource_tracker.register = register
+            samples = np.ndarray(tuple(handle["shape"]), dtype=np.int16, buffer=shm.buf)
+            audio = cls(samples, handle["fps"], shm=shm)
+            _attached[handle["name"]] = audio
+        return audio
+
+    def close(self):
+        """Release the shared block, freeing it if this track created it."""
+        shm, self._shm = self._shm, None
+        if shm is None:
+            return
+        self.samples = np.zeros((0, self.channels), dtype=np.int16)
+        try:
+            shm.close()
+        except BufferError:
+            # Slices handed out earlier still map the block; it is unmapped with them
+            pass
+        if self._owner:
+            shm.unlink()
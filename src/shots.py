@@ -0,0 +1,74 @@
+"""
+Shot-boundary detection.
+
+Random segment starts often straddle hard cuts, so a single segment mixes two
+unrelated shots and its analysis score describes neither. A hard cut shows up
+in a source's timeline (see src.timeline) as an isolated spike in the frame
+difference series: much larger than the motion around it. The boundaries found
+here let the samplers draw segments inside a single shot.
+"""
+
+import numpy as np
+
+# A cut needs at least this mean absolute frame difference (0..1)...
+CUT_THRESHOLD = 0.12
+
+# ...and must be this many times the median difference around it
+CUT_RATIO = 3.0
+
+# Frames on each side of a sample used for the local median
+CUT_WINDOW = 5
+
+
+def detect_shot_boundaries(timeline, threshold=CUT_THRESHOLD, ratio=CUT_RATIO, window=CUT_WINDOW):
+    """
+    Find hard cuts in a source's timeline.
+
+    Args:
+        timeline: SourceTimeline of the source
+        threshold: Minimum frame difference of a cut
+        ratio: Minimum ratio of a cut's difference to the local median
+        window: Samples on each side used for the local median
+
+    Returns:
+        Sorted list of cut times in seconds (between the two frames)
+    """
+    motion = np.asarray(timeline.motion)
+    if len(motion) < 2:
+        return []
+    padded = np.pad(motion, window, mode="edge")
+    neighborhoods = np.lib.stride_tricks.sliding_window_view(padded, 2 * window + 1)
+    local_median = np.median(neighborhoods, axis=1)
+    cuts = np.nonzero((motion >= threshold) & (motion >= ratio * local_median))[0]
+    cuts = cuts[cuts > 0]
+    return [float((i - 0.5) / timeline.fps) for i in cuts]
+
+
+def merge_short_shots(boundaries, duration, min_length):
+    """
+    Drop boundaries so that every remaining shot is at least min_length long.
+
+    Fast-cut sources would otherwise leave no shot long enough for a segment;
+    their short shots are merged into the following one instead.
+
+    Args:
+        boundaries: Sorted cut times
+        duration: Duration of the source
+        min_length: Minimum shot length in seconds
+
+    Returns:
+        Sorted list of the kept cut times
+    """
+    kept = []
+    previous = 0.0
+    for boundary in boundaries:
+        if boundary - previous >= min_length and duration - boundary >= min_length:
+            kept.append(boundary)
+            previous = boundary
+    return kept
+
+
+def shot_ranges(boundaries, duration):
+    """Return the (start, end) range of every shot."""
+    edges = [0.0] + [b for b in boundaries if 0.0 < b < duration] + [float(duration)]
+    return list(zip(edges[:-1], edges[1:]))
@@ -0,0 +1,244 @@
+"""
+Stream-copy fast path for scrambles that need no per-frame processing.
+
+When transitions, padding and text overlays are all off, an output is just
+source segments played back to back. Instead of decoding and re-encoding
+every frame through MoviePy, each segment is cut with `-c copy` and the cuts
+are joined with ffmpeg's concat demuxer, muxing in the audio track at the end.
+
+The concat demuxer only produces a playable file when every cut carries the
+same stream parameters (decoders take the codec setup from the first cut), so
+a plan is only stream copied when all of its sources share one stream
+signature and every segment starts on a keyframe. Each cut is limited to the
+whole number of frames its segment covers on the output frame grid, which is
+only exact when the frames before the cut's end are stored before those
+after it: sources with B-frames (frames stored out of presentation order) can
+therefore only be cut at keyframes. Anything else is re-encoded as a whole by
+the filtergraph renderer.
+"""
+
+import os
+import shutil
+import tempfile
+import subprocess
+
+from src.probe import get_ffmpeg_binary, probe_videos
+from src.keyframes import get_keyframe_index
+
+# Largest distance in seconds between a segment start and its keyframe
+KEYFRAME_TOLERANCE = 1e-3
+
+
+def is_stream_copy_eligible(add_transitions=False, pad_to_ratio=False, text_overlay=None):
+    """
+    Return True if an output can be rendered without touching pixel data.
+
+    Args:
+        add_transitions: Whether prepare_clip_for_concat effects are enabled
+        pad_to_ratio: Whether any source needs pad_clip_to_ratio padding
+        text_overlay: Text overlay parameters, or None
+    """
+    return not add_transitions and not pad_to_ratio and not text_overlay
+
+
+def stream_signature(info):
+    """
+    Return the stream parameters that must match for concat stream copy.
+
+    Args:
+        info: Probe dict from src.probe
+    """
+    return (
+        info.get("video_codec"),
+        info.get("width"),
+        info.get("height"),
+        info.get("pix_fmt"),
+        round(info.get("fps") or 0, 2),
+        info.get("rotation", 0),
+    )
+
+
+def shares_signature(infos):
+    """Return True if every probed source has the same stream signature."""
+    signatures = {stream_signature(info) if info else None for info in infos}
+    return len(signatures) == 1 and None not in signatures
+
+
+def on_keyframe(keyframes, start):
+    """Return True if a stream-copy cut at `start` begins exactly at `start`."""
+    return abs(keyframes.previous_keyframe(start) - start) <= KEYFRAME_TOLERANCE
+
+
+def ends_exactly(keyframes, end):
+    """
+    Return True if a stream-copy cut can end exactly at `end`.
+
+    Without B-frames every frame shown before `end` is stored before every
+    frame shown after it. With them, only a keyframe (or the end of the
+    source) closes the frames before it.
+    """
+    if not keyframes.reordered:
+        return True
+    if keyframes.duration and end >= keyframes.duration - KEYFRAME_TOLERANCE:
+        return True
+    following = keyframes.next_keyframe(end)
+    return following is not None and abs(following - end) <= KEYFRAME_TOLERANCE
+
+
+def can_copy_segments(segments, cache_dir=".clip_cache"):
+    """
+    Return True if segments can be cut and joined frame-accurately without
+    re-encoding.
+
+    Args:
+        segments: List of (video_path, start_time, end_time) tuples
+        cache_dir: Directory holding the probe and keyframe caches
+    """
+    if not segments:
+        return False
+    sources = list(dict.fromkeys(path for path, _, _ in segments))
+    if not shares_signature(probe_videos(sources, cache_dir)):
+        return False
+    indexes = {path: get_keyframe_index(path, cache_dir) for path in sources}
+    return all(on_keyframe(indexes[path], start) and ends_exactly(indexes[path], end)
+               for path, start, end in segments)
+
+
+def segment_frame_counts(segments, fps):
+    """
+    Number of frames of each segment, cut on the output frame grid.
+
+    Each segment gets the frames between its cumulative start and end, so
+    the counts add up to the plan's duration in frames instead of
+    accumulating one rounding per segment.
+    """
+    counts = []
+    elapsed = 0.0
+    for _, start, end in segments:
+        first_frame = int(round(elapsed * fps))
+        elapsed += end - start
+        counts.append(max(1, int(round(elapsed * fps)) - first_frame))
+    return counts
+
+
+def _run_ffmpeg(args):
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg failed ({' '.join(args[:6])} ...): {message[-500:]}")
+
+
+def cut_segment_copy(video_path, start, end, output_path, keep_audio=True, frames=None):
+    """
+    Cut a segment without re-encoding.
+
+    Input seeking with stream copy starts the cut at the keyframe at or
+    before `start`, so `start` should be a keyframe (see can_copy_segments).
+    `-t` alone copies every packet decoded before `end`, including B-frame
+    references shown after it, so the video is also limited to `frames`.
+
+    Args:
+        video_path: Source video
+        start: Requested start time in seconds
+        end: End time in seconds
+        output_path: Path of the cut to write
+        keep_audio: Copy the source audio stream as well
+        frames: Number of video frames to keep (see segment_frame_counts)
+    """
+    args = ["-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}",
+            "-map", "0:v:0"]
+    if frames is not None:
+        args += ["-frames:v", str(frames)]
+    if keep_audio:
+        args += ["-map", "0:a:0?", "-c:a", "copy"]
+    else:
+        args += ["-an"]
+    args += ["-c:v", "copy", "-avoid_negative_ts", "make_zero", output_path]
+    _run_ffmpeg(args)
+
+
+def concat_segments(segment_paths, output_path, audio_path=None, work_dir=None, audio_offset=0.0):
+    """
+    Join cut segments with the concat demuxer, optionally muxing in audio.
+
+    Args:
+        segment_paths: Paths of the cuts, in playback order
+        output_path: Path of the joined video to write
+        audio_path: Optional audio track replacing the segments' own audio
+        work_dir: Directory for the concat list file
+        audio_offset: Position in the audio track the video starts at
+    """
+    work_dir = work_dir or os.path.dirname(os.path.abspath(output_path))
+    list_path = os.path.join(work_dir, "concat_list.txt")
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        if audio_offset:
+            args += ["-ss", f"{audio_offset:.3f}"]
+        args += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0",
+                 "-c:v", "copy", "-c:a", "aac", "-shortest"]
+    else:
+        args += ["-c", "copy"]
+    args += ["-movflags", "+faststart", output_path]
+    _run_ffmpeg(args)
+
+
+def render_stream_copy(segments, output_path, audio_path=None, work_dir=None, audio_offset=0.0):
+    """
+    Render a scramble by stream copying segments and concatenating them.
+
+    Every segment must start on a keyframe of a source sharing one stream
+    signature with the others, and end on one if the source has B-frames
+    (see can_copy_segments); plans are snapped to keyframes by the planner
+    when they will be stream copied. The output has the plan's duration to
+    the frame.
+
+    Args:
+        segments: List of (video_path, start_time, end_time) tuples in
+            playback order
+        output_path: Path of the video to write
+        audio_path: Optional audio track to mux in
+        work_dir: Optional scratch directory (a temporary one is used otherwise)
+        audio_offset: Position in the audio track the video starts at
+
+    Returns:
+        output_path
+    """
+    if not segments:
+        raise ValueError("No segments to render")
+
+    sources = list(dict.fromkeys(path for path, _, _ in segments))
+    infos = dict(zip(sources, probe_videos(sources)))
+    unreadable = [path for path, info in infos.items() if not info]
+    if unreadable:
+        raise RuntimeError(f"Could not probe sources: {unreadable}")
+    if not can_copy_segments(segments):
+        raise ValueError("Segments need re-encoding: mixed stream parameters, starts off "
+                         "keyframes or B-frame sources cut between keyframes")
+
+    # The concat demuxer needs the same stream layout in every cut, so source
+    # audio is only kept when every source has some and no track replaces it.
+    keep_audio = audio_path is None and all(info["has_audio"] for info in infos.values())
+
+    fps = infos[sources[0]].get("fps") or 30
+    frame_counts = segment_frame_counts(segments, fps)
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="scramble_copy_")
+    try:
+        cut_paths = []
+        for index, (video_path, start, end) in enumerate(segments):
+            cut_path = os.path.join(work_dir, f"segment_{index:05d}.mp4")
+            cut_segment_copy(video_path, start, end, cut_path, keep_audio, frame_counts[index])
+            cut_paths.append(cut_path)
+
+        concat_segments(cut_paths, output_path, audio_path, work_dir, audio_offset)
+        return output_path
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
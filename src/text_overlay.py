@@ -0,0 +1,215 @@
+"""
+Text overlays rasterized with PIL.
+
+MoviePy's TextClip shells out to ImageMagick to draw the text, and the
+CompositeVideoClip it is layered with blends the whole frame in float for every
+frame. Here the text and its stroke are rasterized once with Pillow into a
+premultiplied RGBA patch, cached by its parameters, and each frame only has
+the patch's bounding box blended in, with integer uint8 math.
+"""
+
+import math
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+import src.pil_patch  # noqa: F401  (Image.ANTIALIAS for MoviePy resizing)
+
+# Bold sans-serif fonts tried in order; Pillow also searches the system font
+# directories for bare file names
+FONT_CANDIDATES = (
+    "DejaVuSans-Bold.ttf",
+    "Arial Bold.ttf",
+    "arialbd.ttf",
+    "Helvetica.ttc",
+    "LiberationSans-Bold.ttf",
+    "FreeSansBold.ttf",
+)
+
+# Caption width as a fraction of the frame width, as for TextClip(method="caption")
+CAPTION_WIDTH = 0.9
+
+
+@lru_cache(maxsize=32)
+def load_font(size):
+    """Return the first available candidate font at a size, or Pillow's default."""
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _wrap(text, font, max_width):
+    """Break text into lines no wider than max_width, keeping explicit newlines."""
+    if not max_width:
+        return text
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class TextPatch:
+    """
+    Rasterized text as premultiplied RGB plus alpha.
+
+    Attributes:
+        rgb: (h, w, 3) uint8 color already multiplied by alpha
+        alpha: (h, w) uint8 coverage times opacity
+        inverse_alpha: (h, w, 1) uint16 of 255 - alpha, for blending
+    """
+
+    def __init__(self, rgb, alpha):
+        self.rgb = rgb
+        self.alpha = alpha
+        self.inverse_alpha = (255 - alpha.astype(np.uint16))[:, :, None]
+        self.height, self.width = alpha.shape
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def image(self):
+        """Straight-alpha RGBA PIL image of the patch, e.g. for ffmpeg's overlay filter."""
+        alpha = self.alpha.astype(np.float32)[:, :, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            straight = np.where(alpha > 0, self.rgb * 255.0 / alpha, 0)
+        rgba = np.dstack([np.clip(np.rint(straight), 0, 255).astype(np.uint8), self.alpha])
+        return Image.fromarray(rgba, "RGBA")
+
+    def blend(self, frame, x, y):
+        """
+        Blend the patch into a frame in place at (x, y), cropping at the edges.
+
+        Args:
+            frame: (H, W, 3) uint8 array to draw on
+            x: Left edge of the patch in the frame
+            y: Top edge of the patch in the frame
+        """
+        left, top = max(x, 0), max(y, 0)
+        right = min(x + self.width, frame.shape[1])
+        bottom = min(y + self.height, frame.shape[0])
+        if right <= left or bottom <= top:
+            return frame
+        px, py = left - x, top - y
+        rows = slice(py, py + bottom - top)
+        cols = slice(px, px + right - left)
+        region = frame[top:bottom, left:right]
+        # out = text + frame * (255 - alpha) / 255, rounded; never exceeds 255
+        # because text is premultiplied
+        background = (region * self.inverse_alpha[rows, cols] + 127) // 255
+        region[...] = self.rgb[rows, cols] + background.astype(np.uint8)
+        return frame
+
+
+@lru_cache(maxsize=64)
+def render_text_patch(text, font_size=60, color="#FFFFFF", stroke_color="#000000",
+                      stroke_width=2, opacity=1.0, max_width=None):
+    """
+    Rasterize centered, word-wrapped text with a stroke.
+
+    Results are cached by their parameters, so every output of a batch
+    shares one patch.
+
+    Args:
+        text: Text to draw
+        font_size: Font size in pixels
+        color: Fill color (any PIL color string, e.g. "#FFFFFF")
+        stroke_color: Outline color
+        stroke_width: Outline width in pixels (0 for none)
+        opacity: Opacity of the whole text, 0..1
+        max_width: Wrap lines longer than this many pixels, or None
+
+    Returns:
+        TextPatch
+    """
+    font = load_font(int(font_size))
+    stroke_width = int(stroke_width)
+    text = _wrap(text, font, max_width and max_width - 2 * stroke_width)
+
+    measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+    left, top, right, bottom = measure.multiline_textbbox(
+        (0, 0), text, font=font, align="center", stroke_width=stroke_width)
+    # Bounding boxes can be fractional with the default font
+    left, top = math.floor(left), math.floor(top)
+    size = (max(1, math.ceil(right) - left), max(1, math.ceil(bottom) - top))
+    origin = (-left, -top)
+
+    # Coverage of the text with its outline, and of the fill alone
+    outline = Image.new("L", size, 0)
+    ImageDraw.Draw(outline).multiline_text(origin, text, font=font, fill=255, align="center",
+                                           stroke_width=stroke_width, stroke_fill=255)
+    fill = Image.new("L", size, 0)
+    ImageDraw.Draw(fill).multiline_text(origin, text, font=font, fill=255, align="center")
+
+    outline = np.asarray(outline, dtype=np.float32) / 255.0
+    fill = np.minimum(np.asarray(fill, dtype=np.float32) / 255.0, outline)
+    fill_rgb = np.array(ImageColor.getrgb(color)[:3], dtype=np.float32)
+    stroke_rgb = np.array(ImageColor.getrgb(stroke_color)[:3], dtype=np.float32)
+
+    alpha = outline * float(opacity)
+    premultiplied = (fill[:, :, None] * fill_rgb
+                     + (outline - fill)[:, :, None] * stroke_rgb) * float(opacity)
+    alpha = np.rint(alpha * 255.0).astype(np.uint8)
+    rgb = np.minimum(np.rint(premultiplied), alpha[:, :, None]).astype(np.uint8)
+    return TextPatch(rgb, alpha)
+
+
+def text_patch_for(text_overlay, frame_size):
+    """
+    Patch for a text_overlay dict (as built by streamlit_app.py) on frames of a size.
+
+    Args:
+        text_overlay: Dict with "text" and optional "font_size", "color",
+            "stroke_color", "stroke_width" and "opacity"
+        frame_size: (width, height) of the video
+
+    Returns:
+        TextPatch
+    """
+    return render_text_patch(
+        text_overlay["text"],
+        font_size=text_overlay.get("font_size", 60),
+        color=text_overlay.get("color", "#FFFFFF"),
+        stroke_color=text_overlay.get("stroke_color", "#000000"),
+        stroke_width=text_overlay.get("stroke_width", 2),
+        opacity=text_overlay.get("opacity", 1.0),
+        max_width=int(frame_size[0] * CAPTION_WIDTH),
+    )
+
+
+class TextOverlayFilter:
+    """
+    Frame filter (for clip.fl_image) drawing a patch at the frame center.
+
+    The reader may hand back its cached frame, so frames are copied into a
+    buffer owned by the filter before the text is blended in.
+    """
+
+    def __init__(self, patch, frame_size):
+        self.patch = patch
+        self.x = (frame_size[0] - patch.width) // 2
+        self.y = (frame_size[1] - patch.height) // 2
+        self._buffer = None
+
+    def __call__(self, frame):
+        if frame.dtype != np.uint8:
+            frame = np.clip(frame, 0, 255).astype(np.uint8)
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty_like(frame)
+        np.copyto(self._buffer, frame)
+        return self.patch.blend(self._buffer, self.x, self.y)
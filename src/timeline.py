@@ -0,0 +1,242 @@
+"""
+Per-source interestingness timelines.
+
+score_clip_interestingness opens and seeks a clip for every candidate window.
+A SourceTimeline instead decodes the whole source once, sequentially and at low
+resolution, and records per-frame entropy, motion and brightness. Prefix sums
+over those series give the mean of each metric over any window in O(1), so
+any set of candidate windows - including a dense grid - is scored with a few
+array operations. A perceptual hash of every sampled frame is kept as well,
+for near-duplicate detection across sources.
+"""
+
+import time
+import itertools
+import numpy as np
+import cv2
+
+from src.frame_reader import AnalysisFrameReader
+from src.dedupe import dhash
+
+# Default sampling of the analysis decode
+TIMELINE_FPS = 5.0
+TIMELINE_HEIGHT = 72
+
+# Same weights as VideoContentAnalyzer.score_clip_interestingness
+ENTROPY_WEIGHT = 3.0
+MOTION_WEIGHT = 5.0
+BRIGHTNESS_WEIGHT = 2.0
+
+
+def frame_entropy(gray):
+    """Normalized (0..1) histogram entropy of a grayscale frame."""
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    hist = hist / hist.sum()
+    non_zero = hist[hist > 0]
+    return float(-np.sum(non_zero * np.log2(non_zero))) / 8.0
+
+
+class SourceTimeline:
+    """
+    Per-frame metric series of one source with O(1) window means.
+    """
+
+    def __init__(self, fps, entropy, motion, brightness, hashes=None):
+        """
+        Initialize a timeline from per-frame series.
+
+        Args:
+            fps: Sampling rate of the series
+            entropy: Normalized entropy of each sampled frame
+            motion: Mean absolute difference (0..1) to the previous sampled
+                frame; 0 for the first frame
+            brightness: Mean brightness (0..1) of each sampled frame
+            hashes: Optional 64-bit perceptual hash (dHash) of each frame
+        """
+        self.fps = float(fps)
+        self.entropy = np.asarray(entropy, dtype=np.float64)
+        self.motion = np.asarray(motion, dtype=np.float64)
+        self.brightness = np.asarray(brightness, dtype=np.float64)
+        self.hashes = None if hashes is None else np.asarray(hashes, dtype=np.uint64)
+        # False when decoding stopped at a deadline before the end of the source
+        self.complete = True
+        self._entropy_sum = np.concatenate(([0.0], np.cumsum(self.entropy)))
+        self._motion_sum = np.concatenate(([0.0], np.cumsum(self.motion)))
+        self._brightness_sum = np.concatenate(([0.0], np.cumsum(self.brightness)))
+
+    def __len__(self):
+        return len(self.entropy)
+
+    @property
+    def duration(self):
+        return len(self.entropy) / self.fps
+
+    def to_arrays(self):
+        """Arrays for FeatureStore.save()."""
+        arrays = {"entropy": self.entropy, "motion": self.motion, "brightness": self.brightness}
+        if self.hashes is not None:
+            arrays["hashes"] = self.hashes
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, fps, arrays):
+        return cls(fps, arrays["entropy"], arrays["motion"], arrays["brightness"], arrays.get("hashes"))
+
+    @classmethod
+    def concatenate(cls, timelines):
+        """Join timelines of consecutive blocks of one source."""
+        return cls(timelines[0].fps,
+                   np.concatenate([t.entropy for t in timelines]),
+                   np.concatenate([t.motion for t in timelines]),
+                   np.concatenate([t.brightness for t in timelines]),
+                   None if any(t.hashes is None for t in timelines)
+                   else np.concatenate([t.hashes for t in timelines]))
+
+    def slice(self, first, last):
+        """Timeline of the samples first..last-1."""
+        return SourceTimeline(self.fps, self.entropy[first:last], self.motion[first:last],
+                              self.brightness[first:last],
+                              None if self.hashes is None else self.hashes[first:last])
+
+    def _frame_range(self, starts, ends):
+        """First and one-past-last sampled frame inside each window (at least one)."""
+        count = len(self.entropy)
+        first = np.clip(np.ceil(np.asarray(starts) * self.fps - 1e-9).astype(int), 0, max(count - 1, 0))
+        last = np.clip(np.floor(np.asarray(ends) * self.fps + 1e-9).astype(int) + 1, first + 1, count)
+        return first, last
+
+    def window_metrics(self, starts, ends):
+        """
+        Mean entropy, motion and brightness over each window.
+
+        Motion of a window only counts frame differences inside it.
+
+        Returns:
+            (entropy, motion, brightness) arrays, one value per window
+        """
+        first, last = self._frame_range(starts, ends)
+        frames = (last - first).astype(np.float64)
+        entropy = (self._entropy_sum[last] - self._entropy_sum[first]) / frames
+        brightness = (self._brightness_sum[last] - self._brightness_sum[first]) / frames
+        pairs = frames - 1
+        motion_total = self._motion_sum[last] - self._motion_sum[np.minimum(first + 1, last)]
+        motion = np.where(pairs > 0, motion_total / np.maximum(pairs, 1), 0.0)
+        return entropy, motion, brightness
+
+    def window_frames(self, start, end):
+        """Indices of the sampled frames inside a window."""
+        first, last = self._frame_range([start], [end])
+        return np.arange(first[0], last[0])
+
+    def score_windows(self, starts, duration):
+        """
+        Score windows of a fixed length on the same 0-10 scale as
+        score_clip_interestingness.
+
+        Args:
+            starts: Iterable of window start times
+            duration: Window length in seconds
+
+        Returns:
+            Array of scores
+        """
+        starts = np.asarray(list(starts), dtype=np.float64)
+        if len(self.entropy) == 0 or len(starts) == 0:
+            return np.zeros(len(starts))
+        entropy, motion, brightness = self.window_metrics(starts, starts + duration)
+        combined = ENTROPY_WEIGHT * entropy + MOTION_WEIGHT * motion + BRIGHTNESS_WEIGHT * brightness
+        return np.clip(combined * 10, 0, 10)
+
+    def score_window(self, start, end):
+        """Score a single window."""
+        return float(self.score_windows([start], end - start)[0])
+
+
+def build_timeline(frames, fps):
+    """
+    Build a timeline from an iterable of sampled frames.
+
+    Args:
+        frames: Iterable of RGB (HxWx3) or grayscale (HxW) uint8 frames
+        fps: Rate the frames were sampled at
+
+    Returns:
+        SourceTimeline
+    """
+    entropy, motion, brightness, hashes = [], [], [], []
+    previous = None
+    for frame in frames:
+        if frame.ndim == 3:
+            brightness.append(float(np.mean(frame)) / 255.0)
+            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        else:
+            gray = frame
+            brightness.append(float(np.mean(gray)) / 255.0)
+        entropy.append(frame_entropy(gray))
+        hashes.append(dhash(gray))
+        if previous is None:
+            motion.append(0.0)
+        else:
+            motion.append(float(cv2.absdiff(gray, previous).mean()) / 255.0)
+        previous = gray.copy()
+    return SourceTimeline(fps, entropy, motion, brightness, np.array(hashes, dtype=np.uint64))
+
+
+def _until(frames, deadline, state):
+    """Pass frames through until the deadline (a time.time() value) passes."""
+    for frame in frames:
+        if time.time() >= deadline:
+            state["stopped"] = True
+            return
+        yield frame
+
+
+def decode_timeline(video_path, width, height, fps, start=0.0, duration=None, deadline=None,
+                    resources=None):
+    """
+    Decode a source, or one block of it, into a timeline.
+
+    A block starting after 0 also reads the sample before it, so its first
+    motion value continues the previous block and joined blocks match a
+    single full decode.
+
+    Args:
+        video_path: Path to the file to decode
+        width: Analysis frame width
+        height: Analysis frame height
+        fps: Sampling rate
+        start: Block start in seconds
+        duration: Block length in seconds, or None to read to the end
+        deadline: Optional time.time() at which to stop decoding; the
+            timeline then covers a prefix only and has complete=False
+        resources: Optional AnalysisResources limiting open decoders
+
+    Returns:
+        SourceTimeline
+    """
+    lead = 1.0 / fps if start > 0 else 0.0
+    read_duration = None if duration is None else duration + lead
+    with AnalysisFrameReader(video_path, width, height, fps=fps, start=start - lead,
+                             duration=read_duration, resources=resources) as reader:
+        frames = iter(reader)
+        if duration is not None:
+            frames = itertools.islice(frames, int(round((duration + lead) * fps)))
+        state = {"stopped": False}
+        if deadline is not None:
+            frames = _until(frames, deadline, state)
+        timeline = build_timeline(frames, fps)
+    if lead and len(timeline):
+        timeline = timeline.slice(1, len(timeline))
+    timeline.complete = not state["stopped"]
+    return timeline
+
+
+def decode_timeline_block(video_path, width, height, fps, start, duration, deadline=None):
+    """
+    Process-pool entry point: decode one block.
+
+    Returns:
+        (arrays, complete) tuple
+    """
+    timeline = decode_timeline(video_path, width, height, fps, start, duration, deadline)
+    return timeline.to_arrays(), timeline.complete
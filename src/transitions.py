@@ -0,0 +1,124 @@
+"""
+Fused per-clip time remapping and fades.
+
+Chaining fadeout() and speedx() wraps every frame request in two Python
+closures, and the fade multiplies the whole frame in float. fade_speed() does
+both in one wrapper: it maps output time to source time for the speed factor,
+returns frames outside the fade windows untouched, and darkens frames inside
+them with a precomputed uint8 lookup table written into a reused buffer.
+"""
+
+import numpy as np
+
+# Number of distinct fade levels; 256 keeps the LUT error below one intensity step
+FADE_LEVELS = 256
+
+# FADE_LUT[level] maps a pixel value to its value faded to level/(FADE_LEVELS-1),
+# truncated the same way MoviePy truncates float frames when writing them
+FADE_LUT = np.floor(
+    np.outer(np.linspace(0.0, 1.0, FADE_LEVELS), np.arange(256))
+).astype(np.uint8)
+
+
+def fade_factor(t, duration, fade_in=0.0, fade_out=0.0):
+    """
+    Return the brightness factor (0..1) at source time t.
+
+    Args:
+        t: Time in the source clip
+        duration: Duration of the source clip
+        fade_in: Length of the fade from black at the start
+        fade_out: Length of the fade to black at the end
+    """
+    factor = 1.0
+    if fade_in > 0 and t < fade_in:
+        factor = min(factor, max(0.0, t / fade_in))
+    if fade_out > 0 and t > duration - fade_out:
+        factor = min(factor, max(0.0, (duration - t) / fade_out))
+    return factor
+
+
+class _FadeSpeedFilter:
+    """Frame filter applying the speed remap and LUT fade in one call."""
+
+    def __init__(self, duration, speed, fade_in, fade_out):
+        self.duration = duration
+        self.speed = speed
+        self.fade_in = fade_in
+        self.fade_out = fade_out
+        self._buffer = None
+
+    def __call__(self, get_frame, t):
+        source_t = self.speed * t
+        frame = get_frame(source_t)
+        factor = fade_factor(source_t, self.duration, self.fade_in, self.fade_out)
+        if factor >= 1.0:
+            return frame
+        if frame.dtype != np.uint8:
+            return frame * factor
+
+        # The reader may hand back its cached frame, so never fade it in place;
+        # write into a buffer owned by this clip instead.
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty_like(frame)
+        level = int(factor * (FADE_LEVELS - 1))
+        np.take(FADE_LUT[level], frame, out=self._buffer)
+        return self._buffer
+
+
+def _remap_and_fade_mask(mask, duration, speed, fade_in, fade_out):
+    def filter(get_frame, t):
+        source_t = speed * t
+        frame = get_frame(source_t)
+        factor = fade_factor(source_t, duration, fade_in, fade_out)
+        return frame if factor >= 1.0 else frame * factor
+    return mask.fl(filter, apply_to=[])
+
+
+def fade_speed(clip, speed=1.0, fade_in=0.0, fade_out=0.0, crossfade_in=0.0, crossfade_out=0.0):
+    """
+    Change a clip's speed and apply fades with a single frame wrapper.
+
+    Equivalent to fadein(clip, fade_in), fadeout(clip, fade_out) followed by
+    speedx(clip, speed); fade lengths are measured in source time, as they
+    are when the fades are applied before the speed change.
+
+    Args:
+        clip: VideoClip to transform
+        speed: Playback speed factor (>1 is faster)
+        fade_in: Seconds to fade in from black
+        fade_out: Seconds to fade out to black
+        crossfade_in: Seconds over which the clip's mask fades in, so the
+            clip blends over the previous one when concatenated with
+            method="compose" and a negative padding
+        crossfade_out: Seconds over which the clip's mask fades out
+
+    Returns:
+        Transformed clip
+    """
+    duration = clip.duration
+    has_time_change = speed != 1.0
+    if not (has_time_change or fade_in or fade_out or crossfade_in or crossfade_out):
+        return clip
+
+    if has_time_change or fade_in or fade_out:
+        newclip = clip.fl(_FadeSpeedFilter(duration, speed, fade_in, fade_out), apply_to=[])
+    else:
+        newclip = clip.copy()
+
+    if crossfade_in or crossfade_out:
+        if newclip.mask is None:
+            newclip = newclip.add_mask()
+            # add_mask() builds a mask in output time, so no remap is needed
+            newclip.mask = _remap_and_fade_mask(
+                newclip.mask, duration / speed, 1.0, crossfade_in / speed, crossfade_out / speed)
+        else:
+            newclip.mask = _remap_and_fade_mask(clip.mask, duration, speed, crossfade_in, crossfade_out)
+    elif has_time_change and clip.mask is not None:
+        newclip.mask = clip.mask.fl_time(lambda t: speed * t)
+
+    if has_time_change:
+        if clip.audio is not None:
+            newclip.audio = clip.audio.fl_time(lambda t: speed * t).set_duration(duration / speed)
+        newclip = newclip.set_duration(duration / speed)
+    return newclip
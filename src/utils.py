@@ -1,19 +1,31 @@
-import glob
 import random
 from moviepy.editor import VideoFileClip
-from moviepy.video.fx.fadeout import fadeout
-from moviepy.video.fx.speedx import speedx
+from src.probe import probe_video, probe_videos
+from src.padding import LetterboxPadder
+from src.transitions import fade_speed
+from src.library import VIDEO_EXTENSIONS, get_library
 
 def get_video_duration(video_path):
     """
     Get the duration of a video file.
     
+    The duration is read from the container headers and cached on disk, so
+    repeated calls for the same file (even after it is re-uploaded to a new
+    temp path) do not start an ffmpeg reader.
+    
     Args:
         video_path: Path to the video file
         
     Returns:
         float: Duration of the video in seconds
     """
+    try:
+        duration = probe_video(video_path)["duration"]
+        if duration > 0:
+            return duration
+    except Exception as e:
+        print(f"Error probing video headers, decoding instead: {e}")
+    
     try:
         clip = VideoFileClip(video_path)
         duration = clip.duration
@@ -23,108 +35,63 @@ def get_video_duration(video_path):
         print(f"Error getting video duration: {e}")
         return 0
 
-def get_video_files(input_folder):
-    return glob.glob(f"{input_folder}/*.mp4") + glob.glob(f"{input_folder}/*.mov")
-
-def get_random_clip(video_path, duration=4, used_segments=None):
+def get_video_durations(video_paths):
     """
-    Get a random clip from a video file, avoiding previously used segments.
+    Get the durations of several video files, probing cache misses in parallel.
     
     Args:
-        video_path: Path to the video file
-        duration: Desired duration of the clip (in seconds)
-        used_segments: List of (video_path, start_time, end_time) tuples of segments already used
-    
+        video_paths: List of paths to video files
+        
     Returns:
-        A VideoFileClip object with the random segment
+        list: Durations in seconds, in the same order as video_paths
     """
-    clip = VideoFileClip(video_path)
-    
-    # If video is shorter than requested duration, return the whole clip
-    if clip.duration <= duration:
-        return clip.subclip(0, clip.duration)
-    
-    # If no used segments for this video, just pick a random start time
-    if used_segments is None or not any(s[0] == video_path for s in used_segments):
-        start = random.uniform(0, clip.duration - duration)
-        return clip.subclip(start, start + duration)
-    
-    # Get all used segments for this specific video
-    video_used_segments = [(s[1], s[2]) for s in used_segments if s[0] == video_path]
-    
-    # Try to find a non-overlapping segment (max 10 attempts)
-    max_attempts = 10
-    for _ in range(max_attempts):
-        # Pick a random start time
-        start = random.uniform(0, clip.duration - duration)
-        end = start + duration
-        
-        # Check if this segment overlaps with any used segment
-        overlap = False
-        for used_start, used_end in video_used_segments:
-            # Check for overlap: not (end <= used_start or start >= used_end)
-            if not (end <= used_start or start >= used_end):
-                overlap = True
-                break
-        
-        # If no overlap, use this segment
-        if not overlap:
-            return clip.subclip(start, end)
+    infos = probe_videos(video_paths)
+    return [
+        info["duration"] if info and info["duration"] > 0 else get_video_duration(path)
+        for path, info in zip(video_paths, infos)
+    ]
+
+def get_video_files(input_folder, extensions=VIDEO_EXTENSIONS, recursive=False):
+    """
+    List the video files in a folder.
     
-    # If we couldn't find a non-overlapping segment after max attempts,
-    # try to find the segment with the least overlap
-    least_overlap = float('inf')
-    best_start = None
+    The listing comes from a shared, incrementally refreshed VideoLibrary, so
+    repeated calls only re-list directories whose contents changed.
     
-    # Try several random positions
-    for _ in range(20):
-        start = random.uniform(0, clip.duration - duration)
-        end = start + duration
-        
-        # Calculate total overlap with used segments
-        total_overlap = 0
-        for used_start, used_end in video_used_segments:
-            # Calculate overlap duration
-            overlap_start = max(start, used_start)
-            overlap_end = min(end, used_end)
-            if overlap_end > overlap_start:
-                total_overlap += overlap_end - overlap_start
+    Args:
+        input_folder: Folder to list
+        extensions: File extensions counted as videos
+        recursive: Also list videos in subfolders
         
-        # If this has less overlap than our current best, update
-        if total_overlap < least_overlap:
-            least_overlap = total_overlap
-            best_start = start
-    
-    # Use the segment with the least overlap
-    if best_start is not None:
-        return clip.subclip(best_start, best_start + duration)
-    
-    # Fallback: just use a random segment
-    start = random.uniform(0, clip.duration - duration)
-    return clip.subclip(start, start + duration)
+    Returns:
+        list: Sorted video file paths
+    """
+    return get_library(input_folder, extensions, recursive).files()
 
-def pad_clip_to_ratio(clip, target_ratio=(9,16)):
+def pad_clip_to_ratio(clip, target_ratio=(9,16), fill=(0,0,0)):
     """
     Pad a clip to the target aspect ratio (default 9:16).
     
     For any vertical video (height > width), we return it as is without padding.
     Only landscape videos (width > height) receive padding to match the target ratio.
+    
+    Frames are written into one preallocated canvas per clip instead of
+    allocating a new padded frame each time (see src.padding).
+    
+    Args:
+        clip: VideoClip to pad
+        target_ratio: (width, height) aspect ratio to pad to
+        fill: RGB tuple for the bars, or "blur" for a blurred-frame background
     """
     # Check if the video is already vertical (height > width)
     if clip.h >= clip.w:
         # This is a vertical video - don't add any padding
         return clip
     
-    # For landscape videos (width > height), add padding to top and bottom
-    clip_ratio = clip.w / clip.h
-    target_aspect = target_ratio[0] / target_ratio[1]
-    
-    # Calculate the height needed for the target aspect ratio
-    target_height = int(clip.w / target_aspect)
-    
-    # Add padding to top and bottom to reach target height
-    padding = (target_height - clip.h) / 2
-    return clip.margin(top=int(padding), bottom=int(padding), color=(0,0,0))
+    padder = LetterboxPadder(clip.w, clip.h, target_ratio, fill)
+    if not padder.needs_padding:
+        return clip
+    return clip.fl_image(padder)
 
 def prepare_clip_for_concat(clip, add_transitions=True):
     """
@@ -144,12 +111,12 @@ def prepare_clip_for_concat(clip, add_transitions=True):
     
     # Apply a subtle fadeout to the end to prevent static frames
     if add_transitions:
-        # Short fadeout at the end (0.3 seconds)
-        clip = fadeout(clip, 0.3)
-        
         # Add a very slight speed change to create more motion
         # and reduce chances of static frames
         speed_factor = random.uniform(0.95, 1.05)
-        clip = speedx(clip, speed_factor)
+        
+        # Short fadeout at the end (0.3 seconds), fused with the speed change
+        # so each frame goes through a single wrapper
+        clip = fade_speed(clip, speed=speed_factor, fade_out=0.3)
     
     return clip
\ No newline at end of file
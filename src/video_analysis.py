@@ -1,9 +1,60 @@
 import os
 import numpy as np
-import cv2
 from moviepy.editor import VideoFileClip
 import random
-from collections import defaultdict
+import time
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from src.keyframes import get_keyframe_index
+from src.mezzanine import get_mezzanine_cache
+from src.feature_store import FeatureStore, DEFAULT_MAX_BYTES
+from src.probe import get_probe_cache, display_size
+from src.frame_reader import sample_frames, scaled_size
+from src.timeline import (SourceTimeline, decode_timeline, decode_timeline_block, frame_entropy,
+                          TIMELINE_FPS, TIMELINE_HEIGHT)
+from src.plan import derive_seed
+from src.allocator import SegmentAllocator
+from src.shots import detect_shot_boundaries, merge_short_shots
+from src.selection import BatchDiversityState, mmr_select, top_k
+from src.dedupe import PerceptualHashIndex, DEFAULT_MAX_DISTANCE, dhash
+from src.analysis_resources import AnalysisResources, DEFAULT_MAX_READERS, DEFAULT_MAX_FRAME_BYTES
+
+# Frame height windows are scored at; frames come from ffmpeg already scaled
+SCORE_FRAME_HEIGHT = 144
+
+# Version tag of how sample_frames reads frames, stored with the features and
+# window scores computed from them so entries from an older reader are redone
+SAMPLE_READER = "gray8-instants"
+
+# Length of the blocks a source's timeline is split into for parallel decoding
+TIMELINE_BLOCK_DURATION = 60.0
+
+# Frames with less (normalized) entropy than this, e.g. black or flat frames,
+# hash alike regardless of content and are left out of duplicate detection
+MIN_HASH_ENTROPY = 0.3
+
+# Timeline frames kept in the frame hash index (about 5.5 hours of footage at
+# the 5 fps timeline rate); the least recently used sources are dropped beyond
+MAX_HASHED_FRAMES = 100000
+
+
+def _score_windows_in_process(cache_dir, use_mezzanine, max_store_bytes, video_path, positions,
+                              deadline=None):
+    """
+    Process-pool entry point: score windows of one source by seeking.
+    
+    Returns:
+        Scores of the first windows, in order; fewer than positions when
+        the deadline (a time.time() value) passed
+    """
+    analyzer = VideoContentAnalyzer(cache_dir, use_mezzanine, max_store_bytes)
+    scores = []
+    for start, end in positions:
+        if deadline is not None and time.time() >= deadline:
+            break
+        scores.append(analyzer.score_clip_interestingness(video_path, start, end))
+    analyzer.release()
+    return scores
 
 class VideoContentAnalyzer:
     """
@@ -13,24 +64,460 @@ class VideoContentAnalyzer:
     3. Scores clip "interestingness" for better content selection
     """
     
-    def __init__(self, cache_dir=".clip_cache"):
+    def __init__(self, cache_dir=".clip_cache", use_mezzanine=False, max_store_bytes=DEFAULT_MAX_BYTES,
+                 max_readers=DEFAULT_MAX_READERS, max_frame_bytes=DEFAULT_MAX_FRAME_BYTES):
         """
         Initialize the video analyzer.
         
         Args:
             cache_dir: Directory to store processed frame features
+            use_mezzanine: Decode ingested mezzanine proxies instead of the
+                original sources when they exist (see src.mezzanine)
+            max_store_bytes: Size bound of the on-disk feature store
+            max_readers: Maximum number of decoder processes open at once
+            max_frame_bytes: Maximum bytes of features and timelines kept
+                in memory; least recently used entries are dropped beyond it
         """
         self.cache_dir = cache_dir
+        self.use_mezzanine = use_mezzanine
+        self.max_store_bytes = max_store_bytes
         os.makedirs(cache_dir, exist_ok=True)
+        self.mezzanine = get_mezzanine_cache(cache_dir) if use_mezzanine else None
+        
+        # Features, scores and timelines persisted across sessions and processes,
+        # keyed by source content rather than path
+        self.feature_store = FeatureStore(cache_dir, max_bytes=max_store_bytes)
+        
+        # Open decoders and in-memory frame data are bounded (see resource_stats)
+        self.resources = AnalysisResources(max_readers, max_frame_bytes)
         
         # Frame features cache to avoid recomputing for the same clip
-        self.frame_features_cache = {}
+        self.frame_features_cache = self.resources.cache("frame_features")
+        
+        # Mean L2-normalized frame feature per source, for similarity
+        self.mean_features_cache = self.resources.cache("mean_features")
+        
+        # Window scores per source fingerprint: {(start, end): score}, and the
+        # fingerprints whose scores changed since the last flush()
+        self.window_scores = {}
+        self._dirty_scores = set()
+        
+        # Per-frame interestingness timelines per source fingerprint
+        self.timelines = self.resources.cache("timelines")
+        
+        # Perceptual hashes of sampled frames: per source (for duplicate
+        # uploads) and per timeline frame (for duplicate segments). The frame
+        # index is rebuilt from _hashed_frames, {video_path: (hashes, times,
+        # timeline frames)} in LRU order, whenever sources are dropped from it
+        self.source_hash_index = PerceptualHashIndex()
+        self._source_hashes = {}
+        self.frame_hash_index = PerceptualHashIndex()
+        self._hashed_frames = OrderedDict()
+        self.max_hashed_frames = MAX_HASHED_FRAMES
         
         # Track clip similarity scores between clips
         self.similarity_scores = defaultdict(dict)
         
-        # Track clips used in each output video
+        # Track clips used in each output video, and a running summary of
+        # them per batch for the diversity penalty
         self.clips_used_in_videos = defaultdict(list)
+        self.batch_states = defaultdict(BatchDiversityState)
+        
+        # What the last find_best_clips call analyzed (see its budget argument)
+        self.last_run_stats = {}
+    
+    def _open_video(self, video_path):
+        """Open a source for decoding, preferring its mezzanine proxy."""
+        return VideoFileClip(self._decode_path(video_path))
+    
+    def _decode_path(self, video_path):
+        """File actually decoded for a source: its mezzanine proxy if enabled."""
+        if self.mezzanine is not None:
+            return self.mezzanine.resolve(video_path)
+        return video_path
+    
+    def _decode_rate(self, video_path, info):
+        """Frame rate of the file _decode_path returns for a source."""
+        if self.mezzanine is not None and self._decode_path(video_path) != video_path:
+            return self.mezzanine.fps
+        return info.get("fps")
+    
+    def _source_info(self, video_path):
+        """Probe a source; duration falls back to opening it with MoviePy."""
+        info = dict(get_probe_cache(self.cache_dir).probe(video_path))
+        if not info.get("duration"):
+            self.resources.acquire_reader()
+            try:
+                video = self._open_video(video_path)
+                try:
+                    info["duration"] = video.duration
+                    info["width"], info["height"] = video.size
+                finally:
+                    video.close()
+            finally:
+                self.resources.release_reader()
+        return info
+    
+    def _fingerprint(self, video_path):
+        """Content fingerprint of a source, used as the feature store key."""
+        return get_probe_cache(self.cache_dir).fingerprint(video_path)
+    
+    def _load_window_scores(self, fingerprint):
+        scores = self.window_scores.get(fingerprint)
+        if scores is None:
+            scores = {}
+            stored = self.feature_store.load(fingerprint, "window_scores", {"reader": SAMPLE_READER},
+                                             mmap=False)
+            if stored is not None:
+                for start, end, score in stored[0]["windows"]:
+                    scores[(round(start, 3), round(end, 3))] = float(score)
+            self.window_scores[fingerprint] = scores
+        return scores
+    
+    def flush(self):
+        """Persist window scores computed since the last flush."""
+        for fingerprint in self._dirty_scores:
+            scores = self.window_scores.get(fingerprint, {})
+            windows = np.array([(start, end, score) for (start, end), score in scores.items()],
+                               dtype=np.float64).reshape(-1, 3)
+            self.feature_store.save(fingerprint, "window_scores", {"windows": windows},
+                                    {"reader": SAMPLE_READER})
+        self._dirty_scores = set()
+    
+    def release(self):
+        """
+        Per-call cleanup: persist pending scores and drop the in-memory
+        window scores, which are reloaded from the feature store on demand.
+        
+        Decoders are already closed when each read finishes; features and
+        timelines stay cached within the max_frame_bytes budget.
+        """
+        self.flush()
+        self.window_scores = {}
+    
+    def resource_stats(self):
+        """
+        Current resource usage and lifetime counters.
+        
+        Returns:
+            Dict with open_readers, frame_bytes, their limits and peaks,
+            readers_opened/readers_closed, evicted and cached_entries
+        """
+        return self.resources.snapshot()
+    
+    def get_timeline(self, video_path, fps=TIMELINE_FPS, height=TIMELINE_HEIGHT, deadline=None):
+        """
+        Return the interestingness timeline of a source, decoding it once.
+        
+        The whole source is read sequentially at low resolution, so scoring
+        any number of windows afterwards needs no further decoding.
+        
+        Args:
+            video_path: Path to the video file
+            fps: Sampling rate of the timeline
+            height: Decode height in pixels
+            deadline: Optional time.time() at which to stop decoding. A
+                timeline cut short covers a prefix of the source, has
+                complete=False and is not stored; it is returned again
+                only until a later call has time to decode the rest.
+            
+        Returns:
+            A SourceTimeline
+        """
+        fingerprint = self._fingerprint(video_path)
+        cache_key = (fingerprint, fps, height)
+        cached = self.timelines.get(cache_key)
+        if cached is not None and (cached.complete or (deadline is not None and time.time() >= deadline)):
+            return cached
+        
+        stored = self.feature_store.load(fingerprint, "timeline", self._timeline_params(fps, height))
+        if stored is not None:
+            timeline = SourceTimeline.from_arrays(fps, stored[0])
+        else:
+            width, frame_height = scaled_size(*display_size(self._source_info(video_path)), height)
+            timeline = decode_timeline(self._decode_path(video_path), width, frame_height, fps,
+                                       deadline=deadline, resources=self.resources)
+            if not timeline.complete:
+                if cached is not None and len(cached) >= len(timeline):
+                    return cached
+                self.timelines[cache_key] = timeline
+                return timeline
+            self.feature_store.save(fingerprint, "timeline", timeline.to_arrays(),
+                                    self._timeline_params(fps, height))
+        self.timelines[cache_key] = timeline
+        return timeline
+    
+    def has_timeline(self, video_path, fps=TIMELINE_FPS, height=TIMELINE_HEIGHT, allow_partial=False):
+        """Return True if a source's timeline (or a prefix of it) is available without decoding."""
+        fingerprint = self._fingerprint(video_path)
+        cached = self.timelines.get((fingerprint, fps, height))
+        if cached is not None and (cached.complete or allow_partial):
+            return True
+        return self.feature_store.load(fingerprint, "timeline", self._timeline_params(fps, height)) is not None
+    
+    @staticmethod
+    def _timeline_params(fps, height):
+        return {"fps": fps, "height": height, "reader": "gray8", "hashes": 1}
+    
+    def get_timelines(self, video_paths, workers=4, fps=TIMELINE_FPS, height=TIMELINE_HEIGHT,
+                      block_duration=TIMELINE_BLOCK_DURATION, deadline=None):
+        """
+        Build the timelines of several sources in a process pool.
+        
+        Long sources are split into blocks of block_duration seconds that
+        are decoded in parallel and joined in order, so one long upload
+        keeps several cores busy too. Sources that fail are reported and
+        left out of the result.
+        
+        Args:
+            video_paths: Paths to the video files
+            workers: Number of worker processes
+            fps: Sampling rate of the timelines
+            height: Decode height in pixels
+            block_duration: Length of the decode blocks in seconds
+            deadline: Optional time.time() at which to stop decoding; sources
+                cut short get a partial timeline covering the blocks decoded
+                up to their first unfinished one (see get_timeline)
+            
+        Returns:
+            Dict of video_path -> SourceTimeline
+        """
+        timelines = {}
+        pending = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for video_path in video_paths:
+                try:
+                    fingerprint = self._fingerprint(video_path)
+                    params = self._timeline_params(fps, height)
+                    cached = self.timelines.get((fingerprint, fps, height))
+                    if cached is not None and not cached.complete:
+                        cached = None
+                    stored = None if cached else self.feature_store.load(fingerprint, "timeline", params)
+                    if cached or stored is not None:
+                        timelines[video_path] = cached or SourceTimeline.from_arrays(fps, stored[0])
+                        self.timelines[(fingerprint, fps, height)] = timelines[video_path]
+                        continue
+                    info = self._source_info(video_path)
+                    width, frame_height = scaled_size(*display_size(info), height)
+                    starts = np.arange(0, info["duration"], block_duration)
+                    pending[video_path] = [
+                        executor.submit(decode_timeline_block, self._decode_path(video_path),
+                                        width, frame_height, fps, float(start),
+                                        block_duration if i < len(starts) - 1 else None, deadline)
+                        for i, start in enumerate(starts)
+                    ]
+                except Exception as e:
+                    print(f"Error analyzing {video_path}: {str(e)}")
+            
+            if deadline is not None:
+                # Blocks that have not started by the deadline are dropped
+                all_futures = [future for futures in pending.values() for future in futures]
+                wait(all_futures, timeout=max(0.0, deadline - time.time()))
+                for future in all_futures:
+                    future.cancel()
+            
+            for video_path, futures in pending.items():
+                try:
+                    blocks = []
+                    complete = True
+                    for future in futures:
+                        if future.cancelled():
+                            complete = False
+                            break
+                        arrays, block_complete = future.result()
+                        blocks.append(SourceTimeline.from_arrays(fps, arrays))
+                        if not block_complete:
+                            complete = False
+                            break
+                    timeline = SourceTimeline.concatenate(blocks) if blocks else SourceTimeline(fps, [], [], [])
+                    timeline.complete = complete
+                    fingerprint = self._fingerprint(video_path)
+                    if complete:
+                        self.feature_store.save(fingerprint, "timeline", timeline.to_arrays(),
+                                                self._timeline_params(fps, height))
+                    self.timelines[(fingerprint, fps, height)] = timeline
+                    timelines[video_path] = timeline
+                except Exception as e:
+                    print(f"Error analyzing {video_path}: {str(e)}")
+        
+        return timelines
+    
+    def get_shot_boundaries(self, video_path, deadline=None):
+        """
+        Return the hard-cut times of a source.
+        
+        Cuts are detected on the source's timeline and persisted in the
+        feature store next to it.
+        
+        Args:
+            video_path: Path to the video file
+            deadline: Optional decoding deadline (see get_timeline); cuts
+                found on a partial timeline are returned but not stored
+            
+        Returns:
+            Sorted list of cut times in seconds
+        """
+        fingerprint = self._fingerprint(video_path)
+        params = {"timeline": self._timeline_params(TIMELINE_FPS, TIMELINE_HEIGHT)}
+        stored = self.feature_store.load(fingerprint, "shots", params, mmap=False)
+        if stored is not None:
+            return [float(t) for t in stored[0]["boundaries"]]
+        timeline = self.get_timeline(video_path, deadline=deadline)
+        boundaries = detect_shot_boundaries(timeline)
+        if not timeline.complete:
+            return boundaries
+        self.feature_store.save(fingerprint, "shots", {"boundaries": np.array(boundaries, dtype=np.float64)},
+                                params)
+        return boundaries
+    
+    def has_frame_features(self, video_path, num_frames=10):
+        """Return True if a source's frame features are available without decoding."""
+        fingerprint = self._fingerprint(video_path)
+        if f"{fingerprint}_{num_frames}" in self.frame_features_cache:
+            return True
+        params = {"num_frames": num_frames, "size": 32, "reader": SAMPLE_READER}
+        return self.feature_store.load(fingerprint, "frame_features", params) is not None
+    
+    def source_hashes(self, video_path, num_frames=10):
+        """
+        Perceptual hashes of a source's sampled frames, flat frames excluded.
+        
+        Args:
+            video_path: Path to the video file
+            num_frames: Number of sampled frames, as in extract_frame_features
+            
+        Returns:
+            List of 64-bit hashes
+        """
+        hashes = []
+        for feature in self.extract_frame_features(video_path, num_frames):
+            frame = np.asarray(feature).reshape(32, 32)
+            value = dhash(frame)
+            if value and frame.std() > 0.02:
+                hashes.append(value)
+        return hashes
+    
+    def find_duplicate_sources(self, video_paths, max_distance=DEFAULT_MAX_DISTANCE, min_fraction=0.8):
+        """
+        Find sources that are copies of other sources, e.g. re-uploads or
+        re-encodes of the same clip.
+        
+        Sources are compared against each other and against every source
+        checked by this analyzer before, such as the library at ingest.
+        
+        Args:
+            video_paths: Paths to the video files, earliest first
+            max_distance: Hamming distance up to which two frame hashes match
+            min_fraction: Fraction of a source's frames that must match
+                another source for it to count as a copy
+            
+        Returns:
+            Dict mapping each duplicate path to the path it duplicates
+        """
+        duplicates = {}
+        by_fingerprint = {self._fingerprint(path): path for path in self._source_hashes}
+        for video_path in video_paths:
+            try:
+                fingerprint = self._fingerprint(video_path)
+                original = by_fingerprint.get(fingerprint)
+                if original is not None and original != video_path:
+                    duplicates[video_path] = original
+                    continue
+                if video_path in self._source_hashes:
+                    continue
+                hashes = self.source_hashes(video_path)
+                matched = defaultdict(set)
+                for i, value in enumerate(hashes):
+                    for (path, _), _ in self.source_hash_index.query(value, max_distance):
+                        if path != video_path:
+                            matched[path].add(i)
+                best = max(matched.items(), key=lambda item: len(item[1]), default=None)
+                if hashes and best is not None and len(best[1]) >= min_fraction * len(hashes):
+                    duplicates[video_path] = best[0]
+                    continue
+                for i, value in enumerate(hashes):
+                    self.source_hash_index.add(value, (video_path, i))
+                self._source_hashes[video_path] = hashes
+                by_fingerprint[fingerprint] = video_path
+            except Exception as e:
+                print(f"Error analyzing {video_path}: {str(e)}")
+        return duplicates
+    
+    def _index_frame_hashes(self, video_path, deadline=None):
+        """
+        Add a source's (not yet indexed) timeline frame hashes to the frame
+        hash index, dropping the least recently indexed sources once it holds
+        more than max_hashed_frames frames.
+        """
+        timeline = self.get_timeline(video_path, deadline=deadline)
+        indexed = self._hashed_frames.get(video_path)
+        done = indexed[2] if indexed is not None else 0
+        if timeline.hashes is None or len(timeline) <= done:
+            if indexed is not None:
+                self._hashed_frames.move_to_end(video_path)
+            return
+        frames = np.nonzero(timeline.entropy[done:] >= MIN_HASH_ENTROPY)[0] + done
+        hashes = timeline.hashes[frames]
+        times = frames / timeline.fps
+        for value, at in zip(hashes, times):
+            self.frame_hash_index.add(int(value), (video_path, float(at)))
+        if indexed is not None:
+            hashes = np.concatenate([indexed[0], hashes])
+            times = np.concatenate([indexed[1], times])
+        self._hashed_frames[video_path] = (hashes, times, len(timeline))
+        self._hashed_frames.move_to_end(video_path)
+        
+        total = sum(len(entry[0]) for entry in self._hashed_frames.values())
+        if total <= self.max_hashed_frames:
+            return
+        while total > self.max_hashed_frames and len(self._hashed_frames) > 1:
+            _, (dropped, _, _) = self._hashed_frames.popitem(last=False)
+            total -= len(dropped)
+        # The index has no removal; rebuild it from the sources kept
+        self.frame_hash_index = PerceptualHashIndex()
+        for path, (hashes, times, _) in self._hashed_frames.items():
+            for value, at in zip(hashes, times):
+                self.frame_hash_index.add(int(value), (path, float(at)))
+    
+    def duplicate_windows(self, clip, sources, starts, ends, max_distance=DEFAULT_MAX_DISTANCE,
+                          deadline=None):
+        """
+        Find candidate windows in other sources that show the same footage
+        as a clip.
+        
+        A window is a duplicate when it contains a near-identical frame for
+        at least half of the clip's (non-flat) frames. Only sources already
+        in the frame hash index are found.
+        
+        Args:
+            clip: (video_path, start_time, end_time) tuple
+            sources: Array of candidate source paths
+            starts: Array of candidate start times
+            ends: Array of candidate end times
+            max_distance: Hamming distance up to which two frame hashes match
+            deadline: Optional decoding deadline (see get_timeline)
+            
+        Returns:
+            Boolean array, True for duplicate windows
+        """
+        hits = np.zeros(len(sources))
+        timeline = self.get_timeline(clip[0], deadline=deadline)
+        if timeline.hashes is None:
+            return hits > 0
+        frames = [i for i in timeline.window_frames(clip[1], clip[2])
+                  if timeline.entropy[i] >= MIN_HASH_ENTROPY]
+        for i in frames:
+            matched = defaultdict(list)
+            for (path, at), _ in self.frame_hash_index.query(int(timeline.hashes[i]), max_distance):
+                if path != clip[0]:
+                    matched[path].append(at)
+            for path, times in matched.items():
+                rows = np.nonzero(sources == path)[0]
+                times = np.sort(times)
+                inside = (np.searchsorted(times, ends[rows], side="right")
+                          - np.searchsorted(times, starts[rows], side="left"))
+                hits[rows] += inside > 0
+        return (hits >= max(1, len(frames) / 2)) if frames else hits > 0
     
     def extract_frame_features(self, video_path, num_frames=10):
         """
@@ -43,33 +530,32 @@ class VideoContentAnalyzer:
         Returns:
             A list of feature vectors for sampled frames
         """
-        # Check if we've already processed this video
-        cache_key = f"{video_path}_{num_frames}"
+        # Check if we've already processed this video, in this session or before
+        fingerprint = self._fingerprint(video_path)
+        cache_key = f"{fingerprint}_{num_frames}"
         if cache_key in self.frame_features_cache:
             return self.frame_features_cache[cache_key]
         
-        # Open video and get frame features
-        video = VideoFileClip(video_path)
+        params = {"num_frames": num_frames, "size": 32, "reader": SAMPLE_READER}
+        stored = self.feature_store.load(fingerprint, "frame_features", params)
+        if stored is not None:
+            features = list(stored[0]["features"])
+            self.frame_features_cache[cache_key] = features
+            return features
         
-        # Sample frames evenly throughout the video
-        frame_times = np.linspace(0, video.duration, num_frames)
-        features = []
+        # Sample frames evenly throughout the video, decoded by ffmpeg
+        # straight to 32x32 grayscale
+        info = self._source_info(video_path)
+        frames = sample_frames(self._decode_path(video_path), num_frames, 32, 32,
+                               duration=info["duration"],
+                               frame_rate=self._decode_rate(video_path, info),
+                               resources=self.resources)
         
-        for time in frame_times:
-            # Get frame at specified time
-            frame = video.get_frame(time)
-            
-            # Convert frame to grayscale
-            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-            
-            # Resize to a standard size for comparison
-            resized = cv2.resize(gray, (32, 32))
-            
-            # Flatten and normalize
-            flat_features = resized.flatten() / 255.0
-            features.append(flat_features)
+        # Flatten and normalize
+        features = [frame.flatten() / 255.0 for frame in frames]
         
         # Store in cache and return
+        self.feature_store.save(fingerprint, "frame_features", {"features": np.array(features)}, params)
         self.frame_features_cache[cache_key] = features
         return features
     
@@ -112,30 +598,48 @@ class VideoContentAnalyzer:
         
         # For different videos or non-overlapping segments, compare frame features
         # (simplified - in a real implementation, we'd compute features for specific time ranges)
-        clip1_features = self.extract_frame_features(clip1_path)
-        clip2_features = self.extract_frame_features(clip2_path)
-        
-        # Compare feature sets (using a simple average for demonstration)
-        # In a real implementation, we'd use more sophisticated comparison
-        similarity_sum = 0
-        comparisons = 0
-        
-        for f1 in clip1_features:
-            for f2 in clip2_features:
-                # Calculate cosine similarity
-                dot_product = np.dot(f1, f2)
-                norm_f1 = np.linalg.norm(f1)
-                norm_f2 = np.linalg.norm(f2)
-                
-                if norm_f1 > 0 and norm_f2 > 0:
-                    similarity = dot_product / (norm_f1 * norm_f2)
-                    similarity_sum += similarity
-                    comparisons += 1
-        
-        # Return average similarity
-        if comparisons > 0:
-            return similarity_sum / comparisons
-        return 0.0
+        mean1 = self.mean_frame_feature(clip1_path)
+        mean2 = self.mean_frame_feature(clip2_path)
+        
+        # The average cosine similarity over all frame pairs equals the dot
+        # product of the mean L2-normalized feature vectors
+        if mean1 is None or mean2 is None:
+            return 0.0
+        return float(np.dot(mean1, mean2))
+    
+    def normalized_frame_features(self, video_path, num_frames=10):
+        """
+        Return a video's frame features as an L2-normalized matrix.
+        
+        Frames with an all-zero feature vector (pure black) are dropped, as
+        they were skipped by the pairwise comparison.
+        
+        Returns:
+            (frames, features) float array, possibly with zero rows
+        """
+        features = np.asarray(self.extract_frame_features(video_path, num_frames), dtype=np.float64)
+        norms = np.linalg.norm(features, axis=1)
+        keep = norms > 0
+        return features[keep] / norms[keep, None]
+    
+    def mean_frame_feature(self, video_path, num_frames=10):
+        """
+        Return the mean of a video's normalized frame features, or None.
+        """
+        cache_key = f"{self._fingerprint(video_path)}_{num_frames}"
+        if cache_key in self.mean_features_cache:
+            return self.mean_features_cache[cache_key]
+        matrix = self.normalized_frame_features(video_path, num_frames)
+        mean = matrix.mean(axis=0) if len(matrix) else None
+        self.mean_features_cache[cache_key] = mean
+        return mean
+    
+    def _mean_matrix(self, video_paths):
+        rows = []
+        for video_path in video_paths:
+            mean = self.mean_frame_feature(video_path)
+            rows.append(mean if mean is not None else np.zeros(32 * 32))
+        return np.vstack(rows) if rows else np.zeros((0, 32 * 32))
     
     def score_clip_interestingness(self, video_path, start_time, end_time):
         """
@@ -149,12 +653,20 @@ class VideoContentAnalyzer:
         Returns:
             An "interestingness" score from 0-10
         """
-        # Extract features for the specific time range
-        video = VideoFileClip(video_path).subclip(start_time, end_time)
+        fingerprint = self._fingerprint(video_path)
+        scores = self._load_window_scores(fingerprint)
+        window = (round(start_time, 3), round(end_time, 3))
+        if window in scores:
+            return scores[window]
         
-        # Sample frames evenly throughout the clip
+        # Sample frames evenly throughout the clip, decoded by ffmpeg as
+        # small grayscale frames
         num_frames = 5
-        frame_times = np.linspace(0, video.duration, num_frames)
+        info = self._source_info(video_path)
+        width, height = scaled_size(*display_size(info), SCORE_FRAME_HEIGHT)
+        frames = sample_frames(self._decode_path(video_path), num_frames, width, height,
+                               start=start_time, duration=end_time - start_time,
+                               frame_rate=self._decode_rate(video_path, info), resources=self.resources)
         
         # Metrics to evaluate interestingness
         visual_entropy = 0
@@ -162,23 +674,13 @@ class VideoContentAnalyzer:
         brightness_score = 0
         
         prev_frame = None
-        for i, time in enumerate(frame_times):
-            # Get frame at specified time
-            frame = video.get_frame(time)
-            
-            # Calculate brightness (simple average)
-            brightness = np.mean(frame)
+        for gray in frames:
+            # Calculate brightness (simple average of luma)
+            brightness = np.mean(gray)
             brightness_score += brightness / 255.0
             
-            # Convert to grayscale for further analysis
-            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-            
             # Calculate visual entropy (how much information/detail in the frame)
-            hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-            hist = hist / hist.sum()  # Normalize
-            non_zero_hist = hist[hist > 0]
-            entropy = -np.sum(non_zero_hist * np.log2(non_zero_hist))
-            visual_entropy += entropy
+            visual_entropy += frame_entropy(gray)
             
             # Calculate motion if not the first frame (simple difference)
             if prev_frame is not None:
@@ -188,7 +690,7 @@ class VideoContentAnalyzer:
             prev_frame = gray
         
         # Normalize scores
-        visual_entropy = visual_entropy / num_frames / 8.0  # Max entropy is ~8 for 256 bins
+        visual_entropy = visual_entropy / num_frames  # frame_entropy is already 0..1
         brightness_score = brightness_score / num_frames
         if num_frames > 1:
             motion_score = motion_score / (num_frames - 1)
@@ -202,10 +704,73 @@ class VideoContentAnalyzer:
         )
         
         # Scale to 0-10 range
-        return min(10, max(0, combined_score * 10))
+        score = min(10, max(0, combined_score * 10))
+        scores[window] = score
+        self._dirty_scores.add(fingerprint)
+        return score
+    
+    def _analysis_order(self, video_paths):
+        """Sources ordered by analysis cost: already analyzed first, then shortest."""
+        return sorted(video_paths, key=lambda path: (not self.has_timeline(path),
+                                                     self._source_info(path)["duration"]))
+    
+    def _candidate_positions(self, video_path, clip_duration, used_segments, snap_to_keyframes,
+                             rng, grid_step, within_shots=False, deadline=None):
+        """Candidate (start, end) windows of one source that avoid used segments."""
+        duration = self._source_info(video_path)["duration"]
+        
+        # Skip if video is too short
+        if duration <= clip_duration:
+            return []
+        
+        # Try multiple positions in the video
+        latest_start = duration - clip_duration
+        keyframes = get_keyframe_index(video_path, self.cache_dir) if snap_to_keyframes else None
+        boundaries = []
+        if within_shots:
+            boundaries = merge_short_shots(self.get_shot_boundaries(video_path, deadline),
+                                           duration, clip_duration)
+        if boundaries and not grid_step:
+            # Draw starts inside single shots and outside used segments
+            allocator = SegmentAllocator.from_used_segments(video_path, duration, used_segments)
+            allocator.split_at(boundaries)
+            num_positions = min(20, int(duration / clip_duration))
+            return [(float(start), float(end)) for start, end
+                    in allocator.allocate(clip_duration, num_positions, rng, keyframes,
+                                          keyframes_only=keyframes is not None)]
+        if grid_step:
+            starts = list(np.arange(0, latest_start + 1e-9, grid_step))
+        else:
+            num_positions = min(20, int(duration / clip_duration))
+            starts = [rng.uniform(0, latest_start) for _ in range(num_positions)]
+        
+        positions = []
+        for start in starts:
+            if keyframes is not None:
+                start = keyframes.snap_start(start, 0, latest_start)
+            end = start + clip_duration
+            
+            # Check if this segment overlaps with any used segment
+            overlap = False
+            for used_vid, used_start, used_end in used_segments:
+                if used_vid == video_path:
+                    if not (end <= used_start or start >= used_end):
+                        overlap = True
+                        break
+            
+            # Skip grid windows that span a cut
+            if any(start < boundary < end for boundary in boundaries):
+                overlap = True
+            
+            # Snapping can move several draws onto the same keyframe
+            if not overlap and (float(start), float(end)) not in positions:
+                positions.append((float(start), float(end)))
+        return positions
     
     def find_best_clips(self, video_files, num_clips=4, clip_duration=4.0, 
-                        used_segments=None, batch_id=None):
+                        used_segments=None, batch_id=None, snap_to_keyframes=False, rng=None,
+                        use_timeline=True, grid_step=None, workers=None, within_shots=False,
+                        diversity=1.0, avoid_duplicates=True, budget=None):
         """
         Find the best clips for a video based on content analysis.
         
@@ -215,75 +780,225 @@ class VideoContentAnalyzer:
             clip_duration: Duration of each clip
             used_segments: Previously used segments to avoid
             batch_id: ID for the current batch to track usage
+            snap_to_keyframes: Move each probe position onto a keyframe so
+                scoring and later extraction seek without decoding a GOP prefix
+            rng: Optional random.Random instance so callers can reproduce the
+                selection from a seed (defaults to the global one)
+            use_timeline: Score candidates from each source's timeline (one
+                sequential decode) instead of seeking into every window
+            grid_step: Probe every grid_step seconds instead of up to 20
+                random positions; cheap with use_timeline
+            workers: Number of processes to analyze sources with; None or 1
+                analyzes them in this process. Each source draws from its own
+                seed derived from rng, so the result for a given seed does not
+                depend on the worker count.
+            within_shots: Only consider windows inside a single shot, using
+                the source's detected shot boundaries
+            diversity: Weight of the penalty for resembling clips already
+                picked in this call (maximal marginal relevance); 0 keeps
+                the plain top-k by score
+            avoid_duplicates: Skip windows showing the same footage as a clip
+                already used in this batch or picked in this call from
+                another source (needs use_timeline)
+            budget: Optional time limit in seconds. Sources are analyzed
+                cheapest first and the best selection among the candidates
+                scored when the budget runs out is returned; the result then
+                depends on timing. What was covered is recorded in
+                last_run_stats.
             
         Returns:
             A list of (video_path, start_time, end_time, score) tuples
         """
         if used_segments is None:
             used_segments = []
+        rng = rng or random
+        base_seed = rng.getrandbits(63)
+        parallel = workers is not None and workers > 1
+        started = time.time()
+        deadline = started + budget if budget is not None else None
         
-        # Track all candidate clips and their scores
-        candidate_clips = []
+        # Decode the timelines needed for scoring and shot detection up front;
+        # sources that fail here have already been reported
+        analyzable = set(video_files)
+        if parallel and (use_timeline or within_shots):
+            analyzable = set(self.get_timelines(video_files, workers, deadline=deadline))
         
-        # Analyze each video file
-        for video_path in video_files:
+        # Candidate windows per source, each source with its own random stream
+        positions = {}
+        for index, video_path in enumerate(video_files):
+            if video_path not in analyzable:
+                continue
             try:
-                video = VideoFileClip(video_path)
-                
-                # Skip if video is too short
-                if video.duration <= clip_duration:
+                video_rng = random.Random(derive_seed(base_seed, index, video_path))
+                positions[video_path] = self._candidate_positions(
+                    video_path, clip_duration, used_segments, snap_to_keyframes, video_rng, grid_step,
+                    within_shots, deadline)
+            except Exception as e:
+                print(f"Error analyzing {video_path}: {str(e)}")
+        candidates_total = sum(len(found) for found in positions.values())
+        
+        # Score the clips, fanning the decoding out to worker processes. With a
+        # budget, sources are taken cheapest first (already analyzed, then
+        # shortest) and only what is scored when time runs out is used.
+        order = self._analysis_order([path for path, found in positions.items() if found])
+        scores = {}
+        seconds_covered = {}
+        partial = set()
+        if parallel and not use_timeline:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    video_path: executor.submit(_score_windows_in_process, self.cache_dir,
+                                                self.use_mezzanine, self.max_store_bytes,
+                                                video_path, positions[video_path], deadline)
+                    for video_path in order
+                }
+                if deadline is not None:
+                    wait(list(futures.values()), timeout=max(0.0, deadline - time.time()))
+                    for future in futures.values():
+                        future.cancel()
+                for video_path, future in futures.items():
+                    try:
+                        if not future.cancelled():
+                            scores[video_path] = future.result()
+                    except Exception as e:
+                        print(f"Error analyzing {video_path}: {str(e)}")
+        elif use_timeline:
+            for video_path in order:
+                if (deadline is not None and time.time() >= deadline
+                        and not self.has_timeline(video_path, allow_partial=True)):
                     continue
-                
-                # Try multiple positions in the video
-                num_positions = min(20, int(video.duration / clip_duration))
-                
-                for _ in range(num_positions):
-                    # Pick a random start time
-                    start = random.uniform(0, video.duration - clip_duration)
-                    end = start + clip_duration
-                    
-                    # Check if this segment overlaps with any used segment
-                    overlap = False
-                    for used_vid, used_start, used_end in used_segments:
-                        if used_vid == video_path:
-                            if not (end <= used_start or start >= used_end):
-                                overlap = True
-                                break
-                    
-                    if not overlap:
-                        # Score the clip
-                        score = self.score_clip_interestingness(video_path, start, end)
-                        
-                        # Adjust score based on similarity to clips used in this batch
-                        if batch_id is not None:
-                            for used_clip in self.clips_used_in_videos.get(batch_id, []):
-                                used_vid, used_start, used_end = used_clip
-                                similarity = self.calculate_clip_similarity(
-                                    video_path, start, end, used_vid, used_start, used_end)
-                                
-                                # Penalize similar clips
-                                penalty = similarity * 5.0  # Stronger penalty for similar clips
-                                score = max(0, score - penalty)
-                        
-                        candidate_clips.append((video_path, start, end, score))
+                try:
+                    timeline = self.get_timeline(video_path, deadline=deadline)
+                    # A timeline cut short by the budget only scores the windows it covers
+                    if not timeline.complete:
+                        partial.add(video_path)
+                        positions[video_path] = [(start, end) for start, end in positions[video_path]
+                                                 if end <= timeline.duration]
+                    scores[video_path] = timeline.score_windows(
+                        [start for start, _ in positions[video_path]], clip_duration)
+                    seconds_covered[video_path] = timeline.duration
+                except Exception as e:
+                    print(f"Error analyzing {video_path}: {str(e)}")
+        else:
+            # Score one window of every source in turn, so a budget running
+            # out leaves every source with some candidates
+            failed = set()
+            rounds = max((len(positions[path]) for path in order), default=0)
+            for i in range(rounds):
+                if deadline is not None and time.time() >= deadline:
+                    break
+                for video_path in order:
+                    if i >= len(positions[video_path]) or video_path in failed:
+                        continue
+                    if deadline is not None and time.time() >= deadline:
+                        break
+                    try:
+                        start, end = positions[video_path][i]
+                        scores.setdefault(video_path, []).append(
+                            self.score_clip_interestingness(video_path, start, end))
+                    except Exception as e:
+                        print(f"Error analyzing {video_path}: {str(e)}")
+                        failed.add(video_path)
+                        scores.pop(video_path, None)
+        
+        # Keep only the windows that were scored
+        for video_path, found in scores.items():
+            if len(found) < len(positions[video_path]):
+                partial.add(video_path)
+            positions[video_path] = positions[video_path][:len(found)]
+            seconds_covered.setdefault(video_path, len(found) * clip_duration)
+        self.last_run_stats = {
+            "budget": budget,
+            "budget_exhausted": deadline is not None and time.time() >= deadline,
+            "sources": len(video_files),
+            "sources_scored": len(scores),
+            "sources_partial": len(partial),
+            "sources_skipped": len(order) - len(scores),
+            "candidates": candidates_total,
+            "candidates_scored": sum(len(found) for found in scores.values()),
+            "seconds_covered": float(sum(seconds_covered[path] for path in scores)),
+        }
+        
+        # Track all candidate clips, their scores and source features, in input order
+        state = self.batch_states.get(batch_id) if batch_id is not None else None
+        dedupe = avoid_duplicates and use_timeline
+        need_features = diversity > 0 or batch_id is not None or dedupe
+        candidate_clips = []
+        candidate_features = []
+        for video_path in video_files:
+            if video_path not in scores:
+                continue
+            try:
+                video_candidates = [(video_path, start, end, float(score))
+                                    for (start, end), score in zip(positions[video_path], scores[video_path])]
+                if need_features and video_candidates:
+                    if (deadline is not None and time.time() >= deadline
+                            and not self.has_frame_features(video_path)):
+                        # Out of time: rank this source without its diversity penalty
+                        feature = np.zeros(32 * 32)
+                    else:
+                        feature = self._mean_matrix([video_path])[0]
+                    candidate_features.extend([feature] * len(video_candidates))
+                candidate_clips.extend(video_candidates)
             
             except Exception as e:
                 print(f"Error analyzing {video_path}: {str(e)}")
                 continue
         
+        self.release()
+        self.last_run_stats["elapsed"] = time.time() - started
+        if not candidate_clips:
+            return []
+        
+        sources = np.array([c[0] for c in candidate_clips])
+        starts = np.array([c[1] for c in candidate_clips], dtype=np.float64)
+        ends = np.array([c[2] for c in candidate_clips], dtype=np.float64)
+        relevance = np.array([c[3] for c in candidate_clips], dtype=np.float64)
+        features = np.array(candidate_features) if need_features else None
+        
+        # Penalize clips similar to those used in this batch (stronger penalty
+        # for similar clips), from the batch's running feature sum
+        if state is not None and len(state) > 0:
+            relevance = np.maximum(0, relevance - state.penalties(sources, starts, ends, features))
+        candidate_clips = [(vid, start, end, float(score))
+                           for (vid, start, end, _), score in zip(candidate_clips, relevance)]
+        
+        # Drop windows duplicating the batch's clips from other sources
+        conflicts = None
+        if dedupe:
+            used_in_batch = state.clips if state is not None else []
+            for video_path in dict.fromkeys(sources.tolist() + [clip[0] for clip in used_in_batch]):
+                self._index_frame_hashes(video_path, deadline)
+            keep = np.ones(len(candidate_clips), dtype=bool)
+            for clip in used_in_batch:
+                keep &= ~self.duplicate_windows(clip, sources, starts, ends, deadline=deadline)
+            if not keep.all():
+                candidate_clips = [clip for clip, kept in zip(candidate_clips, keep) if kept]
+                sources, starts, ends, relevance = sources[keep], starts[keep], ends[keep], relevance[keep]
+                features = features[keep]
+            conflicts = lambda i: self.duplicate_windows(candidate_clips[i][:3], sources, starts, ends,
+                                                         deadline=deadline)
+        
         # If we don't have enough candidates, try again with less strict criteria
         if len(candidate_clips) < num_clips:
             # Take any unused segments, even with low scores
             return [(vid, start, end, score) for vid, start, end, score 
                    in candidate_clips[:num_clips]]
         
-        # Sort by score and return top clips
-        best_clips = sorted(candidate_clips, key=lambda x: x[3], reverse=True)[:num_clips]
+        # Pick the top clips by score, discounting each by its similarity to
+        # the clips picked before it
+        if need_features:
+            picks = mmr_select(sources, starts, ends, features, relevance, num_clips, diversity,
+                               conflicts=conflicts)
+        else:
+            picks = top_k(relevance, num_clips)
+        best_clips = [candidate_clips[i] for i in picks]
         
         # Record these clips as used in this batch
         if batch_id is not None:
-            self.clips_used_in_videos[batch_id] = [
-                (vid, start, end) for vid, start, end, _ in best_clips
-            ]
+            used = [(vid, start, end) for vid, start, end, _ in best_clips]
+            self.batch_states[batch_id].add_output(used, features[picks])
+            self.clips_used_in_videos[batch_id] = list(self.batch_states[batch_id].clips)
         
-        return best_clips 
\ No newline at end of file
+        self.last_run_stats["elapsed"] = time.time() - started
+        return best_clips
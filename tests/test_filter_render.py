@@ -0,0 +1,85 @@
+import random
+import re
+import subprocess
+
+import pytest
+
+from src.filter_render import compile_plan, render_plan_ffmpeg
+from src.plan import ScramblePlan
+from src.probe import get_ffmpeg_binary
+
+FPS = 30
+
+SOURCES = [
+    {"path": "landscape.mp4", "duration": 6.0, "width": 320, "height": 180},
+    {"path": "portrait.mp4", "duration": 6.0, "width": 180, "height": 320},
+    {"path": "square.mp4", "duration": 6.0, "width": 240, "height": 240},
+]
+
+
+def random_plan(sources, count, length, seed=0, effects=False, **settings):
+    rng = random.Random(seed)
+    segments = []
+    for _ in range(count):
+        source = rng.randrange(len(sources))
+        start = rng.uniform(0, sources[source]["duration"] - length)
+        segment = {"source": source, "start": start, "end": start + length}
+        if effects:
+            segment.update(speed=rng.uniform(0.8, 1.2), fade_in=0.1, fade_out=0.1)
+        segments.append(segment)
+    settings = dict({"fps": FPS, "target_ratio": (9, 16), "pad_fill": (0, 0, 0)}, **settings)
+    return ScramblePlan(seed, sources, segments, settings)
+
+
+def input_count(cmd):
+    return sum(1 for arg in cmd if arg == "-i")
+
+
+def test_each_source_is_one_input():
+    plan = random_plan(SOURCES, 200, 0.1)
+    assert input_count(compile_plan(plan, "out.mp4")) <= len(SOURCES)
+
+
+def test_text_and_audio_add_one_input_each():
+    plan = random_plan(SOURCES, 50, 0.1)
+    plan.text = {"text": "Hello"}
+    plan.audio = {"path": "audio.mp3", "offset": 0.0}
+    cmd = compile_plan(plan, "out.mp4", text_path="text.png", profile="draft")
+    assert input_count(cmd) <= len(SOURCES) + 2
+
+
+@pytest.fixture(scope="module")
+def rendered_sources(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("sources")
+    sources = []
+    for source in SOURCES:
+        path = str(directory / source["path"])
+        subprocess.run(
+            [get_ffmpeg_binary(), "-y", "-v", "error", "-f", "lavfi",
+             "-i", f"testsrc2=size={source['width']}x{source['height']}:rate=25"
+                   f":duration={source['duration']}",
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", path],
+            check=True,
+        )
+        sources.append(dict(source, path=path))
+    return sources
+
+
+def count_frames(path):
+    result = subprocess.run(
+        [get_ffmpeg_binary(), "-i", path, "-map", "0:v", "-f", "null", "-"],
+        capture_output=True, text=True, check=True,
+    )
+    return int(re.findall(r"frame=\s*(\d+)", result.stderr)[-1])
+
+
+@pytest.mark.parametrize("pad_fill, effects, profile", [
+    ((0, 0, 0), False, None),
+    ("blur", True, None),
+    ((0, 0, 0), True, "draft"),
+])
+def test_render_matches_plan_duration(rendered_sources, tmp_path, pad_fill, effects, profile):
+    plan = random_plan(rendered_sources, 24, 0.23, seed=3, effects=effects, pad_fill=pad_fill)
+    output = render_plan_ffmpeg(plan, str(tmp_path / "out.mp4"), profile=profile)
+    fps = 24 if profile == "draft" else FPS
+    assert count_frames(output) == round(plan.duration * fps)
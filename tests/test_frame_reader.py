@@ -0,0 +1,75 @@
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+from moviepy.editor import VideoFileClip
+
+from src.frame_reader import sample_frames
+from src.probe import get_ffmpeg_binary
+
+NUM_FRAMES = 10
+
+# Smallest cosine similarity between a sampled frame and the full-size one
+MIN_FRAME_COSINE = 0.99
+# Largest difference in clip similarity between the two feature sets
+SIMILARITY_TOLERANCE = 0.01
+
+SOURCES = {
+    "pattern": "testsrc2=size=640x360:rate=30:duration=4",
+    "zoom": "mandelbrot=size=360x640:rate=25,trim=duration=4",
+    "grid": "testsrc=size=480x480:rate=24:duration=4",
+}
+
+
+@pytest.fixture(scope="module")
+def sources(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("sources")
+    paths = []
+    for name, graph in SOURCES.items():
+        path = str(directory / f"{name}.mp4")
+        subprocess.run(
+            [get_ffmpeg_binary(), "-y", "-v", "error", "-f", "lavfi", "-i", graph,
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", path],
+            check=True,
+        )
+        paths.append(path)
+    return paths
+
+
+def full_size_features(video_path):
+    """Features as computed from MoviePy frames resized with cv2."""
+    video = VideoFileClip(video_path)
+    try:
+        features = [
+            cv2.resize(cv2.cvtColor(video.get_frame(time), cv2.COLOR_RGB2GRAY), (32, 32)).flatten()
+            for time in np.linspace(0, video.duration, NUM_FRAMES)
+        ]
+        return np.array(features) / 255.0, video.duration, video.fps
+    finally:
+        video.close()
+
+
+def sampled_features(video_path, duration, fps):
+    frames = sample_frames(video_path, NUM_FRAMES, 32, 32, duration=duration, frame_rate=fps)
+    return frames.reshape(NUM_FRAMES, -1) / 255.0
+
+
+def mean_feature(features):
+    return (features / np.linalg.norm(features, axis=1, keepdims=True)).mean(axis=0)
+
+
+def test_sampled_features_approximate_full_size_frames(sources):
+    full, sampled = [], []
+    for path in sources:
+        reference, duration, fps = full_size_features(path)
+        features = sampled_features(path, duration, fps)
+        cosine = (reference * features).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(features, axis=1))
+        assert cosine.min() >= MIN_FRAME_COSINE
+        full.append(mean_feature(reference))
+        sampled.append(mean_feature(features))
+
+    full, sampled = np.array(full), np.array(sampled)
+    difference = np.abs(full @ full.T - sampled @ sampled.T)
+    assert difference.max() <= SIMILARITY_TOLERANCE
@@ -0,0 +1,57 @@
+import re
+import subprocess
+
+import pytest
+
+from src.plan import ScramblePlanner
+from src.probe import get_ffmpeg_binary
+from src.renderer import can_stream_copy, render_plan
+
+FPS = 30
+
+
+def make_source(path, b_frames):
+    """Encode a 6 second test pattern with a keyframe every half second."""
+    subprocess.run(
+        [get_ffmpeg_binary(), "-y", "-v", "error",
+         "-f", "lavfi", "-i", f"testsrc2=size=320x240:rate={FPS}:duration=6",
+         "-f", "lavfi", "-i", "sine=duration=6",
+         "-c:v", "libx264", "-bf", str(b_frames), "-g", "15", "-pix_fmt", "yuv420p",
+         "-c:a", "aac", "-shortest", str(path)],
+        check=True,
+    )
+    return str(path)
+
+
+def count_frames(path):
+    result = subprocess.run(
+        [get_ffmpeg_binary(), "-i", path, "-map", "0:v", "-f", "null", "-"],
+        capture_output=True, text=True, check=True,
+    )
+    return int(re.findall(r"frame=\s*(\d+)", result.stderr)[-1])
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def plan_for(sources):
+    return ScramblePlanner(seed=5).plan(sources, segment_duration=0.7, total_duration=4.0,
+                                        add_transitions=False, target_ratio=None)
+
+
+def test_stream_copy_matches_plan_duration(workdir):
+    sources = [make_source(workdir / f"src{i}.mp4", b_frames=0) for i in range(2)]
+    plan = plan_for(sources)
+    assert can_stream_copy(plan)
+
+    output = render_plan(plan, str(workdir / "out.mp4"))
+
+    assert count_frames(output) == round(plan.duration * FPS)
+
+
+def test_b_frame_sources_are_not_stream_copied(workdir):
+    sources = [make_source(workdir / f"src{i}.mp4", b_frames=2) for i in range(2)]
+    assert not can_stream_copy(plan_for(sources))